@@ -0,0 +1,66 @@
+import asyncio
+import threading
+
+import httpx
+
+from config_manager import config_manager
+
+# Async runtime for the data layer.
+# - get_client(): one pooled httpx.AsyncClient per event loop (keep-alive,
+#   http_max_connections in total), so thousands of concurrent requests share
+#   a bounded set of sockets instead of needing a thread each.
+# - run(coro): run a coroutine from synchronous code on a shared background
+#   loop and wait for it. This is what the sync data.py wrappers use, so
+#   Streamlit / thread-pool callers need no loop of their own.
+#   Never call it from async code: await the coroutine instead.
+
+_loop = None
+_loop_thread = None
+_loop_lock = threading.Lock()
+_clients = {}  # loop -> AsyncClient
+
+
+def _background_loop():
+    global _loop, _loop_thread
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(target=_loop.run_forever, name="aio-loop", daemon=True)
+            _loop_thread.start()
+        return _loop
+
+
+def run(coro, timeout=None):
+    """
+    Run coro on the background loop and return its result (blocking).
+    """
+    loop = _background_loop()
+    if threading.current_thread() is _loop_thread:
+        coro.close()
+        raise RuntimeError("aio.run() called from the background loop; await the coroutine instead")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result(timeout)
+
+
+def get_client():
+    """
+    The running loop's shared AsyncClient (created on first use).
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        max_conn = int(config_manager.get_config().get("http_max_connections", 500))
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_conn, max_keepalive_connections=min(100, max_conn)),
+            follow_redirects=True,
+        )
+        _clients[loop] = client
+    return client
+
+
+async def close_client():
+    """
+    Close the running loop's client (for loops that end, e.g. asyncio.run()).
+    """
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
@@ -0,0 +1,166 @@
+import hashlib
+
+import numpy as np
+
+import cache_codec
+import cache_store
+from config_manager import config_manager
+from poi_collection import CATEGORIES, POICollection, haversine_m
+
+# Amenity accessibility score (0-100) per category, from the POIs and the
+# nearby schools. Deterministic: every amenity contributes
+#   0.5 ** (distance / half_m)
+# (full credit at the door, half at half_m) and a category's score saturates
+# with the sum: 100 * (1 - exp(-sum / saturation)). "overall" is the weighted
+# mean of the categories.
+# score_points() scores many properties against one POI set at once (a
+# properties x POIs distance matrix); score() is the single-property version
+# used by the pipeline, cached per location plus a fingerprint of its inputs
+# (POI set, school distances), so a score computed from other inputs (a 1 km
+# subset, no schools) is never served. Both inputs are fetched per address, so
+# neighbours can't share an entry; the cache saves re-scoring repeat analyses.
+# The result carries the location's geohash cell (amenity_geohash_precision,
+# 7 = ~150 m) for grouping nearby properties.
+
+CACHE_DIR = "analysis_cache"
+SCORE_VERSION = 1  # Bump when the parameters below change (cached scores are keyed by it)
+
+# category -> POI labels (poi_collection.CATEGORIES), half-credit distance (m), saturation, weight
+AMENITIES = {
+    "grocery": (("Grocery",), 800, 2.0, 0.25),
+    "transit": (("Transit",), 400, 3.0, 0.20),
+    "schools": (("Education",), 1200, 2.0, 0.20),
+    "healthcare": (("Health",), 1500, 2.0, 0.15),
+    "parks": (("Park/Leisure",), 600, 2.0, 0.20),
+}
+METERS_PER_MILE = 1609.34
+
+_GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash(lat, lon, precision=7):
+    """
+    Standard base32 geohash of (lat, lon).
+    """
+    lat_lo, lat_hi, lon_lo, lon_hi = -90.0, 90.0, -180.0, 180.0
+    chars, bits, ch, even = [], 0, 0, True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            ch = ch << 1 | (lon >= mid)
+            lon_lo, lon_hi = (mid, lon_hi) if lon >= mid else (lon_lo, mid)
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            ch = ch << 1 | (lat >= mid)
+            lat_lo, lat_hi = (mid, lat_hi) if lat >= mid else (lat_lo, mid)
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_GEOHASH_BASE32[ch])
+            bits, ch = 0, 0
+    return "".join(chars)
+
+
+def _category_columns(pois):
+    """
+    {amenity: boolean mask over the POIs}.
+    """
+    codes = {label: i for i, label in enumerate(CATEGORIES)}
+    return {name: np.isin(pois.cat, [codes[l] for l in labels]) for name, (labels, _, _, _) in AMENITIES.items()}
+
+
+def score_points(lats, lons, pois, extra_distances=None):
+    """
+    Vectorized scores for many properties against one POI set.
+    lats/lons: M property coordinates. extra_distances: {amenity: (M, K)
+    distances in meters} for amenities not in the POIs (e.g. schools from
+    Supabase), inf-padded. Returns {amenity: int array (M,), ..., "overall": ...}
+    plus {"nearest_m": {amenity: (M,) array}} (inf = none found).
+    """
+    lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+    lons = np.atleast_1d(np.asarray(lons, dtype=np.float64))
+    pois = POICollection.coerce(pois)
+    # (M, N) distance matrix, one pass for every category
+    dist = haversine_m(lats[:, None], lons[:, None], pois.lat[None, :], pois.lon[None, :])
+    columns = _category_columns(pois)
+
+    result, nearest = {}, {}
+    overall = np.zeros(len(lats))
+    for name, (_, half_m, saturation, weight) in AMENITIES.items():
+        d = dist[:, columns[name]]
+        extra = (extra_distances or {}).get(name)
+        if extra is not None:
+            d = np.concatenate([d, np.asarray(extra, dtype=np.float64).reshape(len(lats), -1)], axis=1)
+        credit = np.power(0.5, d / half_m).sum(axis=1)  # inf -> 0
+        scores = 100 * (1 - np.exp(-credit / saturation))
+        result[name] = np.rint(scores).astype(int)
+        nearest[name] = d.min(axis=1) if d.shape[1] else np.full(len(lats), np.inf)
+        overall += weight * scores
+    result["overall"] = np.rint(overall / sum(a[3] for a in AMENITIES.values())).astype(int)
+    result["nearest_m"] = nearest
+    return result
+
+
+def _school_distances(schools):
+    miles = [s.get("dist_miles") for s in schools or [] if s.get("dist_miles") is not None]
+    return np.array([miles], dtype=np.float64) * METERS_PER_MILE
+
+
+def _cache_path(lat, lon, pois, school_distances):
+    h = hashlib.md5(f"{float(lat):.6f},{float(lon):.6f}".encode("utf-8"))
+    h.update(pois.fingerprint().encode("utf-8"))
+    h.update(np.round(school_distances).astype(np.int64).tobytes())
+    return cache_codec.cache_file(CACHE_DIR, f"amenity_{SCORE_VERSION}_{h.hexdigest()}")
+
+
+def score(lat, lon, pois, schools=None):
+    """
+    Scores for one property: {"overall": 72, "geohash": "9v6kn3c",
+    "categories": {"grocery": {"score": 80, "nearest_m": 350}, ...}}.
+    nearest_m is None when nothing of that kind was found.
+    Cached per location and inputs (cache_ttl_hours).
+    """
+    config = config_manager.get_config()
+    cell = geohash(float(lat), float(lon), config.get("amenity_geohash_precision", 7))
+    pois = POICollection.coerce(pois, lat, lon)
+    school_distances = _school_distances(schools)
+    path = _cache_path(lat, lon, pois, school_distances)
+    try:
+        cached = cache_store.read(path, max_age=config.get("cache_ttl_hours", 240) * 3600)
+        if cached is not None:
+            return cached
+    except Exception as e:
+        print(f"Cache Read Error (amenity): {e}")
+
+    raw = score_points([lat], [lon], pois, extra_distances={"schools": school_distances})
+    result = {
+        "overall": int(raw["overall"][0]),
+        "geohash": cell,
+        "categories": {
+            name: {
+                "score": int(raw[name][0]),
+                "nearest_m": round(float(raw["nearest_m"][name][0])) if np.isfinite(raw["nearest_m"][name][0]) else None,
+            }
+            for name in AMENITIES
+        },
+    }
+    # Don't pin a location to the score of an empty / failed POI fetch
+    if len(pois):
+        try:
+            cache_store.write(path, result)
+        except Exception as e:
+            print(f"Cache Save Error (amenity): {e}")
+    return result
+
+
+def prompt_text(amenity):
+    """
+    Compact one-line form of score() for the LLM prompt.
+    """
+    if not amenity:
+        return "Not Available"
+    parts = [f"overall {amenity['overall']}"]
+    for name, row in amenity["categories"].items():
+        near = f", nearest {row['nearest_m']} m" if row["nearest_m"] is not None else ", none nearby"
+        parts.append(f"{name} {row['score']}{near}")
+    return "; ".join(parts)
@@ -0,0 +1,166 @@
+import asyncio
+import hmac
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+from fastapi import FastAPI, HTTPException, Header, Query
+from pydantic import BaseModel
+
+import aio
+import data
+import hex_grid
+import pipeline
+import poi_collection
+import secrets_utils
+from config_manager import config_manager
+
+# Headless HTTP API for the analysis pipeline (same core as the Streamlit app).
+#   uvicorn api_service:app --host 0.0.0.0 --port 8000 --workers 2
+# Endpoints: GET /geocode, /poi, /census, /rent, /schools, /amenity, /hexes, POST /analyze, GET /health.
+# Keys come from the environment, or .streamlit/secrets.toml like the app (see
+# secrets_utils; streamlit itself isn't needed). If HOUSMART_API_TOKEN is set,
+# requests need "Authorization: Bearer <token>".
+# Fetchers are awaited natively (data.*_async on pooled httpx clients); the
+# blocking parts (Gemini, Supabase, RentCast's cross-process lock) run on
+# worker threads. At most api_max_concurrency requests are processed at once;
+# others wait up to api_queue_timeout_seconds for a slot, then get a 503.
+
+_slots = None
+_keys = None
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global _slots, _keys
+    _slots = asyncio.Semaphore(int(config_manager.get_config().get("api_max_concurrency", 16)))
+    _keys = pipeline.get_keys()
+    yield
+    await aio.close_client()
+
+
+app = FastAPI(title="HouSmart API", version="1.0", lifespan=lifespan)
+
+
+class AnalyzeRequest(BaseModel):
+    address: str
+    bedrooms: int = pipeline.DEFAULT_SPECS["bedrooms"]
+    bathrooms: float = pipeline.DEFAULT_SPECS["bathrooms"]
+    sqft: int = pipeline.DEFAULT_SPECS["sqft"]
+    property_type: str = pipeline.DEFAULT_SPECS["property_type"]
+    user_prefs: Optional[str] = None
+    weights: Optional[dict] = None
+
+
+def _check_auth(authorization):
+    token = secrets_utils.get_secret("HOUSMART_API_TOKEN")
+    if not token:
+        return
+    supplied = (authorization or "").removeprefix("Bearer ").strip()
+    if not hmac.compare_digest(supplied, token):
+        raise HTTPException(status_code=401, detail="Invalid or missing API token")
+
+
+async def _run(authorization, fn, *args, **kwargs):
+    """
+    Await a pipeline coroutine within the concurrency limit.
+    """
+    _check_auth(authorization)
+    timeout = config_manager.get_config().get("api_queue_timeout_seconds", 10)
+    try:
+        await asyncio.wait_for(_slots.acquire(), timeout=timeout)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Server busy, retry later", headers={"Retry-After": "5"})
+    try:
+        return await fn(*args, **kwargs)
+    finally:
+        _slots.release()
+
+
+@app.get("/health")
+async def health():
+    import circuit_breaker
+    return {"status": "ok", "breakers": {b["provider"]: b["state"] for b in circuit_breaker.all_states()}}
+
+
+@app.get("/geocode")
+async def geocode(address: str, authorization: Optional[str] = Header(None)):
+    lat, lon = await _run(authorization, pipeline.geocode_async, address, _keys)
+    return {"address": address, "lat": lat, "lon": lon}
+
+
+@app.get("/poi")
+async def poi(address: str, lat: Optional[float] = None, lon: Optional[float] = None,
+              radius_m: float = Query(data.POI_RADIUS_M, gt=0), category: Optional[List[str]] = Query(None),
+              limit: Optional[int] = Query(None, gt=0), authorization: Optional[str] = Header(None)):
+    if radius_m > data.poi_fetch_radius():
+        raise HTTPException(status_code=422, detail=f"radius_m is limited to {data.poi_fetch_radius()}")
+    try:
+        poi_collection.category_codes(category or [])
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    pois, lat, lon = await _run(authorization, pipeline.pois_async, address, _keys, lat=lat, lon=lon,
+                                radius_m=radius_m, categories=category, limit=limit)
+    return {"address": address, "lat": lat, "lon": lon, "pois": pois.to_features(), "summary": pois.summary()}
+
+
+@app.get("/census")
+async def census(address: str, authorization: Optional[str] = Header(None)):
+    result = await _run(authorization, pipeline.census_async, address, _keys)
+    if result is None:
+        raise HTTPException(status_code=502, detail="Census data unavailable")
+    return {"address": address, "census_data": result}
+
+
+@app.get("/rent")
+async def rent(address: str,
+               bedrooms: int = pipeline.DEFAULT_SPECS["bedrooms"],
+               bathrooms: float = pipeline.DEFAULT_SPECS["bathrooms"],
+               sqft: int = pipeline.DEFAULT_SPECS["sqft"],
+               property_type: str = pipeline.DEFAULT_SPECS["property_type"],
+               authorization: Optional[str] = Header(None)):
+    result = await _run(authorization, pipeline.rent_async, address, _keys, bedrooms, bathrooms, sqft, property_type)
+    if result is None:
+        raise HTTPException(status_code=502, detail="Rent estimate unavailable")
+    return {"address": address, "rent_data": result}
+
+
+@app.get("/schools")
+async def schools(address: Optional[str] = None, lat: Optional[float] = None, lon: Optional[float] = None,
+                  miles: float = Query(pipeline.SCHOOL_RADIUS_MILES, gt=0, le=25),
+                  authorization: Optional[str] = Header(None)):
+    if lat is None or lon is None:
+        if not address:
+            raise HTTPException(status_code=422, detail="Give an address or lat/lon")
+        lat, lon = await _run(authorization, pipeline.geocode_async, address, _keys)
+    result = await _run(authorization, pipeline.schools_async, lat, lon, _keys, miles=miles)
+    return {"lat": lat, "lon": lon, "schools": result}
+
+
+@app.get("/amenity")
+async def amenity(address: str, lat: Optional[float] = None, lon: Optional[float] = None,
+                  authorization: Optional[str] = Header(None)):
+    result = await _run(authorization, pipeline.amenity_async, address, _keys, lat=lat, lon=lon)
+    return {"address": address, "amenity": result}
+
+
+@app.get("/hexes")
+async def hexes(south: float, west: float, north: float, east: float, resolution: Optional[int] = None,
+                authorization: Optional[str] = Header(None)):
+    if resolution is not None and resolution not in hex_grid.HEX_SIZES:
+        raise HTTPException(status_code=422, detail=f"resolution must be one of {sorted(hex_grid.HEX_SIZES)}")
+    max_cells = config_manager.get_config().get("hex_max_cells", 1500)
+    # Local store only (numpy), off the event loop since the first call loads the files
+    return await _run(authorization, asyncio.to_thread, hex_grid.query, south, west, north, east,
+                      resolution=resolution, max_cells=max_cells)
+
+
+@app.post("/analyze")
+async def analyze(req: AnalyzeRequest, authorization: Optional[str] = Header(None)):
+    result = await _run(
+        authorization, pipeline.run_analysis_async, req.address, _keys,
+        bedrooms=req.bedrooms, bathrooms=req.bathrooms, sqft=req.sqft, property_type=req.property_type,
+        user_prefs=req.user_prefs, weights=req.weights,
+    )
+    result["poi_summary"] = result["pois"].summary()
+    result["pois"] = result["pois"].to_features()
+    return result
@@ -1,22 +1,14 @@
 import streamlit as st
 import re
-import pandas as pd
-import numpy as np
-import plotly.express as px
-import plotly.graph_objects as go
-from streamlit_folium import st_folium
-import folium
-from datetime import datetime, timedelta
-import csv
-import os
+from datetime import datetime
 import time
-import gspread
-from google.oauth2.service_account import Credentials
+# Heavy/optional deps (gspread, google.oauth2, folium, plotly, pandas) are imported
+# where they are used so every rerun / cold worker doesn't pay for them up front.
 import auth # Custom Auth Module
 import supabase_utils
-import data # Geocoding & Data Service
 import map_service as map # Map Service
 import llm # LLM Service
+import pipeline # Analysis pipeline (shared with api_service.py)
 import config_manager as app_config
 import email_utils # Email Utils
 import viz_utils # Visualization Utils
@@ -31,6 +23,9 @@ if "GEMINI_API_KEY" in st.secrets:
 else:
     st.error("Missing GEMINI_API_KEY in secrets. Analysis will fail.")
 
+# Deliver mail left in the queue by a previous process (no-op if already running)
+email_utils.start_delivery_worker()
+
 # Session State for Button Management
 if "processing" not in st.session_state:
     st.session_state.processing = False
@@ -52,6 +47,8 @@ def connect_to_gsheet():
     try:
         if "gcp_service_account" not in st.secrets:
             return None
+        import gspread
+        from google.oauth2.service_account import Credentials
         scope = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
         creds = Credentials.from_service_account_info(st.secrets["gcp_service_account"], scopes=scope)
         client = gspread.authorize(creds)
@@ -66,38 +63,6 @@ def connect_to_gsheet():
         print(f"GSheet Connect Error: {e}")
         return None
 
-# Helper: Get Daily Usage
-def get_daily_usage(email):
-    if not email: return 0
-    count = 0
-    now = datetime.now()
-    cutoff = now - timedelta(hours=24)
-    email_clean = email.strip().lower()
-    
-    log_file = os.path.join("logs", "usage_logs.csv")
-    if not os.path.exists(log_file): return 0
-    
-    try:
-        with open(log_file, mode='r', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            # Skip header if exists, but we can just parse lines carefully
-            # Schema usually: Timestamp, Email, ...
-            for row in reader:
-                if len(row) < 2: continue
-                ts_str, row_email = row[0], row[1]
-                # Check if this row matches user email
-                if row_email.strip().lower() == email_clean:
-                    try:
-                        # Try parsing timestamp
-                        ts = datetime.strptime(ts_str, "%Y-%m-%d %H:%M:%S")
-                        if ts > cutoff: count += 1
-                    except: pass
-    except Exception as e:
-        print(f"Error reading logs: {e}")
-        
-    return count
-
-
 # CSS Injection
 st.markdown("""
 <style>
@@ -269,7 +234,7 @@ with col1:
         
         # Display Usage Count (Works for both)
         if final_user_email:
-            usage_count = get_daily_usage(final_user_email)
+            usage_count = pipeline.get_daily_usage(final_user_email)
             # Move up by 10px
             limit_count = app_config.get_config().get("daily_limit_count", 3)
             st.markdown(f"<div style='margin-top: -10px; font-size: 0.8rem; color: #5F6368;'>Free Trial in past 24h: {usage_count}/{limit_count}</div>", unsafe_allow_html=True)
@@ -308,7 +273,7 @@ with col1:
         whitelist = app_config_data.get("whitelist_emails", [])
         
         current_email = st.session_state.google_user.get("email") if st.session_state.google_user else st.session_state.get("user_email_input", "")
-        usage = get_daily_usage(current_email) if current_email else 0
+        usage = pipeline.get_daily_usage(current_email) if current_email else 0
         
         # Determine strict limit reached
         limit_reached = False
@@ -396,75 +361,39 @@ if st.session_state.processing:
             user_prefs_text = supabase_utils.get_user_preferences(current_email)
             
         # --- DATA FETCHING ---
-        geo_key = st.secrets.get("GEOAPIFY_API_KEY")
-        rentcast_key = st.secrets.get("RENTCAST_API_KEY")
-        
-        # API Counters
-        count_geoapify = 0
-        count_rentcast = 0
-        count_census = 0
-        count_gemini = 0
-        
-        # 1. Geocode
-        addr_to_geocode = st.session_state.get("address_input", "123 Market St, San Francisco, CA")
-        lat, lon = data.get_coordinates(addr_to_geocode, geo_key)
-        count_geoapify += 1 # Geocoding Call
-        st.session_state.map_center = (lat, lon)
-        
-        # 2. POIS (Optimized: Pass lat/lon)
-        pois, _, _ = data.get_poi(addr_to_geocode, geo_key, lat=lat, lon=lon)
-        count_geoapify += 1 # POI Call
-        st.session_state.poi_data = pois # Persist
-        
-        # 3. Census
-        census_data = data.get_census_data(addr_to_geocode, geo_key=geo_key)
-        if census_data: # If None, call failed or disabled
-             count_census += 2 # 1 Geocode + 1 Data
-        st.session_state.census_data = census_data # Persist
-        
-        # 4. RentCast
-        # Get user inputs for specs
+        # Same pipeline as the HTTP API (pipeline.py / api_service.py)
+        addr_to_geocode = st.session_state.get("address_input", pipeline.DEFAULT_ADDRESS)
         u_bed = st.session_state.get("input_bed", 2)
         u_bath = st.session_state.get("input_bath", 2)
         u_sqft = st.session_state.get("input_sqft", 1200)
         u_prop = st.session_state.get("input_property_type", "Single Family")
-        
-        rent_data = data.get_rentcast_data(addr_to_geocode, u_bed, u_bath, u_sqft, u_prop, rentcast_key)
-        if rent_data:
-            count_rentcast += 1
-        st.session_state.rent_data = rent_data
-
 
-        # 4.1 RentCast Value AVM - DISABLED PER REQUEST
-        # value_data = data.get_rentcast_value(addr_to_geocode, u_bed, u_bath, u_sqft, u_prop, rentcast_key)
-        # if value_data:
-        #      count_rentcast += 1
-        st.session_state.rent_value_data = None # value_data
-        
-        # 4b. Schools (Supabase) [NEW]
-        sp_url = st.secrets.get("SUPABASE_URL")
-        sp_key = st.secrets.get("SUPABASE_KEY")
-        schools_data = []
-        if sp_url and sp_key:
-             schools_data = data.get_nearby_schools_data(lat, lon, sp_url, sp_key, miles=3.0)
-        st.session_state.schools = schools_data
-        
-        # 5. LLM Analysis
-        # Get Weights (just defaults for now or from config if enabled)
-        weights = {"cashflow": 50, "appreciation": 50} 
-        
-        llm_result = llm.analyze_location(
-            addr_to_geocode, 
-            pois, 
-            census_data, 
-            weights=weights,
+        result = pipeline.run_analysis(
+            addr_to_geocode,
+            pipeline.get_keys(),
+            bedrooms=u_bed,
+            bathrooms=u_bath,
+            sqft=u_sqft,
+            property_type=u_prop,
             user_prefs=user_prefs_text,
-            rent_data=rent_data
         )
-        # Check if actually called (not disabled message)
-        if "AI Analysis is currently disabled" not in str(llm_result.get("highlights", [])):
-             count_gemini += 1
-             
+        lat, lon = result["lat"], result["lon"]
+        llm_result = result["llm_result"]
+
+        # API Counters
+        count_geoapify = result["api_calls"]["geoapify"]
+        count_rentcast = result["api_calls"]["rentcast"]
+        count_census = result["api_calls"]["census"]
+        count_gemini = result["api_calls"]["gemini"]
+
+        # Persist
+        st.session_state.map_center = (lat, lon)
+        st.session_state.poi_data = result["pois"]
+        st.session_state.census_data = result["census_data"]
+        st.session_state.rent_data = result["rent_data"]
+        st.session_state.rent_value_data = None # RentCast Value AVM - DISABLED PER REQUEST
+        st.session_state.schools = result["schools"]
+        st.session_state.amenity = result["amenity"]
         st.session_state.llm_result = llm_result
             
             # --- DATA INTEGRATION COMPLETE ---
@@ -523,19 +452,7 @@ if st.session_state.processing:
                 ])
             
             # 2. Local CSV Logging (Critical for Daily Limit)
-            log_dir = "logs"
-            if not os.path.exists(log_dir):
-                os.makedirs(log_dir)
-            
-            log_file = os.path.join(log_dir, "usage_logs.csv")
-            
-            # Data for local log (Timestamp, Email, Address) - Minimal needed for limit
-            # Ensuring TS and Email are first two cols as expected by get_daily_usage
-            local_row = [ts, final_email, addr]
-            
-            with open(log_file, "a", newline="", encoding="utf-8") as f:
-                writer = csv.writer(f)
-                writer.writerow(local_row)
+            pipeline.log_usage(ts, final_email, addr, u_bed, u_bath, u_sqft, u_prop)
                 
         except Exception as e:
             print(f"Logging Error: {e}")
@@ -565,27 +482,26 @@ if st.session_state.processing:
             # Rent Table
             rent_table_html = viz_utils.generate_rent_table(rent_result)
             
-            # Charts
+            # Charts -> Images (cached per census data)
+            # kaleido: PNG rendered in one batch, svg: lightweight renderer without a browser
             # Note: We pass address_input to help guess state if needed
-            charts_dict = viz_utils.generate_census_charts(census_result, address_input=addr)
-            
-            # Convert Charts to Images for Email
             email_images = {}
             chart_html_block = ""
             
-            if charts_dict:
+            if census_result and "metrics" in census_result:
                 cid_inc = "chart_income"
                 cid_age = "chart_age"
                 cid_race = "chart_race"
                 cid_edu = "chart_edu"
                 
-                # Helper to convert to bytes
                 # We need kaleido or similar installed.
                 try:
-                    email_images[cid_inc] = charts_dict["income"].to_image(format="png", width=600, height=300)
-                    email_images[cid_age] = charts_dict["age"].to_image(format="png", width=600, height=300)
-                    email_images[cid_race] = charts_dict["race"].to_image(format="png", width=600, height=300)
-                    email_images[cid_edu] = charts_dict["education"].to_image(format="png", width=600, height=300)
+                    chart_renderer = app_config.get_config().get("email_chart_renderer", "kaleido")
+                    chart_pngs = viz_utils.get_chart_images(census_result, address_input=addr, width=600, height=300, renderer=chart_renderer)
+                    email_images[cid_inc] = chart_pngs["income"]
+                    email_images[cid_age] = chart_pngs["age"]
+                    email_images[cid_race] = chart_pngs["race"]
+                    email_images[cid_edu] = chart_pngs["education"]
                     
                     chart_html_block = f"""
                     <h4>Demographics</h4>
@@ -620,10 +536,11 @@ if st.session_state.processing:
             <p><small>Generated by HouSmart Antigravity Engine.</small></p>
             """
             
-            success, msg = email_utils.send_analysis_email(current_email, subject, html_content, images=email_images)
+            # Queued: delivery happens on the background worker, not in this rerun
+            success, msg = email_utils.queue_analysis_email(current_email, subject, html_content, images=email_images)
             
             if success:
-                st.success("报告已发送！请检查您的收件箱 (包括垃圾邮件文件夹)。")
+                st.success("报告正在发送中！请稍后检查您的收件箱 (包括垃圾邮件文件夹)。")
             else:
                 st.error(f"Failed to send email: {msg}")
                 
@@ -918,6 +835,10 @@ with col2:
                     st.subheader("AI Insight Summary")
         
                 llm_res = st.session_state.get("llm_result") or {}
+                cache_meta = llm_res.get("_cache_meta") or {}
+                if cache_meta.get("stale"):
+                    with c_head:
+                        st.caption(f"Cached analysis from {cache_meta.get('timestamp')} · refreshing in the background")
                 score = llm_res.get("score", 0)
                 highlights = llm_res.get("highlights", [])
                 risks = llm_res.get("risks", [])
@@ -1025,8 +946,6 @@ with col3:
         else:
             center_lat, center_lon = 37.7749, -122.4194
             
-        m = folium.Map(location=[center_lat, center_lon], zoom_start=14, prefer_canvas=True)
-        
         # DEBUG: Show POI Data
         with st.expander("Debug Map Data"):
             try:
@@ -1042,10 +961,10 @@ with col3:
                 
                 if val is None:
                     st.info("ℹ️ No POI data found. Please click 'Start Analysis' to fetch data.")
-                elif isinstance(val, list):
+                elif hasattr(val, "summary"):
                     st.markdown(f"**Count:** {len(val)}")
                     if len(val) > 0:
-                        st.json(val[0])
+                        st.json(val.summary())
                     else:
                         st.warning("List is empty.")
                 else:
@@ -1054,20 +973,14 @@ with col3:
             except Exception as e:
                 st.error(f"Debug Error: {e}")
 
-        # 1. Target Property (Red Star)
-        folium.Marker(
-            [center_lat, center_lon],
-            popup="Target Property\n123 Market St",
-            icon=folium.Icon(color="red", icon="star", prefix='fa')
-        ).add_to(m)
-        
-        # Use map module to generate map with real POIs
+        # Use map module to generate map with real POIs (includes the Target Property pin)
         pois_to_map = st.session_state.get("poi_data", [])
-        # Overwrite m with the robust map from map.py
         m, legend_items = map.generate_map(center_lat, center_lon, pois_to_map)
 
         # Render Map
-        st_folium(m, height=500, use_container_width=True)
+        from streamlit_folium import st_folium
+        # Stable key + no returned objects: panning/zooming doesn't trigger a rerun
+        st_folium(m, height=500, use_container_width=True, key="poi_map", returned_objects=[])
 
 # Card F: Legend (Dynamic based on Map)
     with st.container(border=True):
@@ -1108,6 +1021,15 @@ with col3:
         legend_html += '</div>'
         st.markdown(legend_html, unsafe_allow_html=True)
 
+    # Card F2: Amenity Access (amenity_score, 0-100 per category)
+    amenity = st.session_state.get("amenity")
+    if amenity:
+        with st.container(border=True):
+            st.subheader(f"Amenity Access: {amenity['overall']}/100")
+            for name, row in amenity["categories"].items():
+                near = f"nearest {row['nearest_m']:,} m" if row["nearest_m"] is not None else "none nearby"
+                st.progress(row["score"] / 100, text=f"{name.title()}: {row['score']} ({near})")
+
     # Card G: Nearby Schools [NEW]
     with st.container(border=True):
         st.subheader("Nearby Schools (3 Mile Radius)")
@@ -1,7 +1,5 @@
 import streamlit as st
 import os
-import google_auth_oauthlib.flow
-from googleapiclient.discovery import build
 
 # Constants
 SCOPES = [
@@ -17,7 +15,9 @@ def get_flow():
     if "GOOGLE_OAUTH" not in st.secrets:
         st.error("Missing [GOOGLE_OAUTH] configuration in secrets.toml")
         return None
-        
+
+    import google_auth_oauthlib.flow
+
     client_config = {
         "web": {
             "client_id": st.secrets["GOOGLE_OAUTH"]["client_id"],
@@ -87,6 +87,7 @@ def handle_callback():
         credentials = flow.credentials
         
         # Get User Info
+        from googleapiclient.discovery import build
         service = build("oauth2", "v2", credentials=credentials)
         user_info = service.userinfo().get().execute()
         
@@ -0,0 +1,476 @@
+import os
+import sys
+import json
+import math
+import time
+import types
+import random
+import shutil
+import hashlib
+import argparse
+import tempfile
+import contextlib
+import threading
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+# Load test: N concurrent virtual users (VUs) running full analyses against
+# local mock providers, for capacity planning.
+# Each VU does what one Streamlit session does per analysis: daily-limit check
+# (usage CSV scan), pipeline.run_analysis, usage log append. Geoapify / Census /
+# FCC / RentCast are served by a local HTTP server (real sockets through the
+# pooled httpx client), Gemini and Supabase are faked in-process with latency.
+# Caches, locks and the usage log live in a temp dir, so nothing real is touched.
+#
+# Reports throughput, latency percentiles, per-step times and where VUs spent
+# time blocked: time.sleep by caller (e.g. llm.call_with_rotation's rate
+# limiting), file locks, single-flight waits.
+#
+# Usage:
+#   python bench_load.py --users 20 --duration 60
+#   python bench_load.py --users 50 --iterations 3 --latency 0.2 --gemini-latency 2
+#   python bench_load.py --mode app --users 5 --iterations 1   # drive app.py via Streamlit's AppTest
+
+_real_sleep = time.sleep
+MOCK_PLACES = 120  # Per category group and location
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+# --- Mock providers --------------------------------------------------------
+
+def _seed(text):
+    return int(hashlib.md5(str(text).encode("utf-8")).hexdigest()[:8], 16)
+
+
+def _coords(text):
+    rnd = random.Random(_seed(text))
+    return 30.0 + rnd.uniform(-0.5, 0.5), -97.7 + rnd.uniform(-0.5, 0.5)
+
+
+class _MockHandler(BaseHTTPRequestHandler):
+    latency = 0.05
+    error_rate = 0.0
+    stats = {"requests": 0, "errors": 0}
+    stats_lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body):
+        raw = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        q = {k: v[0] for k, v in parse_qs(url.query).items()}
+        host = self.headers.get("Host", "")
+        _real_sleep(self.latency * random.uniform(0.5, 1.5))
+        with self.stats_lock:
+            self.stats["requests"] += 1
+            failed = random.random() < self.error_rate
+            self.stats["errors"] += failed
+        if failed:
+            return self._send(503, {"error": "mock outage"})
+
+        if "geoapify" in host and "geocode" in url.path:
+            lat, lon = _coords(q.get("text"))
+            return self._send(200, {"features": [{"geometry": {"coordinates": [lon, lat]}}]})
+        if "geoapify" in host and "places" in url.path:
+            # MOCK_PLACES POIs per category group within the circle, paged by limit / offset
+            lon, lat, radius = (float(v) for v in q["filter"].split(":")[1].split(",")[:3])
+            group = q["categories"].split(",")[0]
+            rnd = random.Random(_seed(q["filter"] + group))
+            spots = sorted((rnd.uniform(0, radius), rnd.uniform(0, 6.283)) for _ in range(MOCK_PLACES))
+            offset, limit = int(q.get("offset", 0)), int(q.get("limit", 20))
+            features = []
+            for i, (dist, bearing) in enumerate(spots[offset:offset + limit], offset):
+                dlat = dist * math.cos(bearing) / 111320
+                dlon = dist * math.sin(bearing) / (111320 * math.cos(math.radians(lat)))
+                features.append({"properties": {"name": f"{group.title()} {i}", "categories": [f"{group}.mock"],
+                                                "place_id": f"{group}-{i}", "lat": lat + dlat, "lon": lon + dlon,
+                                                "distance": round(dist)}})
+            return self._send(200, {"features": features})
+        if "geocoding.geo.census.gov" in host:
+            seed = _seed(q.get("address"))
+            return self._send(200, {"result": {"addressMatches": [{"geographies": {"Census Block Groups": [
+                {"STATE": "48", "COUNTY": f"{seed % 500:03d}", "TRACT": f"{seed % 999999:06d}", "BLKGRP": str(seed % 9 + 1)}
+            ]}}]}})
+        if "geo.fcc.gov" in host:
+            seed = _seed(q.get("latitude"))
+            return self._send(200, {"Block": {"FIPS": f"48{seed % 500:03d}{seed % 999999:06d}1001"}})
+        if "api.census.gov" in host:
+            # One row per matched geography; wildcards expand to a few tracts / block groups
+            names = q["get"].split(",")
+            level, value = q["for"].split(":")
+            within = dict(part.split(":") for part in q.get("in", "").split(" ") if part)
+            if level != "block group":
+                geos, geo_cols = [[value]], [level]
+            else:
+                tracts = [within["tract"]] if within["tract"] != "*" else [f"{i:06d}" for i in range(100, 104)]
+                bgs = [value] if value != "*" else ["1", "2", "3"]
+                geos = [[within["state"], within["county"], t, bg] for t in tracts for bg in bgs]
+                geo_cols = ["state", "county", "tract", "block group"]
+            rows = [names + geo_cols]
+            for geo in geos:
+                rnd = random.Random(_seed(url.path + q["get"] + "".join(geo)))  # Vintages differ
+                rows.append(["Mock"] + [str(rnd.randint(10, 90000)) for _ in names[1:]] + geo)
+            return self._send(200, rows)
+        if "rentcast" in host and "rent" in url.path:
+            return self._send(200, {"rent": 1800, "rentRangeLow": 1600, "rentRangeHigh": 2000, "comparables": []})
+        if "rentcast" in host:
+            return self._send(200, {"price": 350000, "priceRangeLow": 320000, "priceRangeHigh": 380000})
+        return self._send(404, {"error": f"no mock for {host}{url.path}"})
+
+
+def start_mock_server(latency, error_rate):
+    _MockHandler.latency = latency
+    _MockHandler.error_rate = error_rate
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _MockHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-providers", daemon=True).start()
+    return server
+
+
+class _FakeGenAI:
+    """
+    Stand-in for google.generativeai: canned JSON after `latency` seconds.
+    """
+    def __init__(self, latency):
+        self.latency = latency
+
+    def configure(self, api_key=None):
+        pass
+
+    def GenerativeModel(self, *args, **kwargs):
+        latency = self.latency
+
+        class _Model:
+            def generate_content(self, prompt):
+                _real_sleep(latency * random.uniform(0.7, 1.3))
+                return types.SimpleNamespace(text=json.dumps({
+                    "location_tier": "Class B", "tenant_profile": "Young professionals",
+                    "highlights": ["Mock highlight"], "risks": ["Mock risk"], "score": 70,
+                    "investment_strategy": "Mock verdict",
+                }))
+        return _Model()
+
+
+def _fake_supabase(latency):
+    class _Rpc:
+        def execute(self):
+            _real_sleep(latency * random.uniform(0.5, 1.5))
+            return types.SimpleNamespace(data=[{"name": "Mock Elementary", "rating": 7}])
+
+    module = types.ModuleType("supabase")
+    module.create_client = lambda url, key: types.SimpleNamespace(rpc=lambda name, params: _Rpc())
+    return module
+
+
+# --- Wait accounting -------------------------------------------------------
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.waits = {}   # site -> [count, seconds]
+        self.phases = {}  # name -> [seconds]
+
+    def wait(self, site, seconds):
+        with self.lock:
+            entry = self.waits.setdefault(site, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def phase(self, name, seconds):
+        with self.lock:
+            self.phases.setdefault(name, []).append(seconds)
+
+    @contextlib.contextmanager
+    def timed(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phase(name, time.perf_counter() - start)
+
+
+def instrument(rec, mock_port, cache_dir, gemini_latency, supabase_latency):
+    """
+    Point the app modules at the mocks / temp dir and hook the blocking points.
+    """
+    import httpx
+    import aio
+    import llm
+    import data
+    import locks
+    import pipeline
+    import singleflight
+
+    # Providers: same pooled client settings as aio, but every request goes to the mock server
+    class _RedirectTransport(httpx.AsyncHTTPTransport):
+        async def handle_async_request(self, request):
+            request.url = request.url.copy_with(scheme="http", host="127.0.0.1", port=mock_port)
+            return await super().handle_async_request(request)
+
+    clients = {}
+
+    def get_client():
+        import asyncio
+        loop = asyncio.get_running_loop()
+        if loop not in clients:
+            from config_manager import config_manager
+            max_conn = int(config_manager.get_config().get("http_max_connections", 500))
+            limits = httpx.Limits(max_connections=max_conn, max_keepalive_connections=min(100, max_conn))
+            clients[loop] = httpx.AsyncClient(transport=_RedirectTransport(limits=limits))
+        return clients[loop]
+
+    aio.get_client = get_client
+    llm._genai = lambda: _FakeGenAI(gemini_latency)
+    llm.configure_genai(["mock-key"])
+    sys.modules["supabase"] = _fake_supabase(supabase_latency)
+    data._supabase_client.cache_clear()
+
+    # Isolated caches: every module with its own CACHE_DIR, so nothing is
+    # served from (or written to) the real analysis_cache/
+    import viz_utils
+    import cache_admin
+    import census_trends
+    import amenity_score
+    for module in (data, llm, amenity_score, census_trends, viz_utils, cache_admin):
+        module.CACHE_DIR = cache_dir
+    locks.LOCK_DIR = os.path.join(cache_dir, "locks")
+
+    # time.sleep, by calling function, on threads doing request work (VUs,
+    # to_thread workers, the aio loop). Mock latency uses _real_sleep.
+    def sleep(seconds):
+        if not threading.current_thread().name.startswith(("vu-", "asyncio_", "aio-loop")):
+            return _real_sleep(seconds)
+        caller = sys._getframe(1)
+        site = f"sleep {caller.f_globals.get('__name__', '?')}.{caller.f_code.co_name}"
+        start = time.perf_counter()
+        _real_sleep(seconds)
+        rec.wait(site, time.perf_counter() - start)
+    time.sleep = sleep
+
+    # Cross-process file locks (cache writes, RentCast single-flight)
+    real_file_lock = locks.file_lock
+
+    @contextlib.contextmanager
+    def file_lock(name, timeout=60, poll=0.05, lock_dir=None):
+        start = time.perf_counter()
+        with real_file_lock(name, timeout=timeout, poll=poll, lock_dir=os.path.join(cache_dir, "locks")) as acquired:
+            rec.wait("locks.file_lock (acquire)", time.perf_counter() - start)
+            yield acquired
+    locks.file_lock = file_lock
+
+    # Threads waiting on another thread's in-flight call
+    class _TimedEvent(threading.Event):
+        def wait(self, timeout=None):
+            start = time.perf_counter()
+            try:
+                return super().wait(timeout)
+            finally:
+                rec.wait("singleflight (follower wait)", time.perf_counter() - start)
+
+    real_init = singleflight._Call.__init__
+
+    def call_init(self):
+        real_init(self)
+        self.done = _TimedEvent()
+    singleflight._Call.__init__ = call_init
+
+    # Per-step times inside run_analysis_async
+    def timed_async(name, fn):
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                rec.phase(f"step {name}", time.perf_counter() - start)
+        return wrapper
+
+    for step in ("geocode", "pois", "census", "rent", "schools"):
+        setattr(pipeline, f"{step}_async", timed_async(step, getattr(pipeline, f"{step}_async")))
+
+    real_score = amenity_score.score
+
+    def score(*args, **kwargs):
+        with rec.timed("step amenity"):
+            return real_score(*args, **kwargs)
+    amenity_score.score = score
+
+    real_analyze = llm.analyze_location
+
+    def analyze_location(*args, **kwargs):
+        with rec.timed("step llm"):
+            return real_analyze(*args, **kwargs)
+    llm.analyze_location = analyze_location
+
+
+def seed_usage_log(path, rows, users):
+    """
+    Pre-fill the usage log so the daily-limit scan has realistic work to do.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    now = datetime.now()
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(rows):
+            ts = (now - timedelta(minutes=i % 4000)).strftime("%Y-%m-%d %H:%M:%S")
+            f.write(f"{ts},user{i % (users * 10)}@example.com,{i} Seed St,2,2,1200,Single Family\n")
+
+
+# --- Virtual users ---------------------------------------------------------
+
+def pipeline_session(rec, vu, address, usage_log):
+    import pipeline
+
+    email = f"vu{vu}@example.com"
+    keys = {"geoapify": "mock", "rentcast": "mock", "supabase_url": "http://mock", "supabase_key": "mock", "gemini": True}
+    with rec.timed("usage check (CSV scan)"):
+        pipeline.get_daily_usage(email, log_file=usage_log)
+    with rec.timed("run_analysis"):
+        result = pipeline.run_analysis(address, keys)
+    with rec.timed("usage log append"):
+        pipeline.log_usage(datetime.now().strftime("%Y-%m-%d %H:%M:%S"), email, address, 2, 2, 1200, "Single Family",
+                           log_file=usage_log)
+    if "Error generating analysis" in result["llm_result"].get("highlights", []):
+        raise RuntimeError(result["llm_result"].get("risks"))
+
+
+def app_session(rec, vu, address, usage_log):
+    """
+    One Streamlit session through the script runner (needs streamlit installed).
+    app.py reads the real usage log path, so the CSV scan there is not isolated.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file("app.py", default_timeout=300)
+    for key in ("GEMINI_API_KEY", "GEOAPIFY_API_KEY", "RENTCAST_API_KEY"):
+        at.secrets[key] = "mock"
+    with rec.timed("app first render"):
+        at.run()
+    at.text_input(key="user_email_input").set_value(f"vu{vu}@example.com")
+    at.text_input(key="address_input").set_value(address)
+    with rec.timed("app input rerun"):
+        at.run()
+    button = next(b for b in at.button if b.label.startswith("Start Analysis"))
+    with rec.timed("app analysis rerun"):
+        button.click().run()
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+
+
+def run(users=10, duration=30.0, iterations=None, addresses=200, latency=0.05, error_rate=0.0,
+        gemini_latency=1.0, think=0.0, log_rows=20000, mode="pipeline", keep=False, verbose=False):
+    workdir = tempfile.mkdtemp(prefix="housmart_load_")
+    cache_dir = os.path.join(workdir, "analysis_cache")
+    usage_log = os.path.join(workdir, "logs", "usage_logs.csv")
+    seed_usage_log(usage_log, log_rows, users)
+
+    rec = Recorder()
+    server = start_mock_server(latency, error_rate)
+    instrument(rec, server.server_address[1], cache_dir, gemini_latency, latency)
+    session = app_session if mode == "app" else pipeline_session
+    pool = [f"{100 + i} Load Test Ave, Austin, TX" for i in range(addresses)]
+
+    latencies, errors = [], []
+    results_lock = threading.Lock()
+    deadline = time.time() + duration
+
+    def vu_loop(vu):
+        n = 0
+        while (n < iterations) if iterations else (time.time() < deadline):
+            start = time.perf_counter()
+            try:
+                session(rec, vu, random.choice(pool), usage_log)
+                with results_lock:
+                    latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                with results_lock:
+                    errors.append(f"{type(e).__name__}: {e}")
+            n += 1
+            if think:
+                _real_sleep(random.expovariate(1 / think))
+
+    # The app's debug prints would drown the report
+    quiet = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    with quiet:
+        started = time.perf_counter()
+        threads = [threading.Thread(target=vu_loop, args=(i,), name=f"vu-{i}") for i in range(users)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - started
+    server.shutdown()
+
+    report = format_report(rec, latencies, errors, wall, users, mode, latency, gemini_latency)
+    if keep:
+        report += f"\n\nWork dir kept: {workdir}"
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+def format_report(rec, latencies, errors, wall, users, mode, latency, gemini_latency):
+    done = len(latencies)
+    lines = [f"== Load test: {users} users, {mode} mode, provider latency {latency * 1000:.0f} ms, "
+             f"Gemini {gemini_latency:.1f}s =="]
+    lines.append(f"  Completed: {done} analyses, {len(errors)} errors in {wall:.1f}s "
+                 f"-> {done / wall:.2f} analyses/s, mock provider requests {_MockHandler.stats['requests']}")
+    if latencies:
+        lines.append("  Latency (s): " + "  ".join(
+            f"p{p} {_percentile(latencies, p):.2f}" for p in (50, 90, 99)) + f"  max {max(latencies):.2f}")
+
+    lines.append("\n  Phases              count    mean s    p90 s")
+    for name, values in sorted(rec.phases.items(), key=lambda kv: -sum(kv[1])):
+        lines.append(f"  {name:<26} {len(values):>6} {sum(values) / len(values):>9.3f} {_percentile(values, 90):>8.3f}")
+
+    vu_seconds = users * wall
+    lines.append(f"\n  Blocked time ({vu_seconds:.0f} VU-seconds total)")
+    lines.append(f"  {'site':<48} {'count':>6} {'total s':>9} {'share':>7}")
+    for site, (count, seconds) in sorted(rec.waits.items(), key=lambda kv: -kv[1][1]):
+        lines.append(f"  {site:<48} {count:>6} {seconds:>9.2f} {seconds / vu_seconds:>7.1%}")
+
+    if errors:
+        lines.append("\n  First errors:")
+        for e in sorted(set(errors))[:5]:
+            lines.append(f"    {e[:160]}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent-session load test against mock providers.")
+    parser.add_argument("--users", type=int, default=10, help="Concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run (ignored with --iterations)")
+    parser.add_argument("--iterations", type=int, help="Analyses per user instead of a fixed duration")
+    parser.add_argument("--addresses", type=int, default=200, help="Address pool size (smaller = more cache hits)")
+    parser.add_argument("--latency", type=float, default=0.05, help="Mock provider latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of mock provider calls that 503")
+    parser.add_argument("--gemini-latency", type=float, default=1.0, help="Mock Gemini latency in seconds")
+    parser.add_argument("--think", type=float, default=0.0, help="Mean think time between a user's analyses")
+    parser.add_argument("--log-rows", type=int, default=20000, help="Rows pre-seeded into the usage log")
+    parser.add_argument("--mode", choices=["pipeline", "app"], default="pipeline")
+    parser.add_argument("--keep", action="store_true", help="Keep the temp cache / log dir")
+    parser.add_argument("--verbose", action="store_true", help="Show the app's own output")
+    parser.add_argument("--out", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    report = run(users=args.users, duration=args.duration, iterations=args.iterations, addresses=args.addresses,
+                 latency=args.latency, error_rate=args.error_rate, gemini_latency=args.gemini_latency,
+                 think=args.think, log_rows=args.log_rows, mode=args.mode, keep=args.keep,
+                 verbose=args.verbose)
+    print(report)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
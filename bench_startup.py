@@ -0,0 +1,94 @@
+import os
+import re
+import sys
+import argparse
+import subprocess
+
+# Import-time profiling for a cold worker.
+# Runs `python -X importtime` in a fresh interpreter (nothing cached in sys.modules)
+# and reports the slowest imports, so regressions in the startup path are visible.
+#
+# Usage:
+#   python bench_startup.py               # app modules (what app.py imports on every run)
+#   python bench_startup.py --deps        # also time the heavy deps we import lazily
+#   python bench_startup.py --out bench_output.txt
+
+APP_MODULES = [
+    "config_manager", "auth", "supabase_utils", "data", "map_service",
+    "llm", "pipeline", "email_utils", "viz_utils",
+]
+
+# Deferred to first use. Listed so the report shows what a cold worker saves.
+LAZY_DEPS = [
+    "streamlit", "pandas", "numpy", "plotly.express", "plotly.graph_objects", "folium",
+    "streamlit_folium", "gspread", "google.oauth2.service_account", "google.generativeai",
+    "supabase", "email_validator", "google_auth_oauthlib.flow", "googleapiclient.discovery",
+]
+
+LINE_RE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def profile_imports(modules):
+    """
+    Import `modules` in a fresh interpreter with -X importtime.
+    Returns (rows, error) where rows = [(module, self_us, cumulative_us, depth)].
+    """
+    code = "\n".join(f"import {m}" for m in modules)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        match = LINE_RE.match(line)
+        if match:
+            self_us, cum_us, indent, name = match.groups()
+            rows.append((name, int(self_us), int(cum_us), len(indent) // 2))
+    error = proc.stderr.strip().splitlines()[-1] if proc.returncode != 0 else None
+    return rows, error
+
+
+def format_report(title, rows, error=None, top=15):
+    lines = [f"== {title} =="]
+    if error:
+        lines.append(f"  FAILED: {error}")
+    top_level = [r for r in rows if r[3] == 0]
+    total_ms = sum(r[2] for r in top_level) / 1000
+    lines.append(f"  Total import time: {total_ms:.1f} ms ({len(rows)} modules)")
+    lines.append(f"  {'cumulative ms':>14} {'self ms':>9}  module")
+    for name, self_us, cum_us, _ in sorted(top_level, key=lambda r: r[2], reverse=True)[:top]:
+        lines.append(f"  {cum_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name}")
+    return "\n".join(lines)
+
+
+def run(include_deps=False, top=15):
+    sections = []
+    rows, error = profile_imports(APP_MODULES)
+    sections.append(format_report("App modules (cold start)", rows, error, top))
+
+    if include_deps:
+        dep_lines = ["== Lazily imported dependencies (cost avoided at startup) =="]
+        for dep in LAZY_DEPS:
+            dep_rows, dep_error = profile_imports([dep])
+            if dep_error:
+                dep_lines.append(f"  {'n/a':>14}  {dep} ({dep_error})")
+                continue
+            total = sum(r[2] for r in dep_rows if r[3] == 0) / 1000
+            dep_lines.append(f"  {total:>11.1f} ms  {dep}")
+        sections.append("\n".join(dep_lines))
+
+    return "\n\n".join(sections)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import-time profile of the HouSmart startup path.")
+    parser.add_argument("--deps", action="store_true", help="Also profile each lazily imported dependency")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--out", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    report = run(include_deps=args.deps, top=args.top)
+    print(report)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
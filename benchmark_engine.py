@@ -0,0 +1,344 @@
+import os
+import csv
+import json
+import time
+import sqlite3
+import argparse
+import requests
+from functools import lru_cache
+
+# Local ACS Benchmark Store (Tract / County / Metro)
+# state_data.py only covers State + National. This module precomputes the same
+# income/age/race/education distributions for smaller geographies into a SQLite
+# file so a lookup at analysis time is a single indexed read (no Census calls).
+# A variable chunk that still fails after FETCH_RETRIES aborts the build rather
+# than storing geographies with half their variables missing. Lookups are
+# cached per DB mtime, so a store built (or rebuilt) by the CLI while the app is
+# running is picked up without a restart.
+
+ACS_YEAR = 2022
+ACS_BASE_URL = f"https://api.census.gov/data/{ACS_YEAR}/acs/acs5"
+STORE_DIR = "acs_store"
+BENCHMARK_DB = os.path.join(STORE_DIR, "benchmarks.sqlite")
+FETCH_RETRIES = 3
+
+# Narrowest -> Widest. This is also the order the extra bars appear in charts.
+SCOPE_LEVELS = ["tract", "county", "metro"]
+
+METRO_GEO = "metropolitan statistical area/micropolitan statistical area"
+
+# Variables needed to rebuild the state_data.py style distributions
+BENCHMARK_VARIABLES = (
+    ["B19013_001E", "B01001_001E", "B02001_002E", "B02001_003E", "B02001_005E", "B03003_003E", "B15003_001E"]
+    + [f"B19001_{i:03d}E" for i in range(1, 18)]
+    + [f"B15003_{i:03d}E" for i in range(17, 26)]
+    + [f"B01001_{i:03d}E" for i in list(range(3, 26)) + list(range(27, 50))]
+)
+
+# Age buckets: [Under 18, 18-24, 25-44, 45-64, Above 64] as (Male range, Female range)
+AGE_BUCKETS = [
+    (range(3, 7), range(27, 31)),
+    (range(7, 11), range(31, 35)),
+    (range(11, 15), range(35, 39)),
+    (range(15, 20), range(39, 44)),
+    (range(20, 26), range(44, 50)),
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS benchmarks (
+    level TEXT NOT NULL,
+    geoid TEXT NOT NULL,
+    name TEXT,
+    income REAL,
+    income_dist TEXT,
+    age TEXT,
+    race TEXT,
+    edu TEXT,
+    vintage INTEGER,
+    PRIMARY KEY (level, geoid)
+);
+CREATE TABLE IF NOT EXISTS county_cbsa (
+    county_geoid TEXT PRIMARY KEY,
+    cbsa TEXT NOT NULL
+);
+"""
+
+
+def _pct(part, total):
+    return round(part / total * 100, 1) if total else 0.0
+
+
+def summarize_acs_row(vals):
+    """
+    Convert raw ACS counts into the same shapes used by state_data.py.
+    Returns dict with income, income_dist, age, race, edu.
+    """
+    def v(code):
+        x = vals.get(code)
+        return x if isinstance(x, (int, float)) and x >= 0 else 0  # negatives are ACS missing markers
+
+    total_hh = v("B19001_001E")
+    income_dist = [
+        _pct(sum(v(f"B19001_{i:03d}E") for i in range(2, 11)), total_hh),
+        _pct(sum(v(f"B19001_{i:03d}E") for i in range(11, 16)), total_hh),
+        _pct(sum(v(f"B19001_{i:03d}E") for i in range(16, 18)), total_hh),
+    ]
+
+    total_pop = v("B01001_001E")
+    age = [
+        _pct(sum(v(f"B01001_{i:03d}E") for i in m) + sum(v(f"B01001_{i:03d}E") for i in f), total_pop)
+        for m, f in AGE_BUCKETS
+    ]
+
+    # [White, Hispanic, Black, Asian, Other]
+    white, black, asian, hisp = v("B02001_002E"), v("B02001_003E"), v("B02001_005E"), v("B03003_003E")
+    other = max(0, total_pop - (white + black + asian + hisp))
+    race = [_pct(white, total_pop), _pct(hisp, total_pop), _pct(black, total_pop), _pct(asian, total_pop), _pct(other, total_pop)]
+
+    # Cumulative like EDUCATION_DATA: [HS+, Bachelors+, Advanced+]
+    total_25 = v("B15003_001E")
+    edu = [
+        _pct(sum(v(f"B15003_{i:03d}E") for i in range(17, 26)), total_25),
+        _pct(sum(v(f"B15003_{i:03d}E") for i in range(22, 26)), total_25),
+        _pct(sum(v(f"B15003_{i:03d}E") for i in range(23, 26)), total_25),
+    ]
+
+    return {
+        "income": v("B19013_001E") or None,
+        "income_dist": income_dist,
+        "age": age,
+        "race": race,
+        "edu": edu,
+    }
+
+
+def fetch_acs_rows(geo_for, geo_in=None, chunk_size=20):
+    """
+    Fetch BENCHMARK_VARIABLES for every geography matched by a wildcard query.
+    Returns { geo_key_tuple: {"NAME": ..., code: value, ...} }.
+    Raises RuntimeError if a chunk still fails after FETCH_RETRIES attempts.
+    """
+    rows_by_geo = {}
+    for i in range(0, len(BENCHMARK_VARIABLES), chunk_size):
+        chunk = BENCHMARK_VARIABLES[i:i + chunk_size]
+        params = {"get": "NAME," + ",".join(chunk), "for": geo_for}
+        if geo_in:
+            params["in"] = geo_in
+
+        for attempt in range(FETCH_RETRIES):
+            try:
+                r = requests.get(ACS_BASE_URL, params=params, timeout=60)
+                if r.status_code == 200:
+                    break
+                error = f"{r.status_code} - {r.text[:200]}"
+            except requests.RequestException as e:
+                error = str(e)
+            print(f"Benchmark ACS Fetch Failed ({geo_for}, attempt {attempt + 1}/{FETCH_RETRIES}): {error}")
+            if attempt + 1 < FETCH_RETRIES:
+                time.sleep(2 ** attempt)
+        else:
+            raise RuntimeError(f"ACS fetch for {geo_for} ({geo_in or 'national'}) failed, variables {chunk[0]}..{chunk[-1]}: {error}")
+
+        rows = r.json()
+        headers = rows[0]
+        geo_cols = [h for h in headers if h != "NAME" and h not in chunk]
+        for row in rows[1:]:
+            rec = dict(zip(headers, row))
+            geo_key = tuple(rec[c] for c in geo_cols)
+            entry = rows_by_geo.setdefault(geo_key, {"NAME": rec.get("NAME")})
+            for code in chunk:
+                try:
+                    entry[code] = float(rec[code]) if rec[code] not in (None, "") else None
+                except ValueError:
+                    entry[code] = None
+    return rows_by_geo
+
+
+def _connect(path=BENCHMARK_DB):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _write_rows(conn, level, rows_by_geo):
+    records = []
+    for geo_key, vals in rows_by_geo.items():
+        s = summarize_acs_row(vals)
+        records.append((
+            level, "".join(geo_key), vals.get("NAME"), s["income"],
+            json.dumps(s["income_dist"]), json.dumps(s["age"]), json.dumps(s["race"]), json.dumps(s["edu"]),
+            ACS_YEAR
+        ))
+    conn.executemany("INSERT OR REPLACE INTO benchmarks VALUES (?,?,?,?,?,?,?,?,?)", records)
+    conn.commit()
+    return len(records)
+
+
+def build_store(state_fips_list, levels=SCOPE_LEVELS, path=BENCHMARK_DB):
+    """
+    Precompute benchmarks for the given states. Tract/County use one wildcard
+    query per state, Metro is one national query.
+    """
+    conn = _connect(path)
+    counts = {}
+    try:
+        for state in state_fips_list:
+            state = str(state).zfill(2)
+            if "county" in levels:
+                counts["county"] = counts.get("county", 0) + _write_rows(conn, "county", fetch_acs_rows("county:*", f"state:{state}"))
+            if "tract" in levels:
+                counts["tract"] = counts.get("tract", 0) + _write_rows(conn, "tract", fetch_acs_rows("tract:*", f"state:{state}"))
+        if "metro" in levels:
+            counts["metro"] = _write_rows(conn, "metro", fetch_acs_rows(f"{METRO_GEO}:*"))
+    finally:
+        conn.close()
+
+    _benchmark_at.cache_clear()
+    _county_cbsa_at.cache_clear()
+    return counts
+
+
+def load_cbsa_delineation(csv_path, path=BENCHMARK_DB):
+    """
+    Load the OMB CBSA delineation file (exported as CSV) to map County -> Metro.
+    Expects columns: 'CBSA Code', 'FIPS State Code', 'FIPS County Code'.
+    """
+    conn = _connect(path)
+    try:
+        with open(csv_path, newline="", encoding="utf-8-sig") as f:
+            records = []
+            for row in csv.DictReader(f):
+                cbsa = (row.get("CBSA Code") or "").strip()
+                st_code = (row.get("FIPS State Code") or "").strip()
+                co_code = (row.get("FIPS County Code") or "").strip()
+                if cbsa and st_code and co_code:
+                    records.append((st_code.zfill(2) + co_code.zfill(3), cbsa))
+        conn.executemany("INSERT OR REPLACE INTO county_cbsa VALUES (?,?)", records)
+        conn.commit()
+    finally:
+        conn.close()
+
+    _county_cbsa_at.cache_clear()
+    return len(records)
+
+
+def _read_only(path=BENCHMARK_DB):
+    if not os.path.exists(path):
+        return None
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+
+def _db_version(path=BENCHMARK_DB):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def get_benchmark(level, geoid):
+    """
+    Indexed lookup of a precomputed benchmark. Returns dict or None.
+    """
+    version = _db_version()
+    if version is None:
+        return None  # No store yet; not cached, so a later build is seen
+    return _benchmark_at(level, geoid, version)
+
+
+@lru_cache(maxsize=4096)
+def _benchmark_at(level, geoid, version):
+    conn = _read_only()
+    if conn is None:
+        return None
+    try:
+        row = conn.execute(
+            "SELECT name, income, income_dist, age, race, edu FROM benchmarks WHERE level=? AND geoid=?",
+            (level, geoid)
+        ).fetchone()
+    except sqlite3.Error as e:
+        print(f"Benchmark Store Read Error: {e}")
+        return None
+    finally:
+        conn.close()
+
+    if not row:
+        return None
+    name, income, income_dist, age, race, edu = row
+    return {
+        "name": name,
+        "income": income,
+        "income_dist": json.loads(income_dist),
+        "age": json.loads(age),
+        "race": json.loads(race),
+        "edu": json.loads(edu),
+    }
+
+
+def get_county_cbsa(county_geoid):
+    version = _db_version()
+    if version is None:
+        return None
+    return _county_cbsa_at(county_geoid, version)
+
+
+@lru_cache(maxsize=4096)
+def _county_cbsa_at(county_geoid, version):
+    conn = _read_only()
+    if conn is None:
+        return None
+    try:
+        row = conn.execute("SELECT cbsa FROM county_cbsa WHERE county_geoid=?", (county_geoid,)).fetchone()
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.close()
+    return row[0] if row else None
+
+
+def get_hierarchy_benchmarks(geoid_data, scopes=SCOPE_LEVELS):
+    """
+    Resolve Tract / County / Metro benchmarks for a GEOID dict from data.py.
+    Returns flat keys in the same style as compare_with_benchmarks
+    (e.g. county_name, county_income, county_age_dist) plus 'extra_scopes'.
+    """
+    if not geoid_data:
+        return {}
+
+    state = geoid_data.get("state", "")
+    county = geoid_data.get("county", "")
+    tract = geoid_data.get("tract", "")
+
+    keys = {
+        "tract": state + county + tract if tract else None,
+        "county": state + county if county else None,
+        "metro": get_county_cbsa(state + county) if county else None,
+    }
+
+    result = {"extra_scopes": []}
+    for level in SCOPE_LEVELS:
+        if level not in scopes or not keys[level]:
+            continue
+        b = get_benchmark(level, keys[level])
+        if not b:
+            continue
+        result["extra_scopes"].append(level)
+        result[f"{level}_name"] = b["name"]
+        result[f"{level}_income"] = b["income"]
+        result[f"{level}_income_dist"] = b["income_dist"]
+        result[f"{level}_age_dist"] = b["age"]
+        result[f"{level}_race_dist"] = b["race"]
+        result[f"{level}_edu_dist"] = b["edu"]
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the local ACS benchmark store.")
+    parser.add_argument("--states", required=True, help="Comma separated state FIPS codes, e.g. 06,36")
+    parser.add_argument("--levels", default=",".join(SCOPE_LEVELS))
+    parser.add_argument("--cbsa-csv", help="OMB CBSA delineation file (CSV) for County -> Metro mapping")
+    args = parser.parse_args()
+
+    print(build_store(args.states.split(","), levels=args.levels.split(",")))
+    if args.cbsa_csv:
+        print(f"Loaded {load_cbsa_delineation(args.cbsa_csv)} county -> CBSA rows")
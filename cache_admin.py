@@ -0,0 +1,277 @@
+import os
+import sys
+import time
+import argparse
+
+import locks
+import cache_codec
+import cache_store
+from config_manager import config_manager
+from singleflight import normalize_address
+
+# Cache Administration
+# Garbage collection, invalidation and stats for analysis_cache/.
+# Entries are {namespace}_{hash}.cache; the namespace decides the TTL:
+#   geo, census, acs      static_cache_ttl_hours
+#   poi, chart, amenity   cache_ttl_hours
+#   trend                 never (published ACS vintages don't change)
+#   rent, llm, other      cache_hard_expiry_hours (stale entries are still served)
+# After TTL eviction, the directory is trimmed to cache_max_mb /
+# cache_max_entries by evicting least-recently-used entries (atime, bumped by
+# cache_store on every hit). Intended for cron, e.g. daily:
+#   python cache_admin.py gc
+#   python cache_admin.py stats
+#   python cache_admin.py invalidate --address "123 Main St, Austin, TX"
+#   python cache_admin.py invalidate --namespace llm
+
+CACHE_DIR = "analysis_cache"
+QUARANTINE_KEEP_DAYS = 7
+TMP_KEEP_SECONDS = 3600  # Leftovers of writers that died mid-write
+LOCK_KEEP_SECONDS = 86400
+
+
+def _ttl_hours(namespace):
+    config = config_manager.get_config()
+    ttl = config.get("cache_ttl_hours", 240)
+    if namespace in ("geo", "census", "acs"):
+        return config.get("static_cache_ttl_hours", 2160)
+    if namespace in ("poi", "chart", "amenity"):
+        return ttl
+    if namespace == "trend":
+        return float("inf")
+    return max(ttl, config.get("cache_hard_expiry_hours", 720))
+
+
+def _entries(cache_dir):
+    """
+    [(path, namespace, stat)] for every cache entry in cache_dir.
+    """
+    entries = []
+    try:
+        names = os.listdir(cache_dir)
+    except FileNotFoundError:
+        return entries
+    for name in names:
+        if not name.endswith(cache_codec.EXT) or name.startswith("."):
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            entries.append((path, cache_store.namespace_of(path), os.stat(path)))
+        except FileNotFoundError:
+            pass  # Evicted / replaced meanwhile
+    return entries
+
+
+def _remove(path):
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+    except FileNotFoundError:
+        return 0
+
+
+def stats(cache_dir=CACHE_DIR):
+    """
+    {namespace: {entries, bytes, hits, misses, hit_rate}} plus a "total" row.
+    Hit counts are cumulative since the stats file was created.
+    """
+    cache_store.flush_stats()
+    rows = {}
+    for _, ns, st in _entries(cache_dir):
+        row = rows.setdefault(ns, {"entries": 0, "bytes": 0, "hits": 0, "misses": 0})
+        row["entries"] += 1
+        row["bytes"] += st.st_size
+    for ns, counts in cache_store.load_stats(cache_dir).items():
+        row = rows.setdefault(ns, {"entries": 0, "bytes": 0, "hits": 0, "misses": 0})
+        row["hits"] += counts.get("hits", 0)
+        row["misses"] += counts.get("misses", 0)
+
+    total = {"entries": 0, "bytes": 0, "hits": 0, "misses": 0}
+    for row in rows.values():
+        for k in total:
+            total[k] += row[k]
+    rows = dict(sorted(rows.items()))
+    rows["total"] = total
+    for row in rows.values():
+        lookups = row["hits"] + row["misses"]
+        row["hit_rate"] = round(row["hits"] / lookups, 3) if lookups else None
+    return rows
+
+
+def gc(cache_dir=CACHE_DIR, dry_run=False, now=None):
+    """
+    One GC pass: TTL eviction, then LRU down to the size / entry budget, then
+    housekeeping (old quarantine + temp files, idle lock files, address index).
+    Returns a summary dict.
+    """
+    config = config_manager.get_config()
+    max_bytes = config.get("cache_max_mb", 512) * 1024 * 1024
+    max_entries = config.get("cache_max_entries", 50000)
+    now = now or time.time()
+    summary = {"expired": 0, "evicted": 0, "housekeeping": 0, "freed_bytes": 0, "dry_run": dry_run}
+
+    def drop(path, size, reason):
+        summary[reason] += 1
+        summary["freed_bytes"] += size if dry_run else _remove(path)
+
+    # 1. TTL
+    live = []
+    for path, ns, st in _entries(cache_dir):
+        if now - st.st_mtime >= _ttl_hours(ns) * 3600:
+            drop(path, st.st_size, "expired")
+        else:
+            live.append((path, st))
+
+    # 2. Size / count budget, least recently used first
+    live.sort(key=lambda e: max(e[1].st_atime, e[1].st_mtime))
+    total_bytes = sum(st.st_size for _, st in live)
+    count = len(live)
+    for path, st in live:
+        if total_bytes <= max_bytes and count <= max_entries:
+            break
+        drop(path, st.st_size, "evicted")
+        total_bytes -= st.st_size
+        count -= 1
+
+    # 3. Housekeeping
+    qdir = os.path.join(cache_dir, cache_store.QUARANTINE_DIR)
+    for name in os.listdir(qdir) if os.path.isdir(qdir) else []:
+        path = os.path.join(qdir, name)
+        st = os.stat(path)
+        if now - st.st_mtime >= QUARANTINE_KEEP_DAYS * 86400:
+            drop(path, st.st_size, "housekeeping")
+    for name in os.listdir(cache_dir) if os.path.isdir(cache_dir) else []:
+        if name.startswith(".") and name.endswith(".tmp"):
+            path = os.path.join(cache_dir, name)
+            st = os.stat(path)
+            if now - st.st_mtime >= TMP_KEEP_SECONDS:
+                drop(path, st.st_size, "housekeeping")
+    summary["housekeeping"] += _clean_locks(now, dry_run)
+
+    if not dry_run:
+        _compact_index(cache_dir)
+    return summary
+
+
+def _clean_locks(now, dry_run):
+    """
+    Remove lock files unused for a day (locks are per key and otherwise
+    accumulate forever). Only removed while we hold the flock; a waiter that
+    still has the old file open notices in locks.file_lock and reopens.
+    """
+    if locks.fcntl is None or not os.path.isdir(locks.LOCK_DIR):
+        return 0
+    removed = 0
+    for name in os.listdir(locks.LOCK_DIR):
+        path = os.path.join(locks.LOCK_DIR, name)
+        try:
+            if now - os.path.getmtime(path) < LOCK_KEEP_SECONDS:
+                continue
+            with open(path, "a+") as f:
+                try:
+                    locks.fcntl.flock(f.fileno(), locks.fcntl.LOCK_EX | locks.fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # In use
+                if not dry_run:
+                    os.remove(path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def _read_index(cache_dir):
+    """
+    [(normalized address, file name)] from the address index.
+    """
+    pairs = []
+    try:
+        with open(os.path.join(cache_dir, cache_store.ADDRESS_INDEX), encoding="utf-8") as f:
+            for line in f:
+                address, sep, name = line.rstrip("\n").rpartition("\t")
+                if sep:
+                    pairs.append((address, name))
+    except FileNotFoundError:
+        pass
+    return pairs
+
+
+def _compact_index(cache_dir):
+    """
+    Rewrite the address index without duplicates and evicted entries.
+    """
+    path = os.path.join(cache_dir, cache_store.ADDRESS_INDEX)
+    with locks.file_lock(path, timeout=cache_store.WRITE_LOCK_TIMEOUT):
+        pairs = _read_index(cache_dir)
+        if not pairs:
+            return
+        kept = dict.fromkeys(p for p in pairs if os.path.exists(os.path.join(cache_dir, p[1])))
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.writelines(f"{address}\t{name}\n" for address, name in kept)
+        os.replace(tmp, path)
+
+
+def invalidate(namespace=None, address=None, prefix=None, cache_dir=CACHE_DIR):
+    """
+    Delete entries by namespace ("llm"), by address (everything written for
+    it) and/or by file name prefix ("rent_ab12"). Filters combine with AND.
+    Returns the number of entries removed.
+    """
+    if not (namespace or address or prefix):
+        raise ValueError("invalidate needs a namespace, address or prefix")
+
+    names = None
+    if address:
+        target = normalize_address(address)
+        names = {name for a, name in _read_index(cache_dir) if a == target}
+
+    removed = 0
+    for path, ns, _ in _entries(cache_dir):
+        name = os.path.basename(path)
+        if namespace and ns != namespace:
+            continue
+        if prefix and not name.startswith(prefix):
+            continue
+        if names is not None and name not in names:
+            continue
+        _remove(path)
+        removed += 1
+    print(f"[cache_admin] Invalidated {removed} entries (namespace={namespace}, address={address}, prefix={prefix})")
+    return removed
+
+
+def fmt_bytes(n):
+    return f"{n / 1024 / 1024:.1f} MB" if n >= 1024 * 1024 else f"{n / 1024:.1f} KB"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HouSmart cache administration.")
+    parser.add_argument("--dir", default=CACHE_DIR)
+    sub = parser.add_subparsers(dest="command")
+    sub.add_parser("stats", help="Entries, size and hit rate per namespace")
+    gc_parser = sub.add_parser("gc", help="Evict expired entries and enforce cache_max_mb / cache_max_entries")
+    gc_parser.add_argument("--dry-run", action="store_true", help="Only report what would be removed")
+    inv_parser = sub.add_parser("invalidate", help="Delete entries by namespace, address and/or prefix")
+    inv_parser.add_argument("--namespace", help="geo, poi, census, acs, rent, llm, chart, amenity, trend (see stats)")
+    inv_parser.add_argument("--address")
+    inv_parser.add_argument("--prefix", help="File name prefix, e.g. rent_ab12")
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        for ns, row in stats(args.dir).items():
+            rate = f"{row['hit_rate']:.0%}" if row["hit_rate"] is not None else "-"
+            print(f"{ns:<8} {row['entries']:>7} entries {fmt_bytes(row['bytes']):>10}  hit rate {rate:>4} ({row['hits']}/{row['hits'] + row['misses']})")
+    elif args.command == "gc":
+        summary = gc(args.dir, dry_run=args.dry_run)
+        verb = "Would free" if args.dry_run else "Freed"
+        print(f"{verb} {fmt_bytes(summary['freed_bytes'])}: {summary['expired']} expired, "
+              f"{summary['evicted']} evicted (LRU), {summary['housekeeping']} temp/quarantine/lock files")
+    elif args.command == "invalidate":
+        if not (args.namespace or args.address or args.prefix):
+            inv_parser.error("give --namespace, --address and/or --prefix")
+        invalidate(args.namespace, args.address, args.prefix, cache_dir=args.dir)
+    else:
+        parser.print_help()
+        sys.exit(0)
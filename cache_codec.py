@@ -0,0 +1,219 @@
+import os
+import sys
+import json
+import zlib
+import base64
+import struct
+import argparse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Cache Codec
+# On-disk format for analysis_cache/ entries, replacing pickle:
+#
+#   b"HSC2" | schema (uint16) | compression (uint8) | flags (uint8) | crc32(body) (uint32) | body
+#
+# body = JSON via orjson, compressed with zstd (both in requirements.txt; an
+# install without them falls back to stdlib json + zlib, and can still read
+# everything except zstd entries). bytes values (chart PNGs) are stored as
+# {"__bytes__": base64}. JSON can't execute code on load, unlike pickle, so a
+# shared cache directory is safe to read. Types JSON can't represent raise
+# TypeError rather than coming back as something else.
+#
+# Bump SCHEMA_VERSION whenever the shape of cached values changes: entries
+# written with another version are treated as misses (CacheFormatError).
+# Truncated / bit-flipped entries fail the CRC (CacheCorruptError); see
+# cache_store for how both are handled on read.
+#
+# Migrate existing pickles (trusted, local only):
+#   python cache_codec.py --migrate [--dir analysis_cache] [--keep]
+
+MAGIC = b"HSC2"
+SCHEMA_VERSION = 1
+EXT = ".cache"
+
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+COMPRESSION_ZSTD = 2
+
+_HEADER = struct.Struct(">4sHBBI")
+FLAG_BYTES = 0x01  # Payload contains tagged bytes values
+_MIN_COMPRESS = 256  # Small payloads aren't worth the header/CPU
+
+
+class CacheFormatError(ValueError):
+    """
+    Not an entry for this codec/schema version (clean miss).
+    """
+
+
+class CacheCorruptError(CacheFormatError):
+    """
+    Entry is damaged: truncated, checksum mismatch or undecodable body.
+    """
+
+
+def _default(obj):
+    if isinstance(obj, (bytes, bytearray)):
+        return {"__bytes__": base64.b64encode(bytes(obj)).decode("ascii")}
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if hasattr(obj, "item"):  # numpy scalars
+        return obj.item()
+    if hasattr(obj, "tolist"):  # numpy arrays
+        return obj.tolist()
+    raise TypeError(f"{type(obj).__name__} is not cacheable")
+
+
+def _restore(value):
+    if isinstance(value, dict):
+        if len(value) == 1 and "__bytes__" in value:
+            return base64.b64decode(value["__bytes__"])
+        return {k: _restore(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_restore(v) for v in value]
+    return value
+
+
+def _has_bytes(value):
+    if isinstance(value, (bytes, bytearray)):
+        return True
+    if isinstance(value, dict):
+        return any(_has_bytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return any(_has_bytes(v) for v in value)
+    return False
+
+
+def _to_json(value):
+    if orjson is not None:
+        try:
+            # Datetimes / dataclasses go through _default too, as with stdlib json
+            return orjson.dumps(value, default=_default,
+                                option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+                                | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS)
+        except TypeError:
+            pass  # e.g. int keys > 64 bit; stdlib handles those (and re-raises the rest)
+    return json.dumps(value, default=_default, separators=(",", ":")).encode("utf-8")
+
+
+def _from_json(raw):
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+
+def dumps(value):
+    """
+    Encode a cache value (JSON-like data, bytes allowed) to the cache format.
+    Tuples come back as lists.
+    """
+    body = _to_json(value)
+    compression = COMPRESSION_NONE
+    if len(body) >= _MIN_COMPRESS:
+        if zstandard is not None:
+            body = zstandard.ZstdCompressor(level=3).compress(body)
+            compression = COMPRESSION_ZSTD
+        else:
+            body = zlib.compress(body, 6)
+            compression = COMPRESSION_ZLIB
+    # Plain payloads skip the _restore walk on load
+    flags = FLAG_BYTES if _has_bytes(value) else 0
+    return _HEADER.pack(MAGIC, SCHEMA_VERSION, compression, flags, zlib.crc32(body)) + body
+
+
+def loads(blob):
+    """
+    Decode a cache blob. Raises CacheFormatError for foreign/old-schema data,
+    CacheCorruptError for damaged entries.
+    """
+    if len(blob) < _HEADER.size:
+        raise CacheCorruptError("truncated cache entry")
+    magic, schema, compression, flags, crc = _HEADER.unpack_from(blob)
+    if magic != MAGIC:
+        raise CacheFormatError("not a cache entry")
+    if schema != SCHEMA_VERSION:
+        raise CacheFormatError(f"schema {schema} != {SCHEMA_VERSION}")
+
+    body = blob[_HEADER.size:]
+    if zlib.crc32(body) != crc:
+        raise CacheCorruptError("checksum mismatch")
+    if compression == COMPRESSION_ZSTD and zstandard is None:
+        raise CacheFormatError("zstd entry but zstandard is not installed")
+    try:
+        if compression == COMPRESSION_ZSTD:
+            body = zstandard.ZstdDecompressor().decompress(body)
+        elif compression == COMPRESSION_ZLIB:
+            body = zlib.decompress(body)
+        elif compression != COMPRESSION_NONE:
+            raise CacheFormatError(f"unknown compression {compression}")
+        value = _from_json(body)
+    except CacheFormatError:
+        raise
+    except Exception as e:
+        raise CacheCorruptError(f"undecodable body: {e}")
+    return _restore(value) if flags & FLAG_BYTES else value
+
+
+def cache_file(cache_dir, stem):
+    return os.path.join(cache_dir, stem + EXT)
+
+
+def migrate_pickles(cache_dir="analysis_cache", keep=False):
+    """
+    Convert *.pkl entries to the cache format, keeping their mtime (TTL age).
+    Only run this on a cache directory you trust: it unpickles every file.
+    Returns (converted, failed, bytes_before, bytes_after).
+    """
+    import pickle
+    import cache_store
+
+    converted = failed = before = after = 0
+    if not os.path.isdir(cache_dir):
+        return converted, failed, before, after
+
+    for name in sorted(os.listdir(cache_dir)):
+        if not name.endswith(".pkl"):
+            continue
+        src = os.path.join(cache_dir, name)
+        stem = name[:-len(".pkl")]
+        if len(stem) == 32 and "_" not in stem:
+            stem = f"llm_{stem}"  # LLM analyses used to be saved as {md5}.pkl
+        dst = cache_file(cache_dir, stem)
+        try:
+            st = os.stat(src)
+            with open(src, "rb") as f:
+                value = pickle.load(f)
+            cache_store.write(dst, value)
+            os.utime(dst, (st.st_atime, st.st_mtime))
+            before += st.st_size
+            after += os.path.getsize(dst)
+            converted += 1
+            if not keep:
+                os.remove(src)
+        except Exception as e:
+            print(f"[cache_codec] Could not migrate {name}: {e}")
+            failed += 1
+    return converted, failed, before, after
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HouSmart cache codec tools.")
+    parser.add_argument("--migrate", action="store_true", help="Convert *.pkl cache entries to the new format")
+    parser.add_argument("--dir", default="analysis_cache")
+    parser.add_argument("--keep", action="store_true", help="Keep the .pkl files after converting")
+    args = parser.parse_args()
+
+    if not args.migrate:
+        parser.print_help()
+        sys.exit(0)
+
+    converted, failed, before, after = migrate_pickles(args.dir, keep=args.keep)
+    ratio = f" ({after / before:.0%} of original size)" if before else ""
+    print(f"Migrated {converted} entries, {failed} failed. {before / 1024:.1f} KB -> {after / 1024:.1f} KB{ratio}")
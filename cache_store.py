@@ -0,0 +1,200 @@
+import os
+import json
+import time
+import uuid
+import atexit
+import threading
+
+import locks
+import cache_codec
+from singleflight import normalize_address
+
+# Cache Store
+# File I/O for cache_codec entries, safe with several sessions / processes:
+# - write: serialize, write to a temp file in the same directory, fsync, then
+#   os.replace() over the target under a per-key advisory lock. Readers see the
+#   old file or the new one, never a partial write.
+# - read: entries failing the checksum / decode are moved to QUARANTINE_DIR
+#   (one clean miss, not a failed load on every request). Entries from another
+#   schema version are just misses and get overwritten by the next write.
+# - hits bump the file's atime (mtime stays = write time, which TTLs use), so
+#   cache_admin can evict least-recently-used entries even on noatime mounts.
+# - hit/miss counts per namespace (file name prefix) are flushed to STATS_FILE.
+# - writes tagged with an address are appended to ADDRESS_INDEX so
+#   cache_admin can invalidate everything cached for an address.
+
+QUARANTINE_DIR = "quarantine"  # Inside the cache directory of the entry
+STATS_FILE = "cache_stats.json"
+ADDRESS_INDEX = "address_index.tsv"
+WRITE_LOCK_TIMEOUT = 10
+STATS_FLUSH_EVERY = 100
+
+_stats = {"quarantined": 0, "write_errors": 0}
+_counters = {}  # (cache_dir, namespace) -> [hits, misses]
+_pending_events = 0
+_stats_lock = threading.Lock()
+
+
+def _bump(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def namespace_of(path):
+    """
+    'rent' for analysis_cache/rent_<md5>.cache etc.
+    """
+    return os.path.basename(path).split("_", 1)[0].split(".", 1)[0]
+
+
+def _record(path, hit):
+    global _pending_events
+    key = (os.path.dirname(path) or ".", namespace_of(path))
+    with _stats_lock:
+        counts = _counters.setdefault(key, [0, 0])
+        counts[0 if hit else 1] += 1
+        _pending_events += 1
+        flush = _pending_events >= STATS_FLUSH_EVERY
+    if flush:
+        flush_stats()
+
+
+def flush_stats():
+    """
+    Merge this process's hit/miss counters into each cache dir's STATS_FILE.
+    """
+    global _pending_events
+    with _stats_lock:
+        counters = {k: v[:] for k, v in _counters.items() if v != [0, 0]}
+        _counters.clear()
+        _pending_events = 0
+
+    by_dir = {}
+    for (cache_dir, ns), counts in counters.items():
+        by_dir.setdefault(cache_dir, {})[ns] = counts
+    for cache_dir, updates in by_dir.items():
+        path = os.path.join(cache_dir, STATS_FILE)
+        try:
+            with locks.file_lock(path, timeout=WRITE_LOCK_TIMEOUT):
+                totals = load_stats(cache_dir)
+                for ns, (hits, misses) in updates.items():
+                    entry = totals.setdefault(ns, {"hits": 0, "misses": 0})
+                    entry["hits"] += hits
+                    entry["misses"] += misses
+                tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(totals, f)
+                os.replace(tmp, path)
+        except Exception as e:
+            print(f"[cache_store] Stats flush error: {e}")
+
+
+def load_stats(cache_dir):
+    """
+    Persisted {namespace: {"hits", "misses"}} for a cache dir.
+    """
+    try:
+        with open(os.path.join(cache_dir, STATS_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+atexit.register(flush_stats)
+
+
+def quarantine(path, reason=""):
+    """
+    Move a damaged entry out of the way (kept for inspection).
+    """
+    qdir = os.path.join(os.path.dirname(path), QUARANTINE_DIR)
+    try:
+        os.makedirs(qdir, exist_ok=True)
+        dst = os.path.join(qdir, f"{os.path.basename(path)}.{int(time.time())}")
+        os.replace(path, dst)
+        _bump("quarantined")
+        print(f"[cache_store] Quarantined {path}: {reason}")
+    except FileNotFoundError:
+        pass  # Another reader got there first
+    except OSError as e:
+        print(f"[cache_store] Could not quarantine {path}: {e}")
+
+
+def read_entry(path, max_age=None):
+    """
+    (value, mtime) for path, or (None, None) on a miss: missing, older than
+    max_age seconds, other schema, or corrupt (-> quarantined).
+    """
+    try:
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            if max_age is not None and time.time() - st.st_mtime >= max_age:
+                _record(path, False)
+                return None, None
+            blob = f.read()
+    except FileNotFoundError:
+        _record(path, False)
+        return None, None
+    except OSError as e:
+        print(f"[cache_store] Read error {path}: {e}")
+        return None, None
+
+    try:
+        value = cache_codec.loads(blob)
+    except cache_codec.CacheCorruptError as e:
+        quarantine(path, str(e))
+        value = None
+    except cache_codec.CacheFormatError as e:
+        print(f"[cache_store] Ignoring {path}: {e}")
+        value = None
+
+    _record(path, value is not None)
+    if value is None:
+        return None, None
+    try:
+        os.utime(path, (time.time(), st.st_mtime))  # atime = last use (LRU)
+    except OSError:
+        pass
+    return value, st.st_mtime
+
+
+def read(path, max_age=None):
+    """
+    Value stored at path, or None (see read_entry).
+    """
+    return read_entry(path, max_age)[0]
+
+
+def write(path, value, address=None):
+    """
+    Atomically replace path with the encoded value.
+    address: optional, indexes the entry for cache_admin.invalidate_address.
+    """
+    blob = cache_codec.dumps(value)  # Encode outside the lock
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    tmp = os.path.join(directory, f".{os.path.basename(path)}.{uuid.uuid4().hex}.tmp")
+    try:
+        with locks.file_lock(path, timeout=WRITE_LOCK_TIMEOUT):
+            with open(tmp, "wb") as f:
+                f.write(blob)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+    except Exception:
+        _bump("write_errors")
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+    if address:
+        # Locked so cache_admin's index compaction can't drop this line
+        index = os.path.join(directory, ADDRESS_INDEX)
+        with locks.file_lock(index, timeout=WRITE_LOCK_TIMEOUT):
+            with open(index, "a", encoding="utf-8") as f:
+                f.write(f"{normalize_address(address)}\t{os.path.basename(path)}\n")
+
+
+def stats():
+    with _stats_lock:
+        return dict(_stats)
@@ -0,0 +1,299 @@
+import os
+import csv
+import json
+import argparse
+from datetime import datetime, timedelta
+
+import streamlit as st
+
+import data
+import llm
+import pipeline
+import amenity_score
+import supabase_utils
+from config_manager import config_manager
+from singleflight import normalize_address
+
+# Cache Warmer
+# Finds frequently / recently analyzed addresses (logs/usage_logs.csv + Supabase
+# property_logs) and pre-fetches every pipeline step the app would run for them
+# (geocode, POIs, census, RentCast, Gemini), so the next visitor gets cache hits.
+# Runs only during warm_off_peak_hours and stops spending on an API once its
+# warm_budget is used up. Intended for cron, e.g. hourly:
+#   python cache_warmer.py
+#   python cache_warmer.py --force --top 10 --dry-run   # preview outside off-peak
+
+USAGE_LOG = os.path.join("logs", "usage_logs.csv")
+REPORT_FILE = os.path.join("analysis_cache", "warm_report.json")
+
+DEFAULT_SPECS = (2, 2, 1200, "Single Family")  # app.py input defaults
+STEPS = ["geocode", "poi", "census", "rentcast", "llm"]
+# API calls per step on a cache miss (same accounting as the app's usage logging)
+STEP_COST = {
+    "geocode": ("geoapify", 1),
+    "poi": ("geoapify", len(data.POI_GROUPS)),  # One call per group (single page in most places); settled after the fetch
+    "census": ("census", 2),
+    "rentcast": ("rentcast", 1),
+    "llm": ("gemini", 1),
+}
+
+
+def _parse_ts(value):
+    if not value:
+        return None
+    try:
+        ts = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        try:
+            ts = datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            return None
+    # usage_logs.csv is local time, Supabase is UTC
+    return ts.astimezone().replace(tzinfo=None) if ts.tzinfo else ts
+
+
+def load_usage_log(days, path=USAGE_LOG):
+    """
+    [(address, specs, ts)] from the local usage log. Rows written before the
+    specs columns existed get DEFAULT_SPECS.
+    """
+    rows = []
+    if not os.path.exists(path):
+        return rows
+    cutoff = datetime.now() - timedelta(days=days)
+    with open(path, encoding="utf-8") as f:
+        for row in csv.reader(f):
+            if len(row) < 3 or row[0] == "Timestamp":
+                continue
+            ts = _parse_ts(row[0])
+            if not ts or ts < cutoff or not row[2] or row[2] == "Unknown Address":
+                continue
+            specs = DEFAULT_SPECS
+            if len(row) >= 7:
+                try:
+                    specs = (int(row[3]), float(row[4]), int(row[5]), row[6])
+                except ValueError:
+                    pass
+            rows.append((row[2], specs, ts))
+    return rows
+
+
+def load_supabase_log(days):
+    rows = []
+    for address, created_at in supabase_utils.get_recent_addresses(days=days):
+        ts = _parse_ts(created_at)
+        if ts:
+            rows.append((address, DEFAULT_SPECS, ts))
+    return rows
+
+
+def rank_candidates(rows, top, half_life_hours=72):
+    """
+    Score = sum over requests of 0.5 ** (age / half_life): frequent and recent
+    both count. Returns the top addresses with their most recent specs.
+    """
+    now = datetime.now()
+    grouped = {}
+    for address, specs, ts in rows:
+        key = normalize_address(address)
+        entry = grouped.setdefault(key, {"address": address, "specs": specs, "last": ts, "count": 0, "score": 0.0})
+        age_hours = max(0.0, (now - ts).total_seconds() / 3600)
+        entry["score"] += 0.5 ** (age_hours / half_life_hours)
+        entry["count"] += 1
+        if ts >= entry["last"]:
+            entry.update(address=address, specs=specs, last=ts)
+    ranked = sorted(grouped.values(), key=lambda e: e["score"], reverse=True)
+    return ranked[:top]
+
+
+class Budget:
+    def __init__(self, limits):
+        self.limits = dict(limits)
+        self.spent = {api: 0 for api in self.limits}
+
+    def spend(self, api, n):
+        """
+        Reserve n calls; False if that would exceed the budget.
+        """
+        if self.spent.get(api, 0) + n > self.limits.get(api, 0):
+            return False
+        self.spent[api] = self.spent.get(api, 0) + n
+        return True
+
+    def settle(self, api, reserved, actual):
+        """
+        Replace a reservation with the number of calls actually made.
+        """
+        self.spent[api] = self.spent.get(api, 0) - reserved + actual
+
+
+def probe(address, specs, coords=None):
+    """
+    Which steps are already cached (fresh) for this address.
+    Returns ({step: bool}, cached rent_data).
+    """
+    bed, bath, sqft, prop = specs
+    coords = coords or data.cached_coordinates(address)
+    rent = data.get_cached_rentcast(data.rentcast_cache_key(address, bed, bath, sqft, prop))
+    analysis = llm.get_cached_analysis(address, weights=llm.DEFAULT_WEIGHTS, rent_data=rent)
+    status = {
+        "geocode": coords is not None,
+        "poi": coords is not None and data.cached_pois(address, *coords) is not None,
+        "census": data.cached_census(address) is not None,
+        "rentcast": bool(rent) and not rent["_cache_meta"]["stale"],
+        "llm": bool(analysis) and not analysis["_cache_meta"].get("stale"),
+    }
+    return status, rent
+
+
+def warm_address(address, specs, keys, budget, dry_run=False):
+    """
+    Fill the missing steps for one address. Returns {step: hit|warmed|budget|failed|skipped}.
+    """
+    bed, bath, sqft, prop = specs
+    status, rent = probe(address, specs)
+    result = {}
+
+    def allowed(step):
+        if status[step]:
+            result[step] = "hit"
+            return False
+        api, cost = STEP_COST[step]
+        if not keys.get(api, True):
+            result[step] = "skipped"  # No API key configured
+            return False
+        if dry_run or not budget.spend(api, cost):
+            result[step] = "budget" if not dry_run else "missing"
+            return False
+        return True
+
+    # 1. Geocode
+    coords = data.cached_coordinates(address)
+    if allowed("geocode"):
+        data.get_coordinates(address, keys["geoapify"])
+        coords = data.cached_coordinates(address)
+        result["geocode"] = "warmed" if coords else "failed"
+
+    # 2. POIs
+    if coords is None:
+        result["poi"] = "skipped"
+    elif allowed("poi"):
+        calls = {"geoapify": 0}
+        data.get_poi(address, keys["geoapify"], lat=coords[0], lon=coords[1], api_calls=calls)
+        budget.settle("geoapify", STEP_COST["poi"][1], calls["geoapify"])
+        result["poi"] = "warmed" if data.cached_pois(address, *coords) is not None else "failed"
+
+    # 3. Census
+    if allowed("census"):
+        data.get_census_data(address, geo_key=keys["geoapify"])
+        result["census"] = "warmed" if data.cached_census(address) else "failed"
+
+    # 4. RentCast
+    if allowed("rentcast"):
+        fresh = data.get_rentcast_data(address, bed, bath, sqft, prop, keys["rentcast"], force_refresh=True)
+        rent = fresh or rent
+        result["rentcast"] = "warmed" if fresh else "failed"
+
+    # 5. Gemini (needs the same inputs the app would pass)
+    # The analysis key includes rent_data, so re-check after a RentCast refresh
+    status["llm"] = probe(address, specs)[0]["llm"]
+    if allowed("llm"):
+        pois = data.cached_pois(address, *coords) if coords else []
+        census = data.cached_census(address)
+        # Same inputs as pipeline.run_analysis_async: the whole wide POI fetch + nearby schools
+        all_pois = data.cached_pois(address, *coords, radius_m=None) if coords else None
+        amenity = None
+        if all_pois is not None:
+            schools = data.get_nearby_schools_data(coords[0], coords[1], keys.get("supabase_url"), keys.get("supabase_key"),
+                                                   miles=pipeline.SCHOOL_RADIUS_MILES)
+            amenity = amenity_score.score(*coords, all_pois, schools)
+        analysis = llm.analyze_location(
+            address, pois or [], census, weights=llm.DEFAULT_WEIGHTS, rent_data=rent, force_refresh=True,
+            amenity=amenity,
+        )
+        ok = analysis and "error" not in analysis and "Error generating analysis" not in analysis.get("highlights", [])
+        result["llm"] = "warmed" if ok else "failed"
+
+    return result
+
+
+def run(top=None, days=None, force=False, dry_run=False):
+    config = config_manager.get_config()
+    top = top or config.get("warm_top_n", 50)
+    days = days or config.get("warm_lookback_days", 14)
+
+    now = datetime.now()
+    if not force and now.hour not in config.get("warm_off_peak_hours", [1, 2, 3, 4, 5]):
+        print(f"[warmer] {now:%H:%M} is outside warm_off_peak_hours, nothing to do (use --force).")
+        return None
+
+    keys = {
+        "geoapify": st.secrets.get("GEOAPIFY_API_KEY"),
+        "rentcast": st.secrets.get("RENTCAST_API_KEY"),
+        "supabase_url": st.secrets.get("SUPABASE_URL"),
+        "supabase_key": st.secrets.get("SUPABASE_KEY"),
+    }
+    keys["gemini"] = "GEMINI_API_KEY" in st.secrets and llm.configure_genai(st.secrets["GEMINI_API_KEY"])
+
+    rows = load_usage_log(days) + load_supabase_log(days)
+    candidates = rank_candidates(rows, top)
+    budget = Budget(config.get("warm_budget", {}))
+    print(f"[warmer] {len(rows)} logged requests, warming top {len(candidates)} addresses. Budget: {budget.limits}")
+
+    coverage_before = {step: 0 for step in STEPS}
+    coverage_after = {step: 0 for step in STEPS}
+    details = []
+    for c in candidates:
+        before, _ = probe(c["address"], c["specs"])
+        for step, ok in before.items():
+            coverage_before[step] += ok
+
+        result = warm_address(c["address"], c["specs"], keys, budget, dry_run=dry_run)
+        after, _ = probe(c["address"], c["specs"])
+        for step, ok in after.items():
+            coverage_after[step] += ok
+
+        details.append({"address": c["address"], "requests": c["count"], "score": round(c["score"], 2), "steps": result})
+        print(f"[warmer] {c['address']} ({c['count']} req): " + ", ".join(f"{k}={v}" for k, v in result.items()))
+
+    report = {
+        "run_at": now.strftime("%Y-%m-%d %H:%M:%S"),
+        "dry_run": dry_run,
+        "candidates": len(candidates),
+        "coverage_before": coverage_before,
+        "coverage_after": coverage_after,
+        "spend": budget.spent,
+        "budget": budget.limits,
+        "addresses": details,
+    }
+    if not dry_run:
+        os.makedirs(os.path.dirname(REPORT_FILE), exist_ok=True)
+        with open(REPORT_FILE, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    n = max(1, len(candidates))
+    print("[warmer] Coverage (before -> after): " + ", ".join(
+        f"{s} {coverage_before[s] * 100 // n}% -> {coverage_after[s] * 100 // n}%" for s in STEPS))
+    print(f"[warmer] Spend: {budget.spent}")
+    return report
+
+
+def last_report():
+    """
+    The most recent warm report (for the admin panel), or None.
+    """
+    try:
+        with open(REPORT_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-fetch pipeline results for popular addresses.")
+    parser.add_argument("--top", type=int, help="Number of addresses (default: warm_top_n)")
+    parser.add_argument("--days", type=int, help="Log lookback in days (default: warm_lookback_days)")
+    parser.add_argument("--force", action="store_true", help="Run even outside warm_off_peak_hours")
+    parser.add_argument("--dry-run", action="store_true", help="Only report coverage, no API calls")
+    args = parser.parse_args()
+    run(top=args.top, days=args.days, force=args.force, dry_run=args.dry_run)
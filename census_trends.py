@@ -0,0 +1,251 @@
+import asyncio
+
+import numpy as np
+
+import aio
+import cache_codec
+import cache_store
+import circuit_breaker
+from config_manager import config_manager
+
+# ACS Trends (several 5-year vintages for the same place)
+# One small ACS query per vintage, all vintages in parallel. Published vintages
+# never change, so each (vintage, geography) is cached without expiry
+# (trend_* entries; only the cache size budget evicts them).
+# Block group GEOIDs are 2020 geography: older vintages may not have the same
+# block group, so the series falls back to the tract, then the county, using
+# the finest level every vintage has.
+# Vintages up to 2019 use 2010 tract / block group boundaries, later ones the
+# 2020 redraw, which reuses codes for areas that were split or merged. A
+# matching GEOID across the redraw isn't the same place, so series that span
+# it are compared at the county level (boundaries stable across the redraw).
+# Dollar figures are in each vintage's own dollars; growth is also reported
+# in real terms via CPI-U.
+
+CACHE_DIR = "analysis_cache"
+LEVELS = ["block group", "tract", "county"]
+DEFAULT_VINTAGES = [2013, 2017, 2022]  # 2009-13, 2013-17, 2018-22
+FIRST_2020_GEOGRAPHY_VINTAGE = 2020  # 2016-20 ACS: first on 2020 census boundaries
+# Census API error body when a vintage doesn't publish a geography level
+UNKNOWN_GEOGRAPHY = "unknown/unsupported geography hierarchy"
+
+# metric -> {first vintage: variable code}; the newest entry <= vintage applies.
+# Handles tables that were introduced / renumbered (B23025 replaced the
+# B23001 sums for employment status from 2011).
+VARIABLES = {
+    "population": {2009: "B01003_001E"},
+    "median_income": {2009: "B19013_001E"},
+    "median_rent": {2009: "B25064_001E"},
+    "median_home_value": {2009: "B25077_001E"},
+    "housing_units": {2009: "B25002_001E"},
+    "vacant_units": {2009: "B25002_003E"},
+    "labor_force": {2011: "B23025_003E"},
+    "unemployed": {2011: "B23025_005E"},
+}
+DOLLAR_METRICS = ("median_income", "median_rent", "median_home_value")
+
+# CPI-U annual averages (BLS, 1982-84=100), to compare vintages in real dollars
+CPI_U = {
+    2009: 214.537, 2010: 218.056, 2011: 224.939, 2012: 229.594, 2013: 232.957,
+    2014: 236.736, 2015: 237.017, 2016: 240.007, 2017: 245.120, 2018: 251.107,
+    2019: 255.657, 2020: 258.811, 2021: 270.970, 2022: 292.655, 2023: 304.702,
+}
+
+# Red flags (first -> last vintage)
+FLAG_POPULATION_DROP_PCT = -3.0
+FLAG_REAL_INCOME_DROP_PCT = -5.0
+FLAG_VACANCY_RISE_PTS = 3.0
+FLAG_UNEMPLOYMENT_RISE_PTS = 2.0
+
+
+def variable_code(metric, vintage):
+    codes = [(since, code) for since, code in VARIABLES[metric].items() if since <= vintage]
+    return max(codes)[1] if codes else None
+
+
+def comparable_levels(vintages):
+    """
+    Geography levels whose GEOIDs mean the same area in every vintage.
+    """
+    decades = {v >= FIRST_2020_GEOGRAPHY_VINTAGE for v in vintages}
+    return LEVELS if len(decades) == 1 else ["county"]
+
+
+def _geo_params(level, geoid_data):
+    state, county, tract, bg = (geoid_data["state"], geoid_data["county"],
+                                geoid_data["tract"], geoid_data["block_group"])
+    if level == "block group":
+        return {"for": f"block group:{bg}", "in": f"state:{state} county:{county} tract:{tract}"}, f"{state}{county}{tract}{bg}"
+    if level == "tract":
+        return {"for": f"tract:{tract}", "in": f"state:{state} county:{county}"}, f"{state}{county}{tract}"
+    return {"for": f"county:{county}", "in": f"state:{state}"}, f"{state}{county}"
+
+
+def _cache_path(vintage, level, geoid):
+    return cache_codec.cache_file(CACHE_DIR, f"trend_{vintage}_{level.replace(' ', '')}_{geoid}")
+
+
+async def fetch_vintage_async(vintage, level, geoid_data):
+    """
+    {metric: value} for one vintage and geography level; {} if the geography
+    doesn't exist in that vintage; None if the request failed (not cached).
+    """
+    geo, geoid = _geo_params(level, geoid_data)
+    path = _cache_path(vintage, level, geoid)
+    try:
+        cached = await asyncio.to_thread(cache_store.read, path)
+        if cached is not None:
+            return cached
+    except Exception as e:
+        print(f"Cache Read Error (trend): {e}")
+
+    codes = {m: variable_code(m, vintage) for m in VARIABLES}
+    codes = {m: c for m, c in codes.items() if c}
+    params = {"get": ",".join(["NAME"] + sorted(set(codes.values()))), **geo}
+    try:
+        r = await circuit_breaker.http_get_async("census_acs", f"https://api.census.gov/data/{vintage}/acs/acs5", params=params)
+    except Exception as e:
+        print(f"ACS Trend Error ({vintage}, {level}): {e}")
+        return None
+
+    if r.status_code == 200:
+        rows = r.json()
+        values = {}
+        if len(rows) > 1:
+            headers, row = rows[0], rows[1]
+            for metric, code in codes.items():
+                try:
+                    v = float(row[headers.index(code)])
+                    if v >= 0:  # Negative = ACS missing / suppressed
+                        values[metric] = v
+                except (ValueError, TypeError):
+                    pass
+    elif r.status_code == 204 or (r.status_code == 400 and UNKNOWN_GEOGRAPHY in r.text.lower()):
+        values = {}  # Geography doesn't exist in this vintage
+    else:  # Other 400s (bad variable, malformed query) may be ours to fix: don't cache
+        print(f"ACS Trend Error ({vintage}, {level}): HTTP {r.status_code}")
+        return None
+
+    try:
+        await asyncio.to_thread(cache_store.write, path, values)
+    except Exception as e:
+        print(f"Cache Save Error (trend): {e}")
+    return values
+
+
+async def get_trends_async(geoid_data, vintages=None):
+    """
+    Trend metrics for a GEOID dict (data.CensusDataService.get_census_geoid).
+    None if disabled or no level has data for every vintage.
+    """
+    config = config_manager.get_config()
+    if not geoid_data or not config.get("enable_census_trends", True):
+        return None
+    vintages = sorted(vintages or config.get("trend_vintages", DEFAULT_VINTAGES))
+    if len(vintages) < 2:
+        return None
+
+    for level in comparable_levels(vintages):
+        rows = await asyncio.gather(*(fetch_vintage_async(v, level, geoid_data) for v in vintages))
+        if any(r is None for r in rows):
+            return None  # Request failure: don't silently compare a coarser level
+        if all(r.get("median_income") or r.get("population") for r in rows):
+            return compute_trends(vintages, rows, level)
+    return None
+
+
+def get_trends(geoid_data, vintages=None):
+    """
+    Sync wrapper of get_trends_async.
+    """
+    return aio.run(get_trends_async(geoid_data, vintages))
+
+
+def compute_trends(vintages, rows, level="block group"):
+    """
+    Series + first->last changes for every metric at once (vintages x metrics
+    matrix), plus ratios and red flags.
+    """
+    metrics = list(VARIABLES)
+    years = np.array(vintages, dtype=np.float64)
+    m = np.array([[r.get(k, np.nan) for k in metrics] for r in rows], dtype=np.float64)
+
+    # Derived rates (percent)
+    col = {k: i for i, k in enumerate(metrics)}
+    with np.errstate(divide="ignore", invalid="ignore"):
+        vacancy = 100 * m[:, col["vacant_units"]] / m[:, col["housing_units"]]
+        unemployment = 100 * m[:, col["unemployed"]] / m[:, col["labor_force"]]
+
+        # Real dollars (last vintage's dollars)
+        cpi = np.array([CPI_U.get(int(v), np.nan) for v in vintages])
+        deflator = cpi[-1] / cpi
+        dollar_cols = [col[k] for k in DOLLAR_METRICS]
+        real = m[:, dollar_cols] * deflator[:, None]
+
+        span = years[-1] - years[0]
+        first, last = m[0], m[-1]
+        change_pct = 100 * (last / first - 1)
+        cagr_pct = 100 * ((last / first) ** (1 / span) - 1)
+        real_change_pct = 100 * (real[-1] / real[0] - 1)
+
+    def num(x, digits=1):
+        return round(float(x), digits) if np.isfinite(x) else None
+
+    trends = {}
+    for k, i in col.items():
+        trends[k] = {"change_pct": num(change_pct[i]), "cagr_pct": num(cagr_pct[i], 2)}
+    for j, k in enumerate(DOLLAR_METRICS):
+        trends[k]["real_change_pct"] = num(real_change_pct[j])
+    trends["vacancy_rate"] = {"change_pts": num(vacancy[-1] - vacancy[0])}
+    trends["unemployment_rate"] = {"change_pts": num(unemployment[-1] - unemployment[0])}
+
+    series = {k: [num(v, 0) for v in m[:, i]] for k, i in col.items()}
+    series["vacancy_rate"] = [num(v) for v in vacancy]
+    series["unemployment_rate"] = [num(v) for v in unemployment]
+
+    red_flags = []
+    pop = trends["population"]["change_pct"]
+    if pop is not None and pop <= FLAG_POPULATION_DROP_PCT:
+        red_flags.append(f"Population down {abs(pop)}% since {vintages[0]}")
+    real_income = trends["median_income"]["real_change_pct"]
+    if real_income is not None and real_income <= FLAG_REAL_INCOME_DROP_PCT:
+        red_flags.append(f"Median household income down {abs(real_income)}% after inflation since {vintages[0]}")
+    vac = trends["vacancy_rate"]["change_pts"]
+    if vac is not None and vac >= FLAG_VACANCY_RISE_PTS:
+        red_flags.append(f"Vacancy rate up {vac} pts since {vintages[0]}")
+    unemp = trends["unemployment_rate"]["change_pts"]
+    if unemp is not None and unemp >= FLAG_UNEMPLOYMENT_RISE_PTS:
+        red_flags.append(f"Unemployment rate up {unemp} pts")
+
+    return {
+        "vintages": list(vintages),
+        "level": level,
+        "series": series,
+        "trends": trends,
+        "red_flags": red_flags,
+    }
+
+
+def prompt_text(trends):
+    """
+    Compact form for the LLM prompt.
+    """
+    if not trends:
+        return "Not Available"
+    t = trends["trends"]
+    span = f"{trends['vintages'][0]}->{trends['vintages'][-1]} ACS, {trends['level']}"
+    parts = []
+    for label, value, unit in (
+        ("population", t["population"]["change_pct"], "%"),
+        ("median income", t["median_income"]["change_pct"], "%"),
+        ("median income (real)", t["median_income"]["real_change_pct"], "%"),
+        ("median rent", t["median_rent"]["change_pct"], "%"),
+        ("median rent (real)", t["median_rent"]["real_change_pct"], "%"),
+        ("home value", t["median_home_value"]["change_pct"], "%"),
+        ("vacancy", t["vacancy_rate"]["change_pts"], " pts"),
+        ("unemployment", t["unemployment_rate"]["change_pts"], " pts"),
+    ):
+        if value is not None:
+            parts.append(f"{label} {value:+}{unit}")
+    flags = "; RED FLAGS: " + "; ".join(trends["red_flags"]) if trends["red_flags"] else ""
+    return f"{span}: " + ", ".join(parts) + flags
@@ -0,0 +1,205 @@
+import time
+import threading
+from collections import deque
+
+from config_manager import config_manager
+
+# Every call goes through http_get_async(provider, ...), which applies the
+# provider's timeout and records success/failure + latency in a rolling window.
+# When the failure rate (slow calls count as failures) crosses the threshold,
+# the breaker opens and calls fail immediately with CircuitOpenError, which
+# callers treat like any other request error (i.e. they use their existing
+# fallback). Calls that are slow by design (wildcard ACS prefetches) pass
+# count_slow=False: only errors and timeouts count against them, so one big
+# prefetch can't open the breaker for every user.
+# After breaker_open_seconds one probe call is let through (half-open): success
+# closes the breaker, failure re-opens it. A call cancelled before it has an
+# outcome (client disconnect, wait_for timeout) counts as neither, but frees
+# the probe slot so the next call can probe.
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+# Request timeouts in seconds, (connect, read)
+PROVIDER_TIMEOUTS = {
+    "geoapify": (3, 6),
+    "census_geocoder": (3, 6),
+    "census_acs": (3, 10),
+    "fcc": (3, 5),
+    "rentcast": (3, 10),
+}
+
+WINDOW_SECONDS = 120
+MIN_CALLS = 4  # Don't trip on a single unlucky request
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, name):
+        self.name = name
+        self.state = CLOSED
+        self.calls = deque()  # (timestamp, ok, latency)
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.last_error = None
+        self.short_circuited = 0
+        self._lock = threading.Lock()
+
+    def _settings(self):
+        config = config_manager.get_config()
+        return (
+            config.get("breaker_failure_rate", 0.5),
+            config.get("breaker_slow_seconds", 4.0),
+            config.get("breaker_open_seconds", 30),
+        )
+
+    def _trim(self, now):
+        while self.calls and now - self.calls[0][0] > WINDOW_SECONDS:
+            self.calls.popleft()
+
+    def allow(self):
+        """
+        True if a call may go out now (closed, or this is the half-open probe).
+        """
+        _, _, open_seconds = self._settings()
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.time() - self.opened_at >= open_seconds:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self.probe_in_flight:
+                self.probe_in_flight = True
+                return True
+            self.short_circuited += 1
+            return False
+
+    def record(self, ok, latency, error=None, count_slow=True):
+        failure_rate, slow_seconds, _ = self._settings()
+        now = time.time()
+        ok = ok and (latency < slow_seconds or not count_slow)
+        with self._lock:
+            if not ok:
+                self.last_error = error or f"slow call ({latency:.1f}s)"
+
+            if self.state == HALF_OPEN:
+                self.probe_in_flight = False
+                if ok:
+                    self.state = CLOSED
+                    self.calls.clear()
+                else:
+                    self._open(now)
+                return
+
+            self.calls.append((now, ok, latency))
+            self._trim(now)
+            failures = sum(1 for _, c_ok, _ in self.calls if not c_ok)
+            if len(self.calls) >= MIN_CALLS and failures / len(self.calls) >= failure_rate:
+                self._open(now)
+
+    def abandon(self):
+        """
+        A call that was let through ended without an outcome (cancelled).
+        """
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.probe_in_flight = False
+
+    def _open(self, now):
+        if self.state != OPEN:
+            print(f"[circuit_breaker] {self.name} OPEN ({self.last_error})")
+        self.state = OPEN
+        self.opened_at = now
+
+    def reset(self):
+        with self._lock:
+            self.state = CLOSED
+            self.calls.clear()
+            self.probe_in_flight = False
+
+    def snapshot(self):
+        with self._lock:
+            self._trim(time.time())
+            n = len(self.calls)
+            failures = sum(1 for _, ok, _ in self.calls if not ok)
+            latencies = sorted(lat for _, _, lat in self.calls)
+            return {
+                "provider": self.name,
+                "state": self.state,
+                "calls": n,
+                "error_rate": round(failures / n, 2) if n else 0.0,
+                "p50_ms": int(latencies[n // 2] * 1000) if n else None,
+                "max_ms": int(latencies[-1] * 1000) if n else None,
+                "short_circuited": self.short_circuited,
+                "last_error": self.last_error,
+            }
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(provider):
+    with _breakers_lock:
+        if provider not in _breakers:
+            _breakers[provider] = CircuitBreaker(provider)
+        return _breakers[provider]
+
+
+def is_open(provider):
+    return get_breaker(provider).state == OPEN
+
+
+def _timeout(provider):
+    return PROVIDER_TIMEOUTS.get(provider, (3, 10))
+
+
+async def http_get_async(provider, url, count_slow=True, **kwargs):
+    """
+    GET through the provider's breaker on the loop's pooled httpx client (see
+    aio.get_client), with the provider timeout.
+    Raises CircuitOpenError without making a request while the breaker is open.
+    5xx / 429 responses count as failures (the response is still returned),
+    as do responses slower than breaker_slow_seconds unless count_slow=False.
+    """
+    import httpx
+    import aio
+
+    breaker = get_breaker(provider)
+    if not breaker.allow():
+        raise CircuitOpenError(f"{provider} circuit open, skipping request")
+
+    connect, read = _timeout(provider)
+    kwargs.setdefault("timeout", httpx.Timeout(read, connect=connect))
+    start = time.time()
+    try:
+        resp = await aio.get_client().get(url, **kwargs)
+    except Exception as e:
+        breaker.record(False, time.time() - start, error=str(e) or type(e).__name__, count_slow=count_slow)
+        raise
+    except BaseException:
+        breaker.abandon()  # CancelledError: otherwise a cancelled probe leaves the breaker half-open for good
+        raise
+    failed = resp.status_code >= 500 or resp.status_code == 429
+    breaker.record(not failed, time.time() - start, error=f"HTTP {resp.status_code}" if failed else None,
+                   count_slow=count_slow)
+    return resp
+
+
+def all_states():
+    """
+    Snapshot of every known provider (for the admin panel).
+    """
+    for provider in PROVIDER_TIMEOUTS:
+        get_breaker(provider)
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return [b.snapshot() for b in breakers]
+
+
+def reset_all():
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    for b in breakers:
+        b.reset()
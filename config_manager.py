@@ -1,15 +1,31 @@
 import json
 import os
 import time
-from typing import Dict, Any
+import uuid
+import threading
+from types import MappingProxyType
+from typing import Dict, Any, Mapping
 
 CONFIG_FILE = "config.json"
+CONFIG_POLL_SECONDS = 1.0  # How often the watcher stats config.json
 
 DEFAULT_CONFIG = {
     "model_name": "gemini-2.5-flash",
     "temperature": 0.7,
     "customized_scoring_method": False,
     "cache_ttl_hours": 240,
+    "cache_hard_expiry_hours": 720,
+    "cache_revalidate_workers": 2,
+    "static_cache_ttl_hours": 2160,
+    "cache_max_mb": 512,
+    "cache_max_entries": 50000,
+    "breaker_failure_rate": 0.5,
+    "breaker_slow_seconds": 4.0,
+    "breaker_open_seconds": 30,
+    "warm_off_peak_hours": [1, 2, 3, 4, 5],
+    "warm_top_n": 50,
+    "warm_lookback_days": 14,
+    "warm_budget": {"geoapify": 200, "census": 200, "rentcast": 25, "gemini": 25},
     "enable_daily_limit": True,
     "daily_limit_count": 3,
     "whitelist_emails": [],
@@ -18,19 +34,67 @@ DEFAULT_CONFIG = {
     "enable_census": True,
     "enable_llm": True,
     "strategy_word_limit": 50,
-    "bullet_word_limit": 15
+    "bullet_word_limit": 15,
+    "benchmark_scopes": ["tract", "county", "metro"],
+    "email_chart_renderer": "kaleido",
+    "map_render_mode": "auto",
+    "map_cluster_threshold": 150,
+    "api_max_concurrency": 64,
+    "http_max_connections": 500,
+    "api_queue_timeout_seconds": 10,
+    "amenity_geohash_precision": 7,
+    "poi_fetch_radius_m": 3000,
+    # Geoapify bills Places per 20 places returned, so a full page is up to 25
+    # credits; usage logs (api_calls) count requests, not credits.
+    "poi_page_size": 500,
+    "poi_max_pages": 2,
+    "acs_prefetch_scope": "tract",
+    "enable_census_trends": True,
+    "trend_vintages": [2013, 2017, 2022],
+    "hex_overlay_metric": "median_income",
+    "hex_overlay_radius_m": 3000,
+    "hex_max_cells": 1500
 }
 
+def _freeze(value):
+    """
+    Read-only copy of a JSON value: dicts become mappingproxy, lists become tuples.
+    """
+    if isinstance(value, Mapping):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+def _thaw(value):
+    """
+    Inverse of _freeze, for writing a snapshot back to JSON.
+    """
+    if isinstance(value, Mapping):
+        return {k: _thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(v) for v in value]
+    return value
+
 class ConfigManager:
+    """
+    Config reads are a pointer dereference: get_config() returns the current
+    immutable snapshot (defaults merged with config.json). A background thread
+    polls the file and swaps in a new snapshot (with a new version number)
+    when it changes, so readers never touch the file system.
+    """
     _instance = None
-    _config_cache: Dict[str, Any] = {}
-    _last_load_time = 0
-    _last_mtime = 0
 
     def __new__(cls):
+        # No file system work here: the instance is created at import time,
+        # the config file is only loaded on first use (see get_config).
         if cls._instance is None:
             cls._instance = super(ConfigManager, cls).__new__(cls)
-            cls._instance._ensure_config_exists()
+            cls._instance._current = None  # (version, snapshot)
+            cls._instance._file_sig = None  # (mtime_ns, size) of the loaded file
+            cls._instance._lock = threading.Lock()
+            cls._instance._start_lock = threading.Lock()
+            cls._instance._watcher = None
         return cls._instance
 
     def _ensure_config_exists(self):
@@ -40,55 +104,109 @@ class ConfigManager:
         else:
             print(f"[ConfigManager] Config file found at {os.path.abspath(CONFIG_FILE)}")
 
-    def get_config(self) -> Dict[str, Any]:
+    def _file_signature(self):
+        try:
+            st = os.stat(CONFIG_FILE)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def _swap(self, file_config, sig):
         """
-        Get configuration, reloading from disk if file has changed.
-        Checks file modification time.
+        Publish a new snapshot. Caller must hold self._lock.
         """
-        try:
-            if not os.path.exists(CONFIG_FILE):
-                print("[ConfigManager] Config file missing during get_config, returning defaults.")
-                return DEFAULT_CONFIG.copy()
-
-            mtime = os.path.getmtime(CONFIG_FILE)
-            
-            # Reload if file changed or cache is empty
-            if mtime > self._last_mtime or not self._config_cache:
-                print(f"[ConfigManager] Reloading config from disk. Disk mtime: {mtime}, Last mtime: {self._last_mtime}")
+        config = dict(DEFAULT_CONFIG)
+        config.update(file_config)
+        version = self._current[0] + 1 if self._current else 1
+        self._current = (version, _freeze(config))
+        self._file_sig = sig
+
+    def _reload(self, force=False):
+        """
+        Re-read config.json if its signature changed. Keeps the previous
+        snapshot if the file is missing or unparsable.
+        """
+        sig = self._file_signature()
+        with self._lock:
+            if not force and sig == self._file_sig and self._current is not None:
+                return False
+            if sig is None:
+                if self._current is None:
+                    print("[ConfigManager] Config file missing, using defaults.")
+                    self._swap({}, None)
+                return False
+            try:
                 with open(CONFIG_FILE, 'r') as f:
-                    self._config_cache = json.load(f)
-                self._last_mtime = mtime
-                self._last_load_time = time.time()
-            else:
-                # print("[ConfigManager] logic: returning cached config") # Uncomment for verbose spam
-                pass
-                
-            # Merge with defaults to ensure all keys exist
-            config = DEFAULT_CONFIG.copy()
-            config.update(self._config_cache)
-            return config
-            
-        except Exception as e:
-            print(f"[ConfigManager] Error reading config: {e}")
-            return DEFAULT_CONFIG.copy()
+                    file_config = json.load(f)
+            except Exception as e:
+                print(f"[ConfigManager] Error reading config: {e}")
+                if self._current is None:
+                    self._swap({}, None)
+                return False
+            self._swap(file_config, sig)
+            print(f"[ConfigManager] Loaded config version {self._current[0]} from disk.")
+            return True
+
+    def _watch(self):
+        while True:
+            time.sleep(CONFIG_POLL_SECONDS)
+            try:
+                self._reload()
+            except Exception as e:
+                print(f"[ConfigManager] Watcher error: {e}")
+
+    def _start(self):
+        # First use: load synchronously, then hand over to the watcher thread
+        with self._start_lock:
+            if self._watcher is not None:
+                return
+            self._ensure_config_exists()
+            self._reload()
+            self._watcher = threading.Thread(target=self._watch, name="config-watcher", daemon=True)
+            self._watcher.start()
+
+    def get_config(self) -> Mapping[str, Any]:
+        """
+        Current config snapshot (read-only mapping, defaults merged in).
+        Use dict(snapshot) to get an editable copy.
+        """
+        if self._watcher is None:
+            self._start()
+        return self._current[1]
+
+    @property
+    def version(self) -> int:
+        """
+        Increments every time a new snapshot is published.
+        """
+        self.get_config()
+        return self._current[0]
 
     def save_config(self, new_config: Dict[str, Any]):
         """
         Save configuration to disk.
+        Written to a temp file and renamed over config.json, so readers
+        (including other processes) see either the old or the new file.
         """
+        tmp = f"{CONFIG_FILE}.{uuid.uuid4().hex}.tmp"
         try:
             print(f"[ConfigManager] Saving config to {os.path.abspath(CONFIG_FILE)}...")
-            with open(CONFIG_FILE, 'w') as f:
-                json.dump(new_config, f, indent=4)
-            
-            # Update cache immediately
-            self._config_cache = new_config
-            self._last_mtime = os.path.getmtime(CONFIG_FILE)
-            self._last_load_time = time.time()
-            print("[ConfigManager] Config saved and cache updated.")
+            data = _thaw(new_config)
+            with open(tmp, 'w') as f:
+                json.dump(data, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, CONFIG_FILE)
+
+            # Publish immediately instead of waiting for the watcher
+            with self._lock:
+                self._swap(data, self._file_signature())
+            print(f"[ConfigManager] Config saved (version {self._current[0]}).")
             return True
         except Exception as e:
             print(f"[ConfigManager] Error saving config: {e}")
+            if os.path.exists(tmp):
+                os.remove(tmp)
             return False
 
 # Global instance
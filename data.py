@@ -1,19 +1,26 @@
-import requests
+import asyncio
 import urllib.parse
 import random
 import datetime
 import state_data
-import state_data
+import benchmark_engine
+import aio
+import singleflight
+import circuit_breaker
+import revalidate
+from singleflight import normalize_address
 from config_manager import config_manager
-from supabase import create_client, Client # Ensure supabase is in requirements
-import os
 import hashlib
-import pickle
+import cache_codec
+import cache_store
 import json
 from functools import lru_cache
 
 CACHE_DIR = "analysis_cache"
 
+# poi_collection, geoid_resolver and census_trends pull in numpy; they're
+# imported where used so importing data (every app run) stays cheap.
+
 def log_debug(msg):
     try:
         with open("debug_log.txt", "a", encoding="utf-8") as f:
@@ -21,9 +28,87 @@ def log_debug(msg):
     except Exception:
         pass
 
-def get_coordinates(address, api_key):
+def _cache_path(prefix, key_data):
+    key_str = json.dumps(key_data, sort_keys=True, default=str).encode('utf-8')
+    return cache_codec.cache_file(CACHE_DIR, f"{prefix}_{hashlib.md5(key_str).hexdigest()}")
+
+def read_cache(prefix, key_data, ttl_hours):
+    """
+    Generic cache lookup in CACHE_DIR ({prefix}_{md5}.cache). None if missing/expired.
+    """
+    try:
+        return cache_store.read(_cache_path(prefix, key_data), max_age=ttl_hours * 3600)
+    except Exception as e:
+        print(f"Cache Read Error ({prefix}): {e}")
+    return None
+
+def write_cache(prefix, key_data, value):
+    try:
+        address = key_data.get("address") if isinstance(key_data, dict) else None
+        cache_store.write(_cache_path(prefix, key_data), value, address=address)
+    except Exception as e:
+        print(f"Cache Save Error ({prefix}): {e}")
+
+# Async code must not call the two helpers above directly: cache_store takes
+# flocks (polling with time.sleep), fsyncs and bumps the stats file, which would
+# stall every coroutine on the shared loop (aio's, or uvicorn's in api_service).
+async def read_cache_async(prefix, key_data, ttl_hours):
+    return await asyncio.to_thread(read_cache, prefix, key_data, ttl_hours)
+
+async def write_cache_async(prefix, key_data, value):
+    await asyncio.to_thread(write_cache, prefix, key_data, value)
+
+# POIs: one wide fetch per location (POI_GROUPS, poi_fetch_radius_m), consumers
+# take radius / category subsets of it locally. POI_RADIUS_M is the app's view.
+POI_GROUPS = {
+    "food": "catering",
+    "shopping": "commercial",
+    "education": "education",
+    "leisure": "leisure",
+    "healthcare": "healthcare",
+    "transit": "public_transport",
+}
+POI_RADIUS_M = 1000
+
+def poi_fetch_radius():
+    return config_manager.get_config().get("poi_fetch_radius_m", 3000)
+
+# Geocodes and census results barely change; POIs follow cache_ttl_hours.
+def _static_ttl():
+    return config_manager.get_config().get("static_cache_ttl_hours", 2160)
+
+def geocode_cache_key(address):
+    return {"address": normalize_address(address)}
+
+def poi_cache_key(address, lat, lon):
+    return {"address": normalize_address(address), "lat": round(float(lat), 5), "lon": round(float(lon), 5),
+            "radius": poi_fetch_radius(), "groups": sorted(POI_GROUPS)}
+
+def census_cache_key(address):
+    return {"address": normalize_address(address)}
+
+def cached_coordinates(address):
+    return read_cache("geo", geocode_cache_key(address), _static_ttl())
+
+def cached_pois(address, lat, lon, radius_m=POI_RADIUS_M, categories=None):
+    """
+    Cached wide POI set for the location, subset locally. None if not cached.
+    """
+    from poi_collection import POICollection
+    cached = read_cache("poi", poi_cache_key(address, lat, lon), config_manager.get_config().get("cache_ttl_hours", 240))
+    return POICollection.from_dict(cached).within(radius_m, categories) if cached is not None else None
+
+def cached_census(address):
+    return read_cache("census", census_cache_key(address), _static_ttl())
+
+# Fetchers are async-first (aio / circuit_breaker.http_get_async); the sync
+# functions the app uses are thin wrappers running them on aio's background loop.
+
+@singleflight.singleflight_async("geocode", key_fn=lambda address, api_key: (normalize_address(address),))
+async def get_coordinates_async(address, api_key):
     """
     Get coordinates for an address using Geoapify Geocoding API.
+    Successful lookups are cached (geo_*.cache, static_cache_ttl_hours).
     """
     if not config_manager.get_config().get("enable_geoapify", True):
         # Return default if disabled
@@ -32,56 +117,131 @@ def get_coordinates(address, api_key):
     if not api_key:
         return 40.785091, -73.968285
 
+    cached = await asyncio.to_thread(cached_coordinates, address)
+    if cached:
+        return cached
+
     encoded_address = urllib.parse.quote(address)
     url = f"https://api.geoapify.com/v1/geocode/search?text={encoded_address}&apiKey={api_key}"
     
     try:
-        resp = requests.get(url)
+        resp = await circuit_breaker.http_get_async("geoapify", url)
         if resp.status_code == 200:
             data = resp.json()
             if data['features']:
                 coords = data['features'][0]['geometry']['coordinates']
+                await write_cache_async("geo", geocode_cache_key(address), (coords[1], coords[0]))
                 return coords[1], coords[0] # Lat, Lon
     except Exception as e:
         print(f"Error fetching coordinates: {e}")
         
     return 40.785091, -73.968285
 
-def get_poi(address, api_key=None, lat=None, lon=None):
+def get_coordinates(address, api_key):
     """
-    Fetch POIs around the address using Geoapify Places API.
+    Sync wrapper of get_coordinates_async.
     """
-    if not config_manager.get_config().get("enable_geoapify", True):
-        # Return only coords (default) and empty POIs
-        if lat is None or lon is None:
-            lat, lon = get_coordinates(address, api_key)
-        return [], lat, lon
+    return aio.run(get_coordinates_async(address, api_key))
+
+async def _fetch_poi_group(group, categories, lat, lon, radius, api_key, api_calls):
+    """
+    All pages of one category group within radius (nearest first). Raises on failure.
+    Every request sent is counted in api_calls["geoapify"].
+    """
+    config = config_manager.get_config()
+    page_size = config.get("poi_page_size", 500)  # Geoapify's maximum
+    max_pages = config.get("poi_max_pages", 2)
+    url = "https://api.geoapify.com/v2/places"
+    features = []
+    for page in range(max_pages):
+        params = {
+            "categories": categories,
+            "filter": f"circle:{lon},{lat},{radius}",
+            "bias": f"proximity:{lon},{lat}",
+            "limit": page_size,
+            "offset": page * page_size,
+            "apiKey": api_key,
+        }
+        resp = await circuit_breaker.http_get_async("geoapify", url, params=params)
+        api_calls["geoapify"] += 1
+        resp.raise_for_status()
+        batch = resp.json()['features']
+        features.extend(batch)
+        if len(batch) < page_size:
+            break
+    return features
+
+def _dedupe_features(features):
+    # A place can be listed under several groups (e.g. catering + commercial)
+    seen, unique = set(), []
+    for f in features:
+        props = f.get("properties", {})
+        key = props.get("place_id") or (props.get("name"), props.get("lat"), props.get("lon"))
+        if key not in seen:
+            seen.add(key)
+            unique.append(f)
+    return unique
 
+@singleflight.singleflight_async("poi_wide", key_fn=lambda address, api_key, lat, lon: (normalize_address(address), lat, lon))
+async def get_poi_wide_async(address, api_key, lat, lon):
+    """
+    Every POI in POI_GROUPS within poi_fetch_radius_m of (lat, lon): one
+    paginated fetch per group, groups in parallel. Cached as one entry; callers
+    take subsets with .within() instead of fetching again.
+    Returns (POICollection or None if any group failed, Geoapify requests sent):
+    0 on a cache hit, otherwise one per group and page.
+    """
+    from poi_collection import POICollection
+    cached = await read_cache_async("poi", poi_cache_key(address, lat, lon), config_manager.get_config().get("cache_ttl_hours", 240))
+    if cached is not None:
+        return POICollection.from_dict(cached), 0
+
+    radius = poi_fetch_radius()
+    api_calls = {"geoapify": 0}
+    results = await asyncio.gather(
+        *(_fetch_poi_group(g, cats, lat, lon, radius, api_key, api_calls) for g, cats in POI_GROUPS.items()),
+        return_exceptions=True,
+    )
+    failed = [g for g, r in zip(POI_GROUPS, results) if isinstance(r, BaseException)]
+    if failed:
+        print(f"Error fetching POIs ({', '.join(failed)}): {next(r for r in results if isinstance(r, BaseException))}")
+        return None, api_calls["geoapify"]
+
+    pois = POICollection.from_features(_dedupe_features([f for r in results for f in r]), lat, lon)
+    await write_cache_async("poi", poi_cache_key(address, lat, lon), pois.to_dict())
+    return pois, api_calls["geoapify"]
+
+async def get_poi_async(address, api_key=None, lat=None, lon=None, radius_m=POI_RADIUS_M, categories=None, limit=None, api_calls=None):
+    """
+    POIs around the address within radius_m, optionally only some category
+    labels (poi_collection.CATEGORIES) and at most `limit`, nearest first.
+    Any radius up to poi_fetch_radius_m / category mix is served from the same
+    wide fetch (get_poi_wide_async). Returns (POICollection, lat, lon).
+    api_calls: optional usage dict; Places requests actually sent are added to
+    api_calls["geoapify"] (the geocode is not included).
+    """
+    from poi_collection import POICollection
     if lat is None or lon is None:
-        lat, lon = get_coordinates(address, api_key)
+        lat, lon = await get_coordinates_async(address, api_key)
 
-    pois = []
+    if not config_manager.get_config().get("enable_geoapify", True):
+        # Empty POIs (coords are the default ones from get_coordinates)
+        return POICollection.empty((lat, lon)), lat, lon
 
     if api_key:
-        categories = "commercial,education,leisure,catering,healthcare"
-        radius = 1000
-        limit = 30
-        
-        url = f"https://api.geoapify.com/v2/places?categories={categories}&filter=circle:{lon},{lat},{radius}&limit={limit}&apiKey={api_key}"
-        
-        try:
-            resp = requests.get(url)
-            if resp.status_code == 200:
-                pois = resp.json()['features']
-                return pois, lat, lon
-        except Exception as e:
-            print(f"Error fetching POIs: {e}")
+        pois, requests_sent = await get_poi_wide_async(address, api_key, lat, lon)
+        if api_calls is not None:
+            api_calls["geoapify"] = api_calls.get("geoapify", 0) + requests_sent
+        if pois is not None:
+            return pois.within(radius_m, categories, limit), lat, lon
 
-    if not api_key:
+    # No key, or Geoapify is down (breaker open): mock POIs instead of waiting
+    mock = []
+    if not api_key or circuit_breaker.is_open("geoapify"):
         mock_cats = ['cafe', 'school', 'park', 'gym', 'supermarket']
         for _ in range(10):
             cat = random.choice(mock_cats)
-            pois.append({
+            mock.append({
                 "properties": {
                     "name": f"Mock {cat.title()}",
                     "category": cat,
@@ -90,16 +250,29 @@ def get_poi(address, api_key=None, lat=None, lon=None):
                     "lon": lon + random.uniform(-0.01, 0.01)
                 }
             })
-            
-    return pois, lat, lon
 
-@lru_cache(maxsize=100)
-def fetch_acs_benchmark_income(region_type, region_code):
+    return POICollection.from_features(mock, lat, lon).within(radius_m, categories, limit), lat, lon
+
+def get_poi(address, api_key=None, lat=None, lon=None, radius_m=POI_RADIUS_M, categories=None, limit=None, api_calls=None):
+    """
+    Sync wrapper of get_poi_async.
+    """
+    return aio.run(get_poi_async(address, api_key, lat=lat, lon=lon, radius_m=radius_m, categories=categories, limit=limit,
+                                 api_calls=api_calls))
+
+_INCOME_BENCHMARKS = {}  # (region_type, region_code) -> [pct_low, pct_mid, pct_high]
+
+@singleflight.singleflight_async("acs_income")
+async def fetch_acs_benchmark_income_async(region_type, region_code):
     """
     Fetches B19001 income variables for a specific region (state check or US).
     Returns [pct_low, pct_mid, pct_high].
     Cached to avoid repeated API calls.
     """
+    cached = _INCOME_BENCHMARKS.get((region_type, region_code))
+    if cached is not None:
+        return list(cached)
+
     url = "https://api.census.gov/data/2022/acs/acs5"
     
     # Variables: Total, <50k (2-10), 50-150k (11-15), 150k+ (16-17)
@@ -116,47 +289,94 @@ def fetch_acs_benchmark_income(region_type, region_code):
     else:
         params["for"] = f"state:{region_code}"
         
+    result = [0, 0, 0]
     try:
-        r = requests.get(url, params=params, timeout=5)
+        r = await circuit_breaker.http_get_async("census_acs", url, params=params)
         if r.status_code == 200:
-            data = r.json()
-            if len(data) > 1:
-                # data[0] is headers, data[1] is values
-                # headers: NAME, B19001_001E, ...
-                headers = data[0]
-                values = data[1]
-                
-                # Map codes to values
-                val_map = {}
-                for idx, h in enumerate(headers):
-                    try:
-                         val_map[h] = float(values[idx]) if values[idx] else 0
-                    except:
-                        val_map[h] = 0
-                        
-                total_hh = val_map.get("B19001_001E", 0)
-                if total_hh == 0:
-                    return [0, 0, 0]
-                    
-                # <50k: 002E to 010E
-                inc_low = sum(val_map.get(f"B19001_{i:03d}E", 0) for i in range(2, 11))
-                
-                # 50k-150k: 011E to 015E
-                inc_mid = sum(val_map.get(f"B19001_{i:03d}E", 0) for i in range(11, 16))
-                
-                # >150k: 016E to 017E
-                inc_high = sum(val_map.get(f"B19001_{i:03d}E", 0) for i in range(16, 18))
-                
-                return [
-                    round(inc_low / total_hh * 100, 1),
-                    round(inc_mid / total_hh * 100, 1),
-                    round(inc_high / total_hh * 100, 1)
-                ]
+            result = _income_distribution(r.json())
     except Exception as e:
         print(f"Benchmark Fetch Error ({region_type}): {e}")
         
+    _INCOME_BENCHMARKS[(region_type, region_code)] = result
+    return list(result)
+
+def fetch_acs_benchmark_income(region_type, region_code):
+    """
+    Sync wrapper of fetch_acs_benchmark_income_async.
+    """
+    return aio.run(fetch_acs_benchmark_income_async(region_type, region_code))
+
+def _income_distribution(data):
+    """
+    [pct_low, pct_mid, pct_high] from a B19001_001E..017E ACS response.
+    """
+    if len(data) > 1:
+        # data[0] is headers, data[1] is values
+        # headers: NAME, B19001_001E, ...
+        headers = data[0]
+        values = data[1]
+        
+        # Map codes to values
+        val_map = {}
+        for idx, h in enumerate(headers):
+            try:
+                 val_map[h] = float(values[idx]) if values[idx] else 0
+            except:
+                val_map[h] = 0
+                
+        total_hh = val_map.get("B19001_001E", 0)
+        if total_hh == 0:
+            return [0, 0, 0]
+            
+        # <50k: 002E to 010E
+        inc_low = sum(val_map.get(f"B19001_{i:03d}E", 0) for i in range(2, 11))
+        
+        # 50k-150k: 011E to 015E
+        inc_mid = sum(val_map.get(f"B19001_{i:03d}E", 0) for i in range(11, 16))
+        
+        # >150k: 016E to 017E
+        inc_high = sum(val_map.get(f"B19001_{i:03d}E", 0) for i in range(16, 18))
+        
+        return [
+            round(inc_low / total_hh * 100, 1),
+            round(inc_mid / total_hh * 100, 1),
+            round(inc_high / total_hh * 100, 1)
+        ]
     return [0, 0, 0]
 
+# Compared against the tract's other block groups (CensusDataService.neighborhood_context)
+NEIGHBORHOOD_METRICS = {
+    "B19013_001E": "median_income",
+    "B25077_001E": "median_home_value",
+    "B25064_001E": "median_rent",
+}
+
+@singleflight.singleflight_async(
+    "acs_prefetch",
+    key_fn=lambda service, state, county, tract, county_wide=False: (service.acs_base_url, state, county, "*" if county_wide else tract)
+)
+async def _prefetch_block_groups_async(service, state, county, tract, county_wide=False):
+    """
+    Every block group of a tract (or its whole county) in one wildcard query
+    per variable batch, cached as one entry per tract. The requested tract is
+    written before returning; the other tracts of a county prefetch are
+    written in the background. None if any batch failed.
+    """
+    scope = "*" if county_wide else tract
+    results, complete = await service._fetch_acs_rows_async("block group:*", f"state:{state} county:{county} tract:{scope}", bulk=True)
+    if not complete:
+        return None
+    tracts = {}
+    for geoid, values in results.items():
+        tracts.setdefault(geoid[:11], {})[geoid] = values
+    tract_id = f"{state}{county}{tract}"
+    if tract_id in tracts:
+        await asyncio.to_thread(service._store_tracts, {tract_id: tracts.pop(tract_id)})
+    if tracts and not revalidate.schedule(("acs_prefetch", service.acs_base_url, state, county), service._store_tracts, tracts):
+        print(f"DEBUG: ACS prefetch: background write queue full, {len(tracts)} tracts not cached")
+    print(f"DEBUG: ACS prefetch fetched {len(results)} block groups ({state}{county} tract {scope})")
+    return results
+
 class CensusDataService:
     def __init__(self, geo_key=None):
         self.geo_key = geo_key
@@ -212,11 +432,19 @@ class CensusDataService:
             "B01001_044E":"Age_F_65_66", "B01001_045E":"Age_F_67_69", "B01001_046E":"Age_F_70_74", "B01001_047E":"Age_F_75_79", "B01001_048E":"Age_F_80_84", "B01001_049E":"Age_F_85"
         }
 
-    def get_census_geoid(self, address):
+    async def get_census_geoid_async(self, address, lat=None, lon=None):
         """
         Step 1: Convert address to Block Group GEOID.
-        Attempts Census Geocoder first, then falls back to Coordinate->FCC API.
+        With known coordinates the offline TIGER resolver (geoid_resolver) is
+        tried first. Otherwise (or outside the built states) the Census Geocoder,
+        then Coordinate->FCC API.
         """
+        import geoid_resolver
+        if lat is not None and lon is not None:
+            local = geoid_resolver.resolve(lat, lon)
+            if local:
+                return local
+
         # A. Try Census Geocoder (Good for standard addresses)
         params = {
             "address": address,
@@ -227,7 +455,7 @@ class CensusDataService:
         }
         
         try:
-            resp = requests.get(self.geocoder_url, params=params, timeout=5)
+            resp = await circuit_breaker.http_get_async("census_geocoder", self.geocoder_url, params=params)
             if resp.status_code == 200:
                 data = resp.json()
                 matches = data.get('result', {}).get('addressMatches', [])
@@ -245,7 +473,11 @@ class CensusDataService:
 
         # B. Fallback: Geoapify -> FCC Block API (Good for landmarks/pois)
         log_debug("Fallback: Using Geoapify + FCC API")
-        lat, lon = get_coordinates(address, self.geo_key) # Uses default if no key, but assume key is likely present or defaulting to NY
+        if lat is None or lon is None:
+            lat, lon = await get_coordinates_async(address, self.geo_key) # Uses default if no key, but assume key is likely present or defaulting to NY
+            local = geoid_resolver.resolve(lat, lon)
+            if local:
+                return local
         
         # If get_coordinates returns default coordinates because of missing key, this might not be accurate for arbitrary input,
         # but better than failing.
@@ -260,7 +492,7 @@ class CensusDataService:
         
         try:
             print(f"DEBUG: Calling FCC API with lat={lat}, lon={lon}")
-            r = requests.get(fcc_url, params=params, timeout=5)
+            r = await circuit_breaker.http_get_async("fcc", fcc_url, params=params)
             if r.status_code == 200:
                 data = r.json()
                 print(f"DEBUG: FCC Response: {data}")
@@ -287,72 +519,171 @@ class CensusDataService:
             
         return None
 
-    def get_acs_data(self, geoid_data):
+    def get_census_geoid(self, address, lat=None, lon=None):
+        return aio.run(self.get_census_geoid_async(address, lat=lat, lon=lon))
+
+    def _acs_cache_key(self, geoid):
+        return {"dataset": self.acs_base_url, "geoid": geoid}
+
+    def _tract_cache_key(self, tract_id):
+        return {"dataset": self.acs_base_url, "tract_block_groups": tract_id}
+
+    async def _fetch_acs_rows_async(self, geo_for, geo_in, bulk=False):
         """
-        Step 2: Query ACS Data for the Block Group.
+        ({geoid: {code: value}}, complete) for every block group matching
+        for/in (wildcards allowed), merged over the variable batches, which are
+        fetched concurrently. complete is False if a batch failed.
+        bulk: wildcard prefetch, slow by nature; exempt from the breaker's slow-call count.
         """
-        if not geoid_data:
-            return None
-            
-        state = geoid_data['state']
-        county = geoid_data['county']
-        tract = geoid_data['tract']
-        bg = geoid_data['block_group']
-        
         all_vars = list(self.variables.keys())
         # ACS API limit is usually 50 variables. We have ~80.
         chunk_size = 20
         
-        combined_result = {}
-        
-        for i in range(0, len(all_vars), chunk_size):
-            chunk = all_vars[i:i+chunk_size]
+        async def fetch_batch(batch_no, chunk):
             vars_str = ",".join(chunk)
             
             # https://api.census.gov/data/2024/acs/acs5?get=NAME,B19013_001E...&for=block group:X&in=state:xx county:xxx tract:xxxxxx
             params = {
                 "get": f"NAME,{vars_str}",
-                "for": f"block group:{bg}",
-                "in": f"state:{state} county:{county} tract:{tract}"
+                "for": geo_for,
+                "in": geo_in
             }
             
             try:
-                print(f"DEBUG: Fetching ACS Data Batch {i//chunk_size + 1}...")
+                print(f"DEBUG: Fetching ACS Data Batch {batch_no} ({geo_for} in {geo_in})...")
 
-                r = requests.get(self.acs_base_url, params=params)
+                r = await circuit_breaker.http_get_async("census_acs", self.acs_base_url, params=params, count_slow=not bulk)
                 
                 if r.status_code == 200:
-                    rows = r.json()
-                    if len(rows) > 1:
-                        headers = rows[0]
-                        data_row = rows[1]
-                        
-                        # Map back to readable keys
-                        for code, label in self.variables.items():
-                            if code in headers:
-                                idx = headers.index(code)
-                                val = data_row[idx]
-                                if val:
-                                    try:
-                                        num_val = float(val)
-                                        if num_val >= 0: # -666666666 means missing
-                                            if num_val.is_integer():
-                                                combined_result[code] = int(num_val)
-                                            else:
-                                                combined_result[code] = num_val
-                                    except ValueError:
-                                        pass
-                else:
-                    print(f"DEBUG: ACS Batch {i//chunk_size + 1} Failed: {r.status_code}")
+                    return r.json()
+                print(f"DEBUG: ACS Batch {batch_no} Failed: {r.status_code}")
             except Exception as e:
                 print(f"ACS API Error: {e}")
-                
+            return None
+
+        batches = await asyncio.gather(*(
+            fetch_batch(i // chunk_size + 1, all_vars[i:i + chunk_size])
+            for i in range(0, len(all_vars), chunk_size)
+        ))
+        results = {}
+        for rows in batches:
+            if not rows or len(rows) < 2:
+                continue
+            headers = rows[0]
+            geo_cols = [headers.index(c) for c in ("state", "county", "tract", "block group")]
+            codes = [(code, headers.index(code)) for code in self.variables if code in headers]
+            for data_row in rows[1:]:
+                combined_result = results.setdefault("".join(data_row[i] for i in geo_cols), {})
+                # Map back to readable keys
+                for code, idx in codes:
+                    val = data_row[idx]
+                    if val:
+                        try:
+                            num_val = float(val)
+                            if num_val >= 0: # -666666666 means missing
+                                if num_val.is_integer():
+                                    combined_result[code] = int(num_val)
+                                else:
+                                    combined_result[code] = num_val
+                        except ValueError:
+                            pass
+        return results, all(rows is not None for rows in batches)
+
+    def _store_tracts(self, tracts):
+        """
+        One cache entry per tract: {block group geoid: values}.
+        """
+        for tract_id, block_groups in tracts.items():
+            write_cache("acs", self._tract_cache_key(tract_id), block_groups)
+
+    async def get_acs_data_async(self, geoid_data):
+        """
+        Step 2: Query ACS Data for the Block Group.
+        Values are cached per tract (all its block groups in one acs_* entry).
+        On a miss the whole tract or county (acs_prefetch_scope) is fetched with
+        a "block group:*" query, so nearby properties resolve from the cache.
+        A single block group fetched without the prefetch is cached on its own.
+        """
+        if not geoid_data:
+            return None
+            
+        state = geoid_data['state']
+        county = geoid_data['county']
+        tract = geoid_data['tract']
+        bg = geoid_data['block_group']
+        geoid = f"{state}{county}{tract}{bg}"
+
+        block_groups = await read_cache_async("acs", self._tract_cache_key(f"{state}{county}{tract}"), _static_ttl())
+        if block_groups and geoid in block_groups:
+            return block_groups[geoid] or None
+        cached = await read_cache_async("acs", self._acs_cache_key(geoid), _static_ttl())
+        if cached is not None:
+            return cached or None
+
+        scope = config_manager.get_config().get("acs_prefetch_scope", "tract")
+        if scope in ("tract", "county"):
+            results = await _prefetch_block_groups_async(self, state, county, tract, county_wide=(scope == "county"))
+            if results is not None and geoid in results:
+                return results[geoid] or None
+
+        # Prefetch off or failed: just this block group, whatever batches succeeded
+        results, complete = await self._fetch_acs_rows_async(
+            f"block group:{bg}", f"state:{state} county:{county} tract:{tract}"
+        )
+        combined_result = results.get(geoid)
+        if combined_result and complete:
+            await write_cache_async("acs", self._acs_cache_key(geoid), combined_result)
         return combined_result if combined_result else None
 
-    def compare_with_benchmarks(self, local_data, geoid_data):
+    def neighborhood_context(self, geoid_data, acs_data):
+        """
+        This block group against the other block groups of its tract, from the
+        cache only (filled by the prefetch): {"block_groups": n, "median_income":
+        {"local", "tract_median", "percentile"}, ...}. None if the siblings
+        aren't cached.
+        """
+        if not geoid_data or not acs_data:
+            return None
+        tract_id = f"{geoid_data['state']}{geoid_data['county']}{geoid_data['tract']}"
+        block_groups = read_cache("acs", self._tract_cache_key(tract_id), _static_ttl())
+        if not block_groups or len(block_groups) < 2:
+            return None
+        siblings = [v for v in block_groups.values() if v]
+
+        context = {"block_groups": len(siblings)}
+        for code, name in NEIGHBORHOOD_METRICS.items():
+            local = acs_data.get(code)
+            values = sorted(v[code] for v in siblings if v.get(code) is not None)
+            if local is None or len(values) < 2:
+                continue
+            mid = len(values) // 2
+            median = values[mid] if len(values) % 2 else (values[mid - 1] + values[mid]) / 2
+            below = sum(1 for v in values if v < local)
+            context[name] = {
+                "local": local,
+                "tract_median": median,
+                "percentile": round(100 * below / (len(values) - 1)),
+            }
+        return context
+
+    def get_acs_data(self, geoid_data):
+        return aio.run(self.get_acs_data_async(geoid_data))
+
+    async def compare_with_benchmarks_async(self, local_data, geoid_data):
+        import census_trends
+        state_income, us_income, trends = await asyncio.gather(
+            fetch_acs_benchmark_income_async("state", geoid_data['state']),
+            fetch_acs_benchmark_income_async("us", "1"),
+            census_trends.get_trends_async(geoid_data),
+        )
+        return self.compare_with_benchmarks(local_data, geoid_data, income_dists=(state_income, us_income), trends=trends)
+
+    def compare_with_benchmarks(self, local_data, geoid_data, income_dists=None, trends=None):
         """
         Step 3: Compare local results with State Benchmarks.
         Returns standardized structure: { key: { 'local': val, 'state': val, 'national': val } }
+        income_dists: prefetched (state, us) income distributions (async path).
+        trends: census_trends.get_trends_async() result, kept under output["trends"].
         """
         if local_data is None:
             local_data = {}
@@ -387,8 +718,13 @@ class CensusDataService:
         benchmarks["us_race_dist"] = benchmarks.get("us_race", [0,0,0,0,0])
 
         # NEW: Fetch dynamic income benchmarks
-        benchmarks["state_income_dist"] = fetch_acs_benchmark_income("state", state_fips)
-        benchmarks["us_income_dist"] = fetch_acs_benchmark_income("us", "1")
+        if income_dists is None:
+            income_dists = (fetch_acs_benchmark_income("state", state_fips), fetch_acs_benchmark_income("us", "1"))
+        benchmarks["state_income_dist"], benchmarks["us_income_dist"] = income_dists
+
+        # Extra scopes (Tract / County / Metro) from the precomputed local store
+        scopes = config_manager.get_config().get("benchmark_scopes", benchmark_engine.SCOPE_LEVELS)
+        benchmarks.update(benchmark_engine.get_hierarchy_benchmarks(geoid_data, scopes))
 
         # Build final object
         output = {
@@ -396,6 +732,8 @@ class CensusDataService:
             "metrics": {},
             "benchmarks": benchmarks
         }
+        if trends:
+            output["trends"] = trends
 
         # Helper to structure metric
         def make_metric(local_val, key_bench=None):
@@ -528,9 +866,11 @@ class CensusDataService:
 
         return output
 
-def get_census_data(address, geo_key=None):
+@singleflight.singleflight_async("census", key_fn=lambda address, geo_key=None, lat=None, lon=None: (normalize_address(address),))
+async def get_census_data_async(address, geo_key=None, lat=None, lon=None):
     """
     Main entry point for App to get Census Data.
+    lat/lon (or a cached geocode) let the block group be resolved offline.
     """
     log_debug(f"Starting Census Fetch for: {address}")
     try:
@@ -539,11 +879,18 @@ def get_census_data(address, geo_key=None):
             print("DEBUG: Census API Disabled in Config")
             return None
 
+        cached = await asyncio.to_thread(cached_census, address)
+        if cached:
+            log_debug("Census Cache Hit")
+            return cached
+
         service = CensusDataService(geo_key=geo_key)
+        if lat is None or lon is None:
+            lat, lon = await asyncio.to_thread(cached_coordinates, address) or (None, None)
         
         # 1. Geocode
         print(f"DEBUG: Geocoding {address}...")
-        geo_data = service.get_census_geoid(address)
+        geo_data = await service.get_census_geoid_async(address, lat=lat, lon=lon)
         log_debug(f"Geode Result: {geo_data}")
         print(f"DEBUG: Geocode Result: {geo_data}")
         
@@ -552,48 +899,70 @@ def get_census_data(address, geo_key=None):
             return None
             
         # 2. Get Data
-        acs_data = service.get_acs_data(geo_data)
+        acs_data = await service.get_acs_data_async(geo_data)
         if acs_data is None:
              print("DEBUG: ACS Data is None. Proceeding with Benchmarks only.")
         log_debug(f"ACS Result Count: {len(acs_data) if acs_data else 0}")
         
         # 3. Compare & Compile
-        final_result = service.compare_with_benchmarks(acs_data, geo_data)
+        final_result = await service.compare_with_benchmarks_async(acs_data, geo_data)
+        if final_result:
+            neighborhood = await asyncio.to_thread(service.neighborhood_context, geo_data, acs_data)
+            if neighborhood:
+                final_result['neighborhood'] = neighborhood
         log_debug(f"Final Result Keys: {final_result.keys() if final_result else 'None'}")
         
         if final_result:
             final_result['source'] = "US Census Bureau (2022 ACS 5-year)"
+            # Only cache results that include local ACS data (benchmark-only results are retried)
+            if acs_data is not None:
+                await write_cache_async("census", census_cache_key(address), final_result)
             
         return final_result
     except Exception as e:
         log_debug(f"CRITICAL ERROR in get_census_data: {e}")
         return None
 
+def get_census_data(address, geo_key=None, lat=None, lon=None):
+    """
+    Sync wrapper of get_census_data_async.
+    """
+    return aio.run(get_census_data_async(address, geo_key=geo_key, lat=lat, lon=lon))
+
+
+def rentcast_cache_key(address, bedrooms, bathrooms, sqft, property_type, kind=None):
+    """
+    Cache key for get_rentcast_data (kind=None) / get_rentcast_value (kind="value_avm").
+    """
+    key = {
+        "address": address,
+        "bedrooms": bedrooms,
+        "bathrooms": bathrooms,
+        "sqft": sqft,
+        "propertyType": property_type
+    }
+    if kind:
+        key["type"] = kind # Distinguish from rent
+    return key
 
-def get_cached_rentcast(key_data):
+def get_cached_rentcast(key_data, allow_expired=False):
     """
     Retrieve cached RentCast data.
+    Entries past cache_ttl_hours (but within cache_hard_expiry_hours) are still
+    returned, marked with _cache_meta['stale'] = True.
+    allow_expired also returns entries past the hard expiry (outage fallback).
     """
     try:
-        if not os.path.exists(CACHE_DIR):
-            return None
-            
-        # Create hash key
-        key_str = json.dumps(key_data, sort_keys=True).encode('utf-8')
-        file_hash = hashlib.md5(key_str).hexdigest()
-        filename = os.path.join(CACHE_DIR, f"rent_{file_hash}.pkl")
-        
-        if os.path.exists(filename):
-            # Check modification time (TTL: 240 hours / 10 days)
-            # Check modification time
-            mtime = os.path.getmtime(filename)
-            file_time = datetime.datetime.fromtimestamp(mtime)
-            age = datetime.datetime.now() - file_time
-            
-            ttl_hours = config_manager.get_config().get("cache_ttl_hours", 240)
-            if age.total_seconds() < ttl_hours * 3600:
-                with open(filename, 'rb') as f:
-                    return pickle.load(f)
+        filename = _cache_path("rent", key_data)
+        data, mtime = cache_store.read_entry(filename, max_age=None if allow_expired else revalidate.max_age())
+        if data:
+            # Past the hard expiry only with allow_expired: still "stale"
+            state = revalidate.cache_state(mtime) or "stale"
+            data['_cache_meta'] = {
+                'timestamp': datetime.datetime.fromtimestamp(mtime).strftime("%Y-%m-%d %H:%M:%S"),
+                'stale': state == "stale",
+            }
+            return data
     except Exception as e:
         print(f"RentCast Cache Read Error: {e}")
     return None
@@ -603,19 +972,12 @@ def save_rentcast_cache(key_data, data):
     Save RentCast data to cache.
     """
     try:
-        if not os.path.exists(CACHE_DIR):
-            os.makedirs(CACHE_DIR)
-            
-        key_str = json.dumps(key_data, sort_keys=True).encode('utf-8')
-        file_hash = hashlib.md5(key_str).hexdigest()
-        filename = os.path.join(CACHE_DIR, f"rent_{file_hash}.pkl")
-        
-        with open(filename, 'wb') as f:
-            pickle.dump(data, f)
+        cache_store.write(_cache_path("rent", key_data), data, address=key_data.get("address"))
     except Exception as e:
         print(f"RentCast Cache Save Error: {e}")
 
-def get_rentcast_data(address, bedrooms, bathrooms, sqft, property_type, api_key):
+@singleflight.singleflight_async("rent", key_fn=lambda address, bedrooms, bathrooms, sqft, property_type, api_key, force_refresh=False: (normalize_address(address), bedrooms, bathrooms, sqft, property_type, force_refresh))
+async def get_rentcast_data_async(address, bedrooms, bathrooms, sqft, property_type, api_key, force_refresh=False):
     """
     Fetch Rent Estimates and Comparables from RentCast API.
     Checks Cache First.
@@ -624,17 +986,14 @@ def get_rentcast_data(address, bedrooms, bathrooms, sqft, property_type, api_key
         return None
 
     # Check Cache
-    cache_key = {
-        "address": address,
-        "bedrooms": bedrooms,
-        "bathrooms": bathrooms,
-        "sqft": sqft,
-        "propertyType": property_type
-    }
+    cache_key = rentcast_cache_key(address, bedrooms, bathrooms, sqft, property_type)
     
-    cached = get_cached_rentcast(cache_key)
+    cached = None if force_refresh else await asyncio.to_thread(get_cached_rentcast, cache_key)
     if cached:
         print("Using Cached RentCast Data")
+        if cached['_cache_meta']['stale'] and api_key:
+            # Serve stale now, refresh in the background
+            revalidate.schedule(singleflight.make_key("rent", cache_key), get_rentcast_data, address, bedrooms, bathrooms, sqft, property_type, api_key, force_refresh=True)
         return cached
 
     if not api_key:
@@ -662,7 +1021,7 @@ def get_rentcast_data(address, bedrooms, bathrooms, sqft, property_type, api_key
     }
     
     try:
-        resp = requests.get(url, params=params, headers=headers)
+        resp = await circuit_breaker.http_get_async("rentcast", url, params=params, headers=headers)
         if resp.status_code == 200:
             data = resp.json()
             
@@ -746,7 +1105,7 @@ def get_rentcast_data(address, bedrooms, bathrooms, sqft, property_type, api_key
             }
             
             # Save to Cache
-            save_rentcast_cache(cache_key, result)
+            await asyncio.to_thread(save_rentcast_cache, cache_key, result)
             
             return result
             
@@ -756,9 +1115,19 @@ def get_rentcast_data(address, bedrooms, bathrooms, sqft, property_type, api_key
     except Exception as e:
         print(f"RentCast Execution Error: {e}")
         
-    return None
+    # RentCast failing or its breaker open: any cached copy beats nothing
+    return await asyncio.to_thread(get_cached_rentcast, cache_key, allow_expired=True)
+
+# Cross-process: the RentCast disk cache is written before the lock is released
+@singleflight.singleflight("rent", key_fn=lambda address, bedrooms, bathrooms, sqft, property_type, api_key, force_refresh=False: (normalize_address(address), bedrooms, bathrooms, sqft, property_type, force_refresh), cross_process=True)
+def get_rentcast_data(address, bedrooms, bathrooms, sqft, property_type, api_key, force_refresh=False):
+    """
+    Sync wrapper of get_rentcast_data_async.
+    """
+    return aio.run(get_rentcast_data_async(address, bedrooms, bathrooms, sqft, property_type, api_key, force_refresh=force_refresh))
 
-def get_rentcast_value(address, bedrooms, bathrooms, sqft, property_type, api_key):
+@singleflight.singleflight_async("value", key_fn=lambda address, bedrooms, bathrooms, sqft, property_type, api_key, force_refresh=False: (normalize_address(address), bedrooms, bathrooms, sqft, property_type, force_refresh))
+async def get_rentcast_value_async(address, bedrooms, bathrooms, sqft, property_type, api_key, force_refresh=False):
     """
     Fetch Property Value Estimate (AVM) from RentCast API.
     Checks Cache First.
@@ -767,18 +1136,14 @@ def get_rentcast_value(address, bedrooms, bathrooms, sqft, property_type, api_ke
         return None
 
     # Check Cache
-    cache_key = {
-        "type": "value_avm", # Distinguish from rent
-        "address": address,
-        "bedrooms": bedrooms,
-        "bathrooms": bathrooms,
-        "sqft": sqft,
-        "propertyType": property_type
-    }
+    cache_key = rentcast_cache_key(address, bedrooms, bathrooms, sqft, property_type, kind="value_avm")
     
-    cached = get_cached_rentcast(cache_key)
+    cached = None if force_refresh else await asyncio.to_thread(get_cached_rentcast, cache_key)
     if cached:
         print("Using Cached RentCast Value")
+        if cached['_cache_meta']['stale'] and api_key:
+            # Serve stale now, refresh in the background
+            revalidate.schedule(singleflight.make_key("value", cache_key), get_rentcast_value, address, bedrooms, bathrooms, sqft, property_type, api_key, force_refresh=True)
         return cached
 
     if not api_key:
@@ -800,7 +1165,7 @@ def get_rentcast_value(address, bedrooms, bathrooms, sqft, property_type, api_ke
     }
     
     try:
-        resp = requests.get(url, params=params, headers=headers)
+        resp = await circuit_breaker.http_get_async("rentcast", url, params=params, headers=headers)
         if resp.status_code == 200:
             data = resp.json()
             
@@ -811,7 +1176,7 @@ def get_rentcast_value(address, bedrooms, bathrooms, sqft, property_type, api_ke
             }
             
             # Save to Cache
-            save_rentcast_cache(cache_key, result)
+            await asyncio.to_thread(save_rentcast_cache, cache_key, result)
             
             return result
             
@@ -821,7 +1186,22 @@ def get_rentcast_value(address, bedrooms, bathrooms, sqft, property_type, api_ke
     except Exception as e:
         print(f"RentCast Value Execution Error: {e}")
         
-    return None
+    # RentCast failing or its breaker open: any cached copy beats nothing
+    return await asyncio.to_thread(get_cached_rentcast, cache_key, allow_expired=True)
+
+# Cross-process: the RentCast disk cache is written before the lock is released
+@singleflight.singleflight("value", key_fn=lambda address, bedrooms, bathrooms, sqft, property_type, api_key, force_refresh=False: (normalize_address(address), bedrooms, bathrooms, sqft, property_type, force_refresh), cross_process=True)
+def get_rentcast_value(address, bedrooms, bathrooms, sqft, property_type, api_key, force_refresh=False):
+    """
+    Sync wrapper of get_rentcast_value_async.
+    """
+    return aio.run(get_rentcast_value_async(address, bedrooms, bathrooms, sqft, property_type, api_key, force_refresh=force_refresh))
+
+@lru_cache(maxsize=4)
+def _supabase_client(supabase_url, supabase_key):
+    # One client (and its HTTP connection pool) per project, not per request
+    from supabase import create_client
+    return create_client(supabase_url, supabase_key)
 
 def get_nearby_schools_data(lat, lon, supabase_url, supabase_key, miles=3.0):
     """
@@ -831,7 +1211,7 @@ def get_nearby_schools_data(lat, lon, supabase_url, supabase_key, miles=3.0):
         return []
         
     try:
-        supabase: Client = create_client(supabase_url, supabase_key)
+        supabase = _supabase_client(supabase_url, supabase_key)
         
         # Call RPC 'get_nearby_schools'
         # user_lat, user_lon, radius_miles
@@ -16,12 +16,10 @@ def test_poi():
         pois, lat, lon = data.get_poi(addr, api_key=key)
         print(f"Lat: {lat}, Lon: {lon}")
         print(f"POI Count: {len(pois)}")
-        if pois:
-            print(f"Sample POI: {pois[0]}")
-            # Check categories explicitly
-            props = pois[0].get('properties', {})
-            print(f"Categories: {props.get('categories')}")
-            print(f"Category: {props.get('category')}")
+        if len(pois):
+            print(f"Sample POI: {next(pois.points())}")
+            # Per-category counts / nearest distance
+            print(f"Summary: {pois.summary()}")
     except Exception as e:
         print(f"Error fetching POI: {e}")
 
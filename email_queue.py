@@ -0,0 +1,270 @@
+import os
+import json
+import time
+import uuid
+import random
+import smtplib
+import threading
+
+# Background Email Delivery Queue
+# Messages are persisted to QUEUE_DIR before the request returns, then a single
+# worker thread delivers them over one long-lived authenticated SMTP connection.
+# Failed sends are retried with exponential backoff; anything still pending when
+# the process dies is picked up again by the next worker (email_utils starts one
+# at app startup when SMTP is configured).
+# Several processes (Streamlit / uvicorn workers) may run a worker on the same
+# queue: an entry is claimed by an atomic rename from pending/ into processing/
+# before it is sent, so only one of them delivers it. Claims older than
+# CLAIM_TIMEOUT_SECONDS (worker died mid-send) go back to pending/.
+
+QUEUE_DIR = "mail_queue"
+MAX_ATTEMPTS = 6
+BACKOFF_BASE_SECONDS = 5
+BACKOFF_MAX_SECONDS = 600
+IDLE_DISCONNECT_SECONDS = 120  # Drop the SMTP session before the server does
+POLL_SECONDS = 5
+CLAIM_TIMEOUT_SECONDS = 600
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def _write_json_atomic(path, payload):
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(payload, f)
+    os.replace(tmp, path)
+
+
+def enqueue(msg, from_addr, to_addr, queue_dir=QUEUE_DIR):
+    """
+    Persist a MIME message for delivery. Returns the queue entry id.
+    """
+    pending_dir = os.path.join(queue_dir, "pending")
+    os.makedirs(pending_dir, exist_ok=True)
+
+    entry_id = f"{time.time():.6f}_{uuid.uuid4().hex[:8]}"
+    _write_json_atomic(os.path.join(pending_dir, f"{entry_id}.json"), {
+        "id": entry_id,
+        "from": from_addr,
+        "to": to_addr,
+        "raw": msg.as_string(),
+        "attempts": 0,
+        "next_attempt": 0,
+        "last_error": None,
+    })
+
+    if _worker is not None:
+        _worker.wake()
+    return entry_id
+
+
+def queue_stats(queue_dir=QUEUE_DIR):
+    """
+    Counts of pending / processing / failed messages (for admin display).
+    """
+    stats = {}
+    for state in ("pending", "processing", "failed"):
+        d = os.path.join(queue_dir, state)
+        stats[state] = len([f for f in os.listdir(d) if f.endswith(".json")]) if os.path.isdir(d) else 0
+    return stats
+
+
+class EmailDeliveryWorker(threading.Thread):
+    """
+    Single consumer of the on-disk queue. Keeps one SMTP connection open while
+    there is work and reconnects transparently if the server dropped it.
+    """
+
+    def __init__(self, smtp_user, smtp_pass, host="smtp.gmail.com", port=587, queue_dir=QUEUE_DIR):
+        super().__init__(name="email-delivery", daemon=True)
+        self.smtp_user = smtp_user
+        self.smtp_pass = smtp_pass
+        self.host = host
+        self.port = port
+        self.queue_dir = queue_dir
+        self.pending_dir = os.path.join(queue_dir, "pending")
+        self.processing_dir = os.path.join(queue_dir, "processing")
+        self.failed_dir = os.path.join(queue_dir, "failed")
+        self._server = None
+        self._last_used = 0.0
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self.sent_count = 0
+        self.connect_count = 0
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self, timeout=5):
+        self._stop_event.set()
+        self._wake.set()
+        self.join(timeout)
+
+    # --- SMTP Connection ---
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=30)
+        server.ehlo()
+        if server.has_extn("starttls"):
+            server.starttls()
+            server.ehlo()
+        if self.smtp_user and self.smtp_pass:
+            server.login(self.smtp_user, self.smtp_pass)
+        self.connect_count += 1
+        return server
+
+    def _get_server(self):
+        if self._server is not None:
+            try:
+                if self._server.noop()[0] == 250:
+                    return self._server
+            except smtplib.SMTPException:
+                pass
+            except OSError:
+                pass
+            self._close()
+        self._server = self._connect()
+        return self._server
+
+    def _close(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except Exception:
+                pass
+            self._server = None
+
+    # --- Queue Processing ---
+    def _due_entries(self):
+        if not os.path.isdir(self.pending_dir):
+            return []
+        now = time.time()
+        due = []
+        for name in sorted(os.listdir(self.pending_dir)):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.pending_dir, name)
+            try:
+                with open(path, encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if entry.get("next_attempt", 0) <= now:
+                due.append((path, entry))
+        return due
+
+    def _claim(self, path):
+        """
+        Move a pending entry into processing/ and return (claimed path, entry).
+        None if another worker got it first or it is no longer due.
+        """
+        os.makedirs(self.processing_dir, exist_ok=True)
+        claimed = os.path.join(self.processing_dir, os.path.basename(path))
+        try:
+            os.rename(path, claimed)
+        except FileNotFoundError:
+            return None
+        os.utime(claimed)  # Claim time, for _recover_stale_claims
+
+        # The listing may be stale: another worker can have tried this entry
+        # and put it back with new attempts / next_attempt since.
+        try:
+            with open(claimed, encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"SMTP Queue Error (unreadable entry {os.path.basename(path)}): {e}")
+            os.makedirs(self.failed_dir, exist_ok=True)
+            os.replace(claimed, os.path.join(self.failed_dir, os.path.basename(path)))
+            return None
+        if entry.get("next_attempt", 0) > time.time():
+            os.rename(claimed, path)
+            return None
+        return claimed, entry
+
+    def _recover_stale_claims(self):
+        if not os.path.isdir(self.processing_dir):
+            return
+        cutoff = time.time() - CLAIM_TIMEOUT_SECONDS
+        for name in os.listdir(self.processing_dir):
+            path = os.path.join(self.processing_dir, name)
+            try:
+                if name.endswith(".json") and os.path.getmtime(path) < cutoff:
+                    os.makedirs(self.pending_dir, exist_ok=True)
+                    os.rename(path, os.path.join(self.pending_dir, name))
+            except OSError:
+                pass  # Recovered / finished by another worker meanwhile
+
+    def _deliver(self, path, entry):
+        """
+        Send a claimed entry (path is in processing/).
+        """
+        try:
+            server = self._get_server()
+            server.sendmail(entry["from"], entry["to"], entry["raw"])
+            self._last_used = time.time()
+            os.remove(path)
+            self.sent_count += 1
+            return True
+        except Exception as e:
+            print(f"SMTP Queue Error ({entry['to']}): {e}")
+            self._close()  # Force a fresh connection for the next attempt
+
+            entry["attempts"] = entry.get("attempts", 0) + 1
+            entry["last_error"] = str(e)
+            # A refused recipient won't start working on retry
+            permanent = isinstance(e, smtplib.SMTPRecipientsRefused)
+            if permanent or entry["attempts"] >= MAX_ATTEMPTS:
+                os.makedirs(self.failed_dir, exist_ok=True)
+                _write_json_atomic(os.path.join(self.failed_dir, os.path.basename(path)), entry)
+                os.remove(path)
+            else:
+                delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** (entry["attempts"] - 1)))
+                entry["next_attempt"] = time.time() + delay + random.uniform(0, 1)
+                _write_json_atomic(os.path.join(self.pending_dir, os.path.basename(path)), entry)
+                os.remove(path)
+            return False
+
+    def run_once(self):
+        """
+        Deliver everything that is due. Returns number of messages sent.
+        """
+        self._recover_stale_claims()
+        sent = 0
+        for path, _ in self._due_entries():
+            if self._stop_event.is_set():
+                break
+            claim = self._claim(path)
+            if claim and self._deliver(*claim):
+                sent += 1
+        return sent
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.run_once()
+
+            if self._server is not None and time.time() - self._last_used > IDLE_DISCONNECT_SECONDS:
+                self._close()
+
+            self._wake.wait(POLL_SECONDS)
+            self._wake.clear()
+        self._close()
+
+
+def start_worker(smtp_user, smtp_pass, host="smtp.gmail.com", port=587, queue_dir=QUEUE_DIR):
+    """
+    Start the process-wide delivery worker (no-op if it is already running).
+    """
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = EmailDeliveryWorker(smtp_user, smtp_pass, host=host, port=port, queue_dir=queue_dir)
+            _worker.start()
+        return _worker
+
+
+def stop_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is not None:
+            _worker.stop()
+            _worker = None
@@ -1,36 +1,171 @@
-
+import time
 import smtplib
+import threading
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from email_validator import validate_email, EmailNotValidError
 import streamlit as st
+import email_queue
+
+# Domain deliverability cache: { domain: (checked_at, error_message_or_None) }
+# The DNS lookup is the slow part of validation and its answer is per domain.
+DELIVERABILITY_TTL_SECONDS = 24 * 3600
+_DOMAIN_CACHE = {}
+_DOMAIN_CACHE_LOCK = threading.Lock()
 
 def check_email_validity(email_address):
     """
     Strictly validates an email address using email-validator.
     Returns (True, normalized_email) if valid.
     Returns (False, error_message) if invalid.
+    Syntax is checked every time; the DNS deliverability result is cached per domain.
     """
     if not email_address:
         return False, "Email address is empty."
-    
+
+    from email_validator import validate_email, EmailNotValidError, EmailUndeliverableError
+
     try:
-        # Check validity and get normalized form
-        emailinfo = validate_email(email_address, check_deliverability=True) 
-        normalized_email = emailinfo.normalized
-        return True, normalized_email
+        # Syntax + normalization only (no network)
+        emailinfo = validate_email(email_address, check_deliverability=False)
     except EmailNotValidError as e:
         # Email is not valid, exception message is human-readable
         return False, str(e)
 
+    domain = emailinfo.ascii_domain
+    with _DOMAIN_CACHE_LOCK:
+        cached = _DOMAIN_CACHE.get(domain)
+    if cached and time.time() - cached[0] < DELIVERABILITY_TTL_SECONDS:
+        error = cached[1]
+        return (False, error) if error else (True, emailinfo.normalized)
+
+    try:
+        emailinfo = validate_email(email_address, check_deliverability=True)
+        error = None
+    except EmailUndeliverableError as e:
+        error = str(e)
+    except EmailNotValidError as e:
+        # Not a domain problem, don't cache
+        return False, str(e)
+
+    with _DOMAIN_CACHE_LOCK:
+        _DOMAIN_CACHE[domain] = (time.time(), error)
+    return (False, error) if error else (True, emailinfo.normalized)
+
 from email.mime.image import MIMEImage
 
 from email.utils import formataddr
 
+def _smtp_settings():
+    """
+    SMTP settings from secrets. SMTP_HOST / SMTP_PORT allow pointing at a local
+    stand-in server for testing; defaults are Gmail.
+    """
+    return {
+        "smtp_user": st.secrets.get("GMAIL_USER"),
+        "smtp_pass": st.secrets.get("GMAIL_APP_PASSWORD"),
+        "host": st.secrets.get("SMTP_HOST", "smtp.gmail.com"),
+        "port": int(st.secrets.get("SMTP_PORT", 587)),
+    }
+
+def start_delivery_worker():
+    """
+    Start the queue worker if SMTP is configured (called at app startup), so
+    mail persisted by a previous process is delivered without waiting for a new one.
+    """
+    try:
+        settings = _smtp_settings()
+        if not settings["smtp_user"] or not settings["smtp_pass"]:
+            return None
+        return email_queue.start_worker(**settings)
+    except Exception as e:
+        print(f"Email Worker Start Error: {e}")
+        return None
+
+def _svg_to_png(svg_data):
+    """
+    Rasterize an SVG chart for mail clients (Gmail / Outlook don't render inline
+    SVG). None if cairosvg / libcairo isn't available or the conversion fails.
+    """
+    try:
+        import cairosvg
+    except (ImportError, OSError):
+        return None
+    try:
+        return cairosvg.svg2png(bytestring=svg_data)
+    except Exception as e:
+        print(f"SVG Rasterize Error: {e}")
+        return None
+
+def build_analysis_message(to_email, subject, html_content, sender, images=None):
+    """
+    Build the MIME message for a report.
+    images (dict): Optional. Dict of { 'content_id': bytes_data } to attach inline.
+                   In HTML, reference as <img src="cid:content_id">
+    """
+    # Create Message - Use 'related' for inline images
+    msg = MIMEMultipart("related")
+    msg["Subject"] = subject
+    # Use a friendly Name for the sender
+    msg["From"] = formataddr(("HouSmart AI Assistant", sender))
+
+    msg["To"] = to_email
+
+    msg_alternative = MIMEMultipart('alternative')
+    msg.attach(msg_alternative)
+
+    # Plain text version (optional fallback)
+    text_part = MIMEText("Your HouSmart Analysis Report is attached/included as HTML.", "plain")
+    msg_alternative.attach(text_part)
+
+    # HTML version
+    html_part = MIMEText(html_content, "html")
+    msg_alternative.attach(html_part)
+
+    # Attach Images
+    if images:
+        for cid, img_data in images.items():
+            if img_data:
+                disposition = 'inline'
+                # SVG (svg_charts renderer): most clients won't show it inline, send a PNG instead
+                if img_data.lstrip().startswith(b"<svg"):
+                    png = _svg_to_png(img_data)
+                    if png:
+                        img, ext = MIMEImage(png, _subtype="png"), "png"
+                    else:
+                        print(f"Warning: can't rasterize chart '{cid}' (install cairosvg), attaching the SVG as a file")
+                        img, ext = MIMEImage(img_data, _subtype="svg+xml"), "svg"
+                        disposition = 'attachment'
+                else:
+                    img, ext = MIMEImage(img_data), "png"
+                # Add Content-ID header for inline referencing
+                img.add_header('Content-ID', f'<{cid}>')
+                img.add_header('Content-Disposition', disposition, filename=f'{cid}.{ext}')
+                msg.attach(img)
+    return msg
+
+def queue_analysis_email(to_email, subject, html_content, images=None):
+    """
+    Queue a report for background delivery (see email_queue).
+    Returns immediately; the message is persisted before this returns.
+    """
+    settings = _smtp_settings()
+    if not settings["smtp_user"] or not settings["smtp_pass"]:
+        return False, "SMTP Configuration missing (GMAIL_USER or GMAIL_APP_PASSWORD)"
+
+    try:
+        msg = build_analysis_message(to_email, subject, html_content, settings["smtp_user"], images=images)
+        email_queue.start_worker(**settings)
+        email_queue.enqueue(msg, settings["smtp_user"], to_email)
+        return True, "Email queued for delivery."
+    except Exception as e:
+        print(f"Email Queue Error: {e}")
+        return False, str(e)
+
 def send_analysis_email(to_email, subject, html_content, images=None):
     """
-    Sends an email using Gmail SMTP from secrets.
-    
+    Sends an email synchronously using Gmail SMTP from secrets.
+    (The app uses queue_analysis_email; this is kept for scripts/debugging.)
+
     Args:
         to_email (str): Recipient email
         subject (str): Email subject
@@ -39,54 +174,26 @@ def send_analysis_email(to_email, subject, html_content, images=None):
                        In HTML, reference as <img src="cid:content_id">
     """
     # Load secrets
-    smtp_user = st.secrets.get("GMAIL_USER")
-    smtp_pass = st.secrets.get("GMAIL_APP_PASSWORD")
-    
+    settings = _smtp_settings()
+    smtp_user = settings["smtp_user"]
+    smtp_pass = settings["smtp_pass"]
+
     if not smtp_user or not smtp_pass:
         return False, "SMTP Configuration missing (GMAIL_USER or GMAIL_APP_PASSWORD)"
-    
+
     try:
-        # Create Message - Use 'related' for inline images
-        msg = MIMEMultipart("related") 
-        msg["Subject"] = subject
-        # Use a friendly Name for the sender
-        msg["From"] = formataddr(("HouSmart AI Assistant", smtp_user))
-
-        msg["To"] = to_email
-        
-        msg_alternative = MIMEMultipart('alternative')
-        msg.attach(msg_alternative)
-
-        # Plain text version (optional fallback)
-        text_part = MIMEText("Your HouSmart Analysis Report is attached/included as HTML.", "plain")
-        msg_alternative.attach(text_part)
-        
-        # HTML version
-        html_part = MIMEText(html_content, "html")
-        msg_alternative.attach(html_part)
-        
-        # Attach Images
-        if images:
-            for cid, img_data in images.items():
-                if img_data:
-                    # Guess MIME type or default to png
-                    img = MIMEImage(img_data)
-                    # Add Content-ID header for inline referencing
-                    img.add_header('Content-ID', f'<{cid}>') 
-                    img.add_header('Content-Disposition', 'inline', filename=f'{cid}.png')
-                    msg.attach(img)
-        
+        msg = build_analysis_message(to_email, subject, html_content, smtp_user, images=images)
+
         # Send
-        with smtplib.SMTP("smtp.gmail.com", 587) as server:
+        with smtplib.SMTP(settings["host"], settings["port"]) as server:
             server.ehlo()
             server.starttls()
             server.ehlo()
             server.login(smtp_user, smtp_pass)
             server.sendmail(smtp_user, to_email, msg.as_string())
-            
+
         return True, "Email sent successfully."
-        
+
     except Exception as e:
         print(f"SMTP Error: {e}")
         return False, str(e)
-
@@ -0,0 +1,336 @@
+import io
+import os
+import glob
+import struct
+import zipfile
+import argparse
+import threading
+
+import numpy as np
+
+# Offline lat/lon -> Census block group (12-digit GEOID).
+# TIGER/Line block group shapes are converted once per state into
+# tiger_store/bg_{state}.npz (simplified rings + bounding boxes):
+#   python geoid_resolver.py --states 06,48          (downloads from census.gov)
+#   python geoid_resolver.py --shp tl_2022_06_bg.zip  (local .zip or .shp)
+# At runtime each state's boxes are packed into an STR tree (sort-tile-
+# recursive R-tree); a lookup walks the tree and runs an even-odd ray test on
+# the few candidate polygons. resolve() returns the same dict shape as
+# data.CensusDataService.get_census_geoid, or None (state not built, or the
+# point falls in a gap), in which case callers use the network geocoders.
+
+TIGER_YEAR = 2022
+TIGER_URL = f"https://www2.census.gov/geo/tiger/TIGER{TIGER_YEAR}/BG/tl_{TIGER_YEAR}_{{state}}_bg.zip"
+STORE_DIR = "tiger_store"
+NODE_CAPACITY = 16
+SIMPLIFY_TOLERANCE = 1e-5  # Degrees (~1 m); keeps neighbouring block groups from opening gaps
+
+_indexes = None  # [_StateIndex], loaded on first resolve()
+_load_lock = threading.Lock()
+
+
+# --- Shapefile reading (polygons + the GEOID column, no dependencies) -------
+
+def read_shapes(shp_bytes):
+    """
+    [(parts, bbox)] per record of a polygon .shp: parts is a list of (K, 2)
+    lon/lat arrays, bbox (minx, miny, maxx, maxy). Null shapes give ([], None).
+    """
+    shapes = []
+    pos = 100  # File header
+    while pos + 8 <= len(shp_bytes):
+        _, length = struct.unpack(">ii", shp_bytes[pos:pos + 8])
+        content = shp_bytes[pos + 8:pos + 8 + length * 2]
+        pos += 8 + length * 2
+        shape_type = struct.unpack("<i", content[:4])[0]
+        if shape_type == 0:
+            shapes.append(([], None))
+            continue
+        if shape_type not in (5, 15, 25):  # Polygon, PolygonZ, PolygonM
+            raise ValueError(f"Unsupported shape type {shape_type}, expected polygons")
+        bbox = struct.unpack("<4d", content[4:36])
+        num_parts, num_points = struct.unpack("<2i", content[36:44])
+        starts = list(struct.unpack(f"<{num_parts}i", content[44:44 + 4 * num_parts])) + [num_points]
+        offset = 44 + 4 * num_parts
+        points = np.frombuffer(content, dtype="<f8", count=2 * num_points, offset=offset).reshape(-1, 2)
+        shapes.append(([points[starts[i]:starts[i + 1]] for i in range(num_parts)], bbox))
+    return shapes
+
+
+def read_dbf_column(dbf_bytes, column):
+    """
+    Values of one character column of a .dbf, in record order.
+    """
+    num_records, header_len, record_len = struct.unpack("<IHH", dbf_bytes[4:12])
+    offset, pos = 1, 32  # Byte 0 of each record is the deletion flag
+    while dbf_bytes[pos] != 0x0D:
+        name = dbf_bytes[pos:pos + 11].split(b"\0")[0].decode("ascii")
+        width = dbf_bytes[pos + 16]
+        if name.upper() == column.upper():
+            break
+        offset += width
+        pos += 32
+    else:
+        raise KeyError(f"Column {column} not in .dbf")
+    return [
+        dbf_bytes[start + offset:start + offset + width].decode("ascii").strip()
+        for start in range(header_len, header_len + num_records * record_len, record_len)
+    ]
+
+
+def _simplify(ring, tolerance):
+    """
+    Douglas-Peucker on a closed ring (first point == last point kept).
+    """
+    if tolerance <= 0 or len(ring) <= 5:
+        return ring
+    keep = np.zeros(len(ring), dtype=bool)
+    keep[0] = keep[-1] = True
+    # Split at the point farthest from the start, so the closed ring's two halves are simplified separately
+    far = int(np.argmax(((ring - ring[0]) ** 2).sum(axis=1)))
+    keep[far] = True
+    stack = [(0, far), (far, len(ring) - 1)]
+    while stack:
+        i, j = stack.pop()
+        if j - i < 2:
+            continue
+        seg = ring[j] - ring[i]
+        pts = ring[i + 1:j] - ring[i]
+        norm = np.hypot(seg[0], seg[1])
+        if norm == 0:
+            d = np.hypot(pts[:, 0], pts[:, 1])
+        else:
+            d = np.abs(seg[0] * pts[:, 1] - seg[1] * pts[:, 0]) / norm
+        k = int(np.argmax(d))
+        if d[k] > tolerance:
+            keep[i + 1 + k] = True
+            stack.extend([(i, i + 1 + k), (i + 1 + k, j)])
+    simplified = ring[keep]
+    return simplified if len(simplified) >= 4 else ring
+
+
+def build_state_file(zip_or_shp, out_dir=STORE_DIR, tolerance=SIMPLIFY_TOLERANCE):
+    """
+    Convert one TIGER block group shapefile (.zip or .shp next to its .dbf)
+    into bg_{state}.npz. Returns (path, polygon count).
+    """
+    if zip_or_shp.lower().endswith(".zip"):
+        with zipfile.ZipFile(zip_or_shp) as z:
+            names = z.namelist()
+            shp = z.read(next(n for n in names if n.lower().endswith(".shp")))
+            dbf = z.read(next(n for n in names if n.lower().endswith(".dbf")))
+    else:
+        with open(zip_or_shp, "rb") as f:
+            shp = f.read()
+        with open(os.path.splitext(zip_or_shp)[0] + ".dbf", "rb") as f:
+            dbf = f.read()
+    return build_state_arrays(read_shapes(shp), read_dbf_column(dbf, "GEOID"), out_dir, tolerance)
+
+
+def build_state_arrays(shapes, geoids, out_dir=STORE_DIR, tolerance=SIMPLIFY_TOLERANCE):
+    kept_ids, bboxes, poly_rings, ring_starts, coords = [], [], [0], [0], []
+    n_points = 0
+    for (parts, bbox), geoid in zip(shapes, geoids):
+        if not parts or len(geoid) != 12:
+            continue
+        for part in parts:
+            ring = _simplify(np.asarray(part, dtype=np.float64), tolerance)
+            coords.append(ring)
+            n_points += len(ring)
+            ring_starts.append(n_points)
+        poly_rings.append(len(ring_starts) - 1)
+        kept_ids.append(geoid)
+        bboxes.append(bbox)
+    if not kept_ids:
+        raise ValueError("No block group polygons found")
+
+    state = kept_ids[0][:2]
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, f"bg_{state}.npz")
+    np.savez_compressed(
+        path,
+        geoids=np.array(kept_ids, dtype="U12"),
+        bbox=np.array(bboxes, dtype=np.float64),
+        poly_rings=np.array(poly_rings, dtype=np.int64),
+        ring_starts=np.array(ring_starts, dtype=np.int64),
+        coords=np.concatenate(coords),
+    )
+    return path, len(kept_ids)
+
+
+def build_states(state_fips_list, out_dir=STORE_DIR, tolerance=SIMPLIFY_TOLERANCE):
+    """
+    Download and convert the TIGER block group files of the given states.
+    """
+    import requests
+
+    counts = {}
+    for state in state_fips_list:
+        state = str(state).zfill(2)
+        url = TIGER_URL.format(state=state)
+        print(f"Downloading {url} ...")
+        r = requests.get(url, timeout=300)
+        r.raise_for_status()
+        with zipfile.ZipFile(io.BytesIO(r.content)) as z:
+            shp = z.read(next(n for n in z.namelist() if n.lower().endswith(".shp")))
+            dbf = z.read(next(n for n in z.namelist() if n.lower().endswith(".dbf")))
+        _, counts[state] = build_state_arrays(read_shapes(shp), read_dbf_column(dbf, "GEOID"), out_dir, tolerance)
+    reload()
+    return counts
+
+
+# --- Spatial index ----------------------------------------------------------
+
+def _str_order(bboxes, capacity):
+    """
+    Sort-tile-recursive packing order: vertical slices by x center, then y
+    within a slice, so every run of `capacity` entries is spatially compact.
+    """
+    n = len(bboxes)
+    cx = (bboxes[:, 0] + bboxes[:, 2]) / 2
+    cy = (bboxes[:, 1] + bboxes[:, 3]) / 2
+    leaves = -(-n // capacity)
+    slice_size = capacity * int(np.ceil(np.sqrt(leaves)))
+    by_x = np.argsort(cx, kind="stable")
+    return np.concatenate([
+        chunk[np.argsort(cy[chunk], kind="stable")] for chunk in np.array_split(by_x, range(slice_size, n, slice_size))
+    ])
+
+
+def _group_bounds(bboxes, capacity):
+    starts = np.arange(0, len(bboxes), capacity)
+    return np.column_stack([
+        np.minimum.reduceat(bboxes[:, 0], starts), np.minimum.reduceat(bboxes[:, 1], starts),
+        np.maximum.reduceat(bboxes[:, 2], starts), np.maximum.reduceat(bboxes[:, 3], starts),
+    ])
+
+
+class _StateIndex:
+    """
+    One state's polygons plus an STR tree over their boxes. Each tree level is
+    (boxes, lo, hi): node j covers entries lo[j]..hi[j]-1 of the level below;
+    on the bottom level those entries are polygon ids via `order`.
+    """
+    def __init__(self, path, capacity=NODE_CAPACITY):
+        with np.load(path) as z:
+            self.geoids = z["geoids"]
+            self.bbox = bbox = z["bbox"]
+            self.poly_rings = z["poly_rings"]
+            self.ring_starts = z["ring_starts"]
+            self.coords = z["coords"]
+        self.bounds = np.array([bbox[:, 0].min(), bbox[:, 1].min(), bbox[:, 2].max(), bbox[:, 3].max()])
+
+        # Bottom up: pack a level, then group every `capacity` packed entries into a parent
+        self.order = _str_order(bbox, capacity)
+        boxes = bbox[self.order]
+        self.levels = []
+        while True:
+            lo = np.arange(0, len(boxes), capacity)
+            hi = np.minimum(lo + capacity, len(boxes))
+            parents = _group_bounds(boxes, capacity)
+            if len(parents) <= capacity:
+                self.levels.append((parents, lo, hi))
+                break
+            perm = _str_order(parents, capacity)
+            self.levels.append((parents[perm], lo[perm], hi[perm]))
+            boxes = parents[perm]
+        self.levels.reverse()  # Root level first
+
+    def candidates(self, lon, lat):
+        """
+        Polygon ids whose box contains the point.
+        """
+        idx = np.arange(len(self.levels[0][0]))
+        for boxes, lo, hi in self.levels:
+            b = boxes[idx]
+            hit = idx[(b[:, 0] <= lon) & (lon <= b[:, 2]) & (b[:, 1] <= lat) & (lat <= b[:, 3])]
+            if not len(hit):
+                return hit
+            idx = np.concatenate([np.arange(lo[j], hi[j]) for j in hit])
+        # idx are positions in the packed polygon order
+        polys = self.order[idx]
+        b = self.bbox[polys]
+        return polys[(b[:, 0] <= lon) & (lon <= b[:, 2]) & (b[:, 1] <= lat) & (lat <= b[:, 3])]
+
+    def contains(self, poly, lon, lat):
+        """
+        Even-odd ray test over all rings of the polygon (holes included).
+        """
+        inside = False
+        for r in range(self.poly_rings[poly], self.poly_rings[poly + 1]):
+            ring = self.coords[self.ring_starts[r]:self.ring_starts[r + 1]]
+            x1, y1 = ring[:-1, 0], ring[:-1, 1]
+            x2, y2 = ring[1:, 0], ring[1:, 1]
+            crosses = (y1 > lat) != (y2 > lat)
+            if not crosses.any():
+                continue
+            x1, y1, x2, y2 = x1[crosses], y1[crosses], x2[crosses], y2[crosses]
+            x_at = x1 + (lat - y1) * (x2 - x1) / (y2 - y1)
+            inside ^= bool(np.count_nonzero(lon < x_at) % 2)
+        return inside
+
+    def resolve(self, lon, lat):
+        for poly in self.candidates(lon, lat):
+            if self.contains(poly, lon, lat):
+                return str(self.geoids[poly])
+        return None
+
+
+def reload(store_dir=STORE_DIR):
+    """
+    (Re)load every bg_*.npz in the store.
+    """
+    global _indexes
+    indexes = []
+    for path in sorted(glob.glob(os.path.join(store_dir, "bg_*.npz"))):
+        try:
+            indexes.append(_StateIndex(path))
+        except Exception as e:
+            print(f"GEOID Resolver: skipping {path}: {e}")
+    _indexes = indexes
+    return len(indexes)
+
+
+def resolve(lat, lon):
+    """
+    Block group for a point: {"full_geoid", "state", "county", "tract",
+    "block_group"} or None.
+    """
+    if _indexes is None:
+        with _load_lock:
+            if _indexes is None:
+                reload()
+    if lat is None or lon is None:
+        return None
+    lat, lon = float(lat), float(lon)
+    for index in _indexes:
+        b = index.bounds
+        if not (b[0] <= lon <= b[2] and b[1] <= lat <= b[3]):
+            continue
+        geoid = index.resolve(lon, lat)
+        if geoid:
+            return {
+                "full_geoid": geoid,
+                "state": geoid[:2],
+                "county": geoid[2:5],
+                "tract": geoid[5:11],
+                "block_group": geoid[11],
+            }
+    return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the offline block group resolver from TIGER/Line shapes.")
+    parser.add_argument("--states", help="Comma separated state FIPS codes to download, e.g. 06,36")
+    parser.add_argument("--shp", nargs="*", default=[], help="Local tl_*_bg .zip / .shp files")
+    parser.add_argument("--tolerance", type=float, default=SIMPLIFY_TOLERANCE, help="Simplification in degrees (0 = exact)")
+    parser.add_argument("--lookup", nargs=2, type=float, metavar=("LAT", "LON"), help="Resolve one point")
+    args = parser.parse_args()
+
+    if args.states:
+        print(build_states(args.states.split(","), tolerance=args.tolerance))
+    for path in args.shp:
+        print(build_state_file(path, tolerance=args.tolerance))
+    if args.lookup:
+        reload()
+        print(resolve(*args.lookup))
@@ -0,0 +1,414 @@
+import os
+import glob
+import argparse
+import threading
+
+import numpy as np
+
+import geoid_resolver
+import benchmark_engine
+
+# Neighborhood hex grid (map overlay of block group metrics)
+# Block group medians are aggregated offline into hexagons at a few
+# resolutions, one columnar file per state:
+#   python hex_grid.py --states 06,48   (needs tiger_store/bg_{state}.npz, see geoid_resolver.py)
+# Each block group sits at its polygon centroid; a hex's value is the
+# population-weighted mean of its block groups. The store is sorted by
+# (resolution, lat), so a viewport query is a binary search on lat plus a lon
+# mask. The map and /hexes read only this file, never the Census API.
+# Hexes are pointy-top in Web Mercator meters (HEX_SIZES is the circumradius,
+# so cells look regular on the map and shrink on the ground by cos(lat)).
+
+STORE_DIR = "hex_store"
+HEX_SIZES = {0: 8000.0, 1: 2500.0, 2: 800.0}  # resolution -> circumradius (mercator m), coarse -> fine
+METRICS = ["median_income", "median_rent", "median_home_value", "score"]
+METRIC_LABELS = {
+    "median_income": "Median Income",
+    "median_rent": "Median Rent",
+    "median_home_value": "Median Home Value",
+    "score": "Area Score",
+}
+ACS_VARIABLES = {
+    "population": "B01003_001E",
+    "median_income": "B19013_001E",
+    "median_rent": "B25064_001E",
+    "median_home_value": "B25077_001E",
+}
+# Area score (0-100): weighted percentile ranks of the block group within its
+# state. Weights are renormalized over the metrics a block group has.
+SCORE_WEIGHTS = {"median_income": 0.4, "median_home_value": 0.3, "median_rent": 0.3}
+
+EARTH_RADIUS_M = 6378137.0  # Web Mercator sphere
+_SQRT3 = np.sqrt(3.0)
+_AXIAL_OFFSET = 1 << 27
+
+_stores = None  # [_HexStore], loaded on first query()
+_stores_version = None
+_load_lock = threading.Lock()
+
+
+# --- Hex math ---------------------------------------------------------------
+
+def to_mercator(lat, lon):
+    lat = np.clip(np.asarray(lat, dtype=np.float64), -85.0, 85.0)
+    x = EARTH_RADIUS_M * np.radians(np.asarray(lon, dtype=np.float64))
+    y = EARTH_RADIUS_M * np.log(np.tan(np.pi / 4 + np.radians(lat) / 2))
+    return x, y
+
+
+def from_mercator(x, y):
+    lat = np.degrees(2 * np.arctan(np.exp(np.asarray(y) / EARTH_RADIUS_M)) - np.pi / 2)
+    return lat, np.degrees(np.asarray(x) / EARTH_RADIUS_M)
+
+
+def cell_ids(resolution, lat, lon):
+    """
+    int64 hex ids of points: (resolution, q, r) axial coordinates packed into one int.
+    """
+    size = HEX_SIZES[resolution]
+    x, y = to_mercator(lat, lon)
+    q = (_SQRT3 / 3 * x - y / 3) / size
+    r = (2 / 3 * y) / size
+    # Cube rounding: round all three, fix the one with the largest error
+    s = -q - r
+    rq, rr, rs = np.rint(q), np.rint(r), np.rint(s)
+    dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    rq = np.where(fix_q, -rr - rs, rq)
+    rr = np.where(fix_r, -rq - rs, rr)
+    return (np.int64(resolution) << 56) | ((rq.astype(np.int64) + _AXIAL_OFFSET) << 28) | (rr.astype(np.int64) + _AXIAL_OFFSET)
+
+
+def _axial(cells):
+    cells = np.asarray(cells, dtype=np.int64)
+    res = cells >> 56
+    q = ((cells >> 28) & ((1 << 28) - 1)) - _AXIAL_OFFSET
+    r = (cells & ((1 << 28) - 1)) - _AXIAL_OFFSET
+    return res, q, r
+
+
+def cell_centers(cells):
+    """
+    (lat, lon) arrays of hex centers.
+    """
+    res, q, r = _axial(cells)
+    size = np.array([HEX_SIZES[int(v)] for v in res]) if len(res) else np.zeros(0)
+    return from_mercator(size * _SQRT3 * (q + r / 2), size * 1.5 * r)
+
+
+def cell_boundaries(cells):
+    """
+    (n, 7, 2) [lat, lon] rings (closed) of the hexes.
+    """
+    res, q, r = _axial(cells)
+    size = np.array([HEX_SIZES[int(v)] for v in res]) if len(res) else np.zeros(0)
+    cx, cy = size * _SQRT3 * (q + r / 2), size * 1.5 * r
+    angles = np.radians(30 + 60 * np.arange(7))  # 7th corner closes the ring
+    lat, lon = from_mercator(cx[:, None] + size[:, None] * np.cos(angles), cy[:, None] + size[:, None] * np.sin(angles))
+    return np.stack([lat, lon], axis=-1)
+
+
+# --- Build ------------------------------------------------------------------
+
+def polygon_centroids(tiger_path):
+    """
+    (geoids, lat, lon) of every block group in a geoid_resolver state file:
+    area centroid of each polygon's largest ring (bbox center if degenerate).
+    """
+    with np.load(tiger_path) as z:
+        geoids, bbox = z["geoids"], z["bbox"]
+        poly_rings, ring_starts, coords = z["poly_rings"], z["ring_starts"], z["coords"]
+
+    x, y = coords[:, 0], coords[:, 1]
+    # Shoelace terms between consecutive points, zeroed across ring boundaries
+    cross = x[:-1] * y[1:] - x[1:] * y[:-1]
+    cross[ring_starts[1:-1] - 1] = 0
+    cross = np.append(cross, 0.0)
+    starts = ring_starts[:-1]
+    area = np.add.reduceat(cross, starts) / 2
+    cx = np.add.reduceat((x + np.append(x[1:], 0)) * cross, starts)
+    cy = np.add.reduceat((y + np.append(y[1:], 0)) * cross, starts)
+
+    # Largest ring per polygon
+    ring_poly = np.repeat(np.arange(len(geoids)), np.diff(poly_rings))
+    order = np.lexsort((-np.abs(area), ring_poly))
+    first = order[np.r_[0, np.flatnonzero(np.diff(ring_poly[order])) + 1]]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        lon = cx[first] / (6 * area[first])
+        lat = cy[first] / (6 * area[first])
+    bad = ~np.isfinite(lon) | ~np.isfinite(lat)
+    lon[bad] = (bbox[bad, 0] + bbox[bad, 2]) / 2
+    lat[bad] = (bbox[bad, 1] + bbox[bad, 3]) / 2
+    return geoids, lat, lon
+
+
+def fetch_block_group_metrics(state, counties):
+    """
+    {geoid: {metric: value}} for every block group of the given counties
+    (one wildcard ACS query per county).
+    """
+    import requests
+
+    codes = list(ACS_VARIABLES.values())
+    result = {}
+    for county in counties:
+        params = {"get": "NAME," + ",".join(codes), "for": "block group:*",
+                  "in": f"state:{state} county:{county} tract:*"}
+        r = requests.get(benchmark_engine.ACS_BASE_URL, params=params, timeout=60)
+        if r.status_code != 200:
+            print(f"Hex Grid ACS Fetch Failed ({state}{county}): {r.status_code} - {r.text[:200]}")
+            continue
+        rows = r.json()
+        headers = rows[0]
+        for row in rows[1:]:
+            rec = dict(zip(headers, row))
+            geoid = rec["state"] + rec["county"] + rec["tract"] + rec["block group"]
+            values = {}
+            for metric, code in ACS_VARIABLES.items():
+                try:
+                    v = float(rec[code])
+                except (TypeError, ValueError):
+                    continue
+                if v >= 0:  # Negative = ACS missing / suppressed
+                    values[metric] = v
+            result[geoid] = values
+    return result
+
+
+def area_scores(values):
+    """
+    Area score (0-100) per block group from a {metric: (n,) array} dict (NaN = missing).
+    """
+    n = len(next(iter(values.values())))
+    total, weight = np.zeros(n), np.zeros(n)
+    for metric, w in SCORE_WEIGHTS.items():
+        v = values[metric]
+        ok = np.isfinite(v)
+        if ok.sum() < 2:
+            continue
+        # Percentile rank among the block groups that have the metric (ties get the lower rank)
+        ranks = np.searchsorted(np.sort(v[ok]), v[ok], side="left")
+        pct = np.full(n, np.nan)
+        pct[ok] = 100 * ranks / (ok.sum() - 1)
+        total += np.where(ok, w * pct, 0)
+        weight += np.where(ok, w, 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(weight > 0, total / weight, np.nan)
+
+
+def aggregate(lat, lon, values, population):
+    """
+    Columnar hex table for all resolutions, sorted by (resolution, lat).
+    values: {metric: (n,) block group array, NaN = missing}.
+    """
+    weights = np.where(np.isfinite(population), population, 0)
+    columns = {k: [] for k in ["res", "cell", "lat", "lon", "block_groups", "population"] + METRICS}
+    for res in HEX_SIZES:
+        cells, inv = np.unique(cell_ids(res, lat, lon), return_inverse=True)
+        c_lat, c_lon = cell_centers(cells)
+        columns["res"].append(np.full(len(cells), res, dtype=np.uint8))
+        columns["cell"].append(cells)
+        columns["lat"].append(c_lat.astype(np.float32))
+        columns["lon"].append(c_lon.astype(np.float32))
+        columns["block_groups"].append(np.bincount(inv, minlength=len(cells)).astype(np.uint16))
+        columns["population"].append(np.bincount(inv, weights=weights, minlength=len(cells)).astype(np.float32))
+        for metric in METRICS:
+            v = values[metric]
+            ok = np.isfinite(v) & (weights > 0)
+            num = np.bincount(inv, weights=np.where(ok, v * weights, 0), minlength=len(cells))
+            den = np.bincount(inv, weights=np.where(ok, weights, 0), minlength=len(cells))
+            with np.errstate(invalid="ignore", divide="ignore"):
+                columns[metric].append(np.where(den > 0, num / den, np.nan).astype(np.float32))
+
+    table = {k: np.concatenate(v) for k, v in columns.items()}
+    order = np.lexsort((table["lat"], table["res"]))
+    return {k: v[order] for k, v in table.items()}
+
+
+def build_state(state, tiger_dir=geoid_resolver.STORE_DIR, out_dir=STORE_DIR, metrics_by_geoid=None):
+    """
+    Build hex_{state}.npz from the state's TIGER centroids and block group ACS
+    (fetched unless metrics_by_geoid is given). Returns (path, hex count).
+    """
+    state = str(state).zfill(2)
+    tiger_path = os.path.join(tiger_dir, f"bg_{state}.npz")
+    if not os.path.exists(tiger_path):
+        raise FileNotFoundError(f"{tiger_path} missing, run: python geoid_resolver.py --states {state}")
+    geoids, lat, lon = polygon_centroids(tiger_path)
+    if metrics_by_geoid is None:
+        counties = sorted({str(g)[2:5] for g in geoids})
+        metrics_by_geoid = fetch_block_group_metrics(state, counties)
+
+    rows = [metrics_by_geoid.get(str(g), {}) for g in geoids]
+    values = {m: np.array([row.get(m, np.nan) for row in rows], dtype=np.float64)
+              for m in ACS_VARIABLES}
+    values["score"] = area_scores(values)
+    table = aggregate(lat, lon, values, values.pop("population"))
+
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, f"hex_{state}.npz")
+    tmp = path + ".tmp.npz"
+    np.savez_compressed(tmp, **table, vintage=np.array(benchmark_engine.ACS_YEAR))
+    os.replace(tmp, path)
+    return path, len(table["cell"])
+
+
+# --- Viewport queries -------------------------------------------------------
+
+class _HexStore:
+    """
+    One state's hex table; rows of resolution k are span[k] = (start, end),
+    sorted by lat within it.
+    """
+    def __init__(self, path):
+        with np.load(path) as z:
+            self.columns = {k: z[k] for k in z.files if k != "vintage"}
+            self.vintage = int(z["vintage"]) if "vintage" in z.files else None
+        res = self.columns["res"]
+        self.span = {int(k): (int(np.searchsorted(res, k, "left")), int(np.searchsorted(res, k, "right")))
+                     for k in np.unique(res)}
+        lat, lon = self.columns["lat"], self.columns["lon"]
+        self.bounds = np.array([lon.min(), lat.min(), lon.max(), lat.max()]) if len(lat) else None
+
+    def rows(self, res, south, west, north, east):
+        if res not in self.span:
+            return np.zeros(0, dtype=np.int64)
+        start, end = self.span[res]
+        lat = self.columns["lat"][start:end]
+        lo, hi = np.searchsorted(lat, south, "left"), np.searchsorted(lat, north, "right")
+        lon = self.columns["lon"][start + lo:start + hi]
+        return start + lo + np.flatnonzero((lon >= west) & (lon <= east))
+
+
+def reload(store_dir=STORE_DIR):
+    """
+    (Re)load every hex_*.npz in the store.
+    """
+    global _stores, _stores_version
+    _stores_version = store_version(store_dir)
+    stores = []
+    for path in sorted(glob.glob(os.path.join(store_dir, "hex_*.npz"))):
+        try:
+            stores.append(_HexStore(path))
+        except Exception as e:
+            print(f"Hex Grid: skipping {path}: {e}")
+    _stores = stores
+    return len(stores)
+
+
+def store_version(store_dir=STORE_DIR):
+    """
+    Changes whenever a store file is rebuilt (map cache keys).
+    """
+    return tuple(sorted((os.path.basename(p), int(os.path.getmtime(p)))
+                        for p in glob.glob(os.path.join(store_dir, "hex_*.npz"))))
+
+
+def _loaded():
+    # Picks up rebuilt files without a restart
+    if _stores is None or store_version() != _stores_version:
+        with _load_lock:
+            if _stores is None or store_version() != _stores_version:
+                reload()
+    return _stores
+
+
+def _subsample(hits, max_cells):
+    """
+    At most max_cells of [(store, row indices)] in total. Cells are ranked by a
+    hash of their id, so the kept ones are spread evenly over the viewport
+    (rows are sorted by lat, a prefix would be the southern edge) and stay the
+    same while panning.
+    """
+    total = sum(len(idx) for _, idx in hits)
+    if total <= max_cells:
+        return hits
+    if max_cells <= 0:
+        return [(s, idx[:0]) for s, idx in hits]
+    cells = np.concatenate([s.columns["cell"][idx] for s, idx in hits]).astype(np.uint64)
+    rank = cells * np.uint64(0x9E3779B97F4A7C15)  # Fibonacci hashing (wraps mod 2**64)
+    keep = np.zeros(total, dtype=bool)
+    keep[np.argpartition(rank, max_cells - 1)[:max_cells]] = True
+    out, offset = [], 0
+    for s, idx in hits:
+        out.append((s, idx[keep[offset:offset + len(idx)]]))
+        offset += len(idx)
+    return out
+
+
+def query(south, west, north, east, resolution=None, max_cells=1500):
+    """
+    Hexes whose centers fall in the viewport: {"resolution", "vintage",
+    "cells": [{"cell", "lat", "lon", "block_groups", "population", <METRICS>,
+    "boundary": [[lat, lon], ...]}]}. Without a resolution, the finest one
+    with at most max_cells hexes in view is used. If even that (or the
+    requested resolution) has more, a subset spread over the whole viewport
+    is returned (_subsample). Metrics are None when no block group in the
+    hex had data.
+    """
+    stores = [s for s in _loaded() if s.bounds is not None and not (
+        s.bounds[0] > east or s.bounds[2] < west or s.bounds[1] > north or s.bounds[3] < south)]
+
+    def rows(res):
+        # Pad by one hex so cells straddling the edge are included
+        pad = HEX_SIZES[res] / 111320
+        return [(s, s.rows(res, south - pad, west - pad, north + pad, east + pad)) for s in stores]
+
+    if resolution is not None:
+        res, hits = resolution, rows(resolution)
+    else:
+        for res in sorted(HEX_SIZES, reverse=True):  # Finest first
+            hits = rows(res)
+            if sum(len(idx) for _, idx in hits) <= max_cells:
+                break
+    hits = _subsample(hits, max_cells)
+
+    cells = []
+    for store, idx in hits:
+        if not len(idx):
+            continue
+        cols = {k: v[idx] for k, v in store.columns.items()}
+        boundaries = np.round(cell_boundaries(cols["cell"]), 6).tolist()
+        for i in range(len(idx)):
+            row = {
+                "cell": format(int(cols["cell"][i]), "x"),
+                "lat": round(float(cols["lat"][i]), 6),
+                "lon": round(float(cols["lon"][i]), 6),
+                "block_groups": int(cols["block_groups"][i]),
+                "population": int(cols["population"][i]),
+                "boundary": boundaries[i],
+            }
+            for metric in METRICS:
+                v = float(cols[metric][i])
+                row[metric] = round(v, 1) if np.isfinite(v) else None
+            cells.append(row)
+    vintages = {s.vintage for s, idx in hits if len(idx)}
+    return {"resolution": res, "vintage": max(vintages) if vintages else None, "cells": cells}
+
+
+def query_around(lat, lon, radius_m, resolution=None, max_cells=1500):
+    """
+    query() for a square of +-radius_m around a point.
+    """
+    dlat = radius_m / 111320
+    dlon = radius_m / (111320 * max(0.1, np.cos(np.radians(lat))))
+    return query(lat - dlat, lon - dlon, lat + dlat, lon + dlon, resolution, max_cells)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the neighborhood hex grid store from block group ACS data.")
+    parser.add_argument("--states", help="Comma separated state FIPS codes, e.g. 06,36 (TIGER store must exist)")
+    parser.add_argument("--query", nargs=4, type=float, metavar=("SOUTH", "WEST", "NORTH", "EAST"), help="Print a viewport query")
+    parser.add_argument("--resolution", type=int, choices=sorted(HEX_SIZES), help="Resolution for --query")
+    args = parser.parse_args()
+
+    for state in (args.states.split(",") if args.states else []):
+        print(build_state(state))
+    if args.query:
+        reload()
+        result = query(*args.query, resolution=args.resolution)
+        print(f"resolution {result['resolution']}, {len(result['cells'])} hexes")
+        for row in result["cells"][:10]:
+            print({k: v for k, v in row.items() if k != "boundary"})
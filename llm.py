@@ -1,26 +1,35 @@
-import google.generativeai as genai
-import os
 import json
 import time
 import random
 import hashlib
-import pickle
 import datetime
 
-import google.api_core.exceptions
-
 import state_data
+import cache_codec
+import cache_store
+import singleflight
+import revalidate
 from config_manager import config_manager
 
 # Module-level variable to store keys
 _GEMINI_KEYS = []
 CACHE_DIR = "analysis_cache"
+DEFAULT_WEIGHTS = {"cashflow": 50, "appreciation": 50}  # What app.py passes to analyze_location
 _LAST_CALL_TM = 0.0
 _REQUEST_HISTORY = []
 
-# Ensure cache directory exists
-if not os.path.exists(CACHE_DIR):
-    os.makedirs(CACHE_DIR)
+def _genai():
+    """
+    Lazy import of the Gemini SDK (slow to import, not needed to render the page).
+    """
+    import google.generativeai as genai
+    return genai
+
+def _is_quota_error(e):
+    import google.api_core.exceptions
+    if isinstance(e, google.api_core.exceptions.ResourceExhausted):
+        return True
+    return "quota" in str(e).lower() or "429" in str(e).lower()
 
 def configure_genai(api_keys):
     """
@@ -38,44 +47,38 @@ def configure_genai(api_keys):
     else:
         return False
     
-    # Configure with the first key initially
-    if _GEMINI_KEYS:
-        genai.configure(api_key=_GEMINI_KEYS[0])
-        return True
-    return False
+    # The SDK itself is configured lazily (call_with_rotation sets the key per call),
+    # so storing the keys here doesn't pull in google.generativeai on every rerun.
+    return bool(_GEMINI_KEYS)
+
+def _analysis_cache_file(address, weights=None, rent_data=None):
+    """
+    Cache file for hash(address + weights + rent_data). RentCast _cache_meta is ignored.
+    """
+    rent_data = _strip_cache_meta(rent_data)
+    # Sort weights to ensure consistent hashing key for dicts
+    weight_str = json.dumps(weights, sort_keys=True) if weights else "None"
+    rent_str = json.dumps(rent_data, sort_keys=True) if rent_data else "None"
+    key_str = f"{address}_{weight_str}_{rent_str}".encode('utf-8')
+    return cache_codec.cache_file(CACHE_DIR, f"llm_{hashlib.md5(key_str).hexdigest()}")
 
 def get_cached_analysis(address, weights=None, rent_data=None):
     """
-    Retrieve cached analysis if valid (exists and < 240 hours old).
+    Retrieve cached analysis if valid (exists and < cache_hard_expiry_hours old).
+    Entries past cache_ttl_hours come back with _cache_meta['stale'] = True.
     Key is based on hash(address + weights + rent_data).
     """
     try:
-        # Create a unique key based on address and weights
-        # Sort weights to ensure consistent hashing key for dicts
-        weight_str = json.dumps(weights, sort_keys=True) if weights else "None"
-        rent_str = json.dumps(rent_data, sort_keys=True) if rent_data else "None"
-        key_str = f"{address}_{weight_str}_{rent_str}".encode('utf-8')
-        file_hash = hashlib.md5(key_str).hexdigest()
-        filename = os.path.join(CACHE_DIR, f"{file_hash}.pkl")
-        
-        if os.path.exists(filename):
-            # Check modification time
-            mtime = os.path.getmtime(filename)
-            file_time = datetime.datetime.fromtimestamp(mtime)
-            age = datetime.datetime.now() - file_time
-            
-            # Get Cache TTL from config
-            config = config_manager.get_config()
-            ttl_hours = config.get("cache_ttl_hours", 240)
-            
-            if age.total_seconds() < ttl_hours * 3600:
-                with open(filename, 'rb') as f:
-                    data = pickle.load(f)
-                
-                # Inject cache metadata if not present
-                if '_cache_meta' not in data:
-                    data['_cache_meta'] = {'timestamp': file_time.strftime("%Y-%m-%d %H:%M:%S")}
-                return data
+        filename = _analysis_cache_file(address, weights, rent_data)
+        data, mtime = cache_store.read_entry(filename, max_age=revalidate.max_age())
+        if data:
+            # Inject cache metadata if not present
+            if '_cache_meta' not in data:
+                file_time = datetime.datetime.fromtimestamp(mtime)
+                data['_cache_meta'] = {'timestamp': file_time.strftime("%Y-%m-%d %H:%M:%S")}
+            # fresh / stale (past cache_ttl_hours, served while refreshing)
+            data['_cache_meta']['stale'] = revalidate.cache_state(mtime) == "stale"
+            return data
     except Exception as e:
         print(f"Cache usage error: {e}")
         return None
@@ -86,17 +89,12 @@ def save_to_cache(address, data, weights=None, rent_data=None):
     Save analysis result to cache.
     """
     try:
-        weight_str = json.dumps(weights, sort_keys=True) if weights else "None"
-        rent_str = json.dumps(rent_data, sort_keys=True) if rent_data else "None"
-        key_str = f"{address}_{weight_str}_{rent_str}".encode('utf-8')
-        file_hash = hashlib.md5(key_str).hexdigest()
-        filename = os.path.join(CACHE_DIR, f"{file_hash}.pkl")
-        
+        filename = _analysis_cache_file(address, weights, rent_data)
+
         # Add metadata before saving
         data['_cache_meta'] = {'timestamp': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
         
-        with open(filename, 'wb') as f:
-            pickle.dump(data, f)
+        cache_store.write(filename, data, address=address)
     except Exception as e:
         print(f"Cache save error: {e}")
 
@@ -110,11 +108,7 @@ def call_with_retry(func, max_retries=5):
             return func()
         except Exception as e:
             # Check for Quota/429 errors
-            is_quota_error = False
-            if isinstance(e, google.api_core.exceptions.ResourceExhausted):
-                is_quota_error = True
-            elif "quota" in str(e).lower() or "429" in str(e).lower():
-                is_quota_error = True
+            is_quota_error = _is_quota_error(e)
             
             # If it's not a quota error, or if it's the last retry, re-raise
             if not is_quota_error or i == max_retries - 1:
@@ -166,7 +160,7 @@ def call_with_rotation(func_to_call, *args, **kwargs):
     for i, key in enumerate(_GEMINI_KEYS):
         try:
             # Re-configure with current key
-            genai.configure(api_key=key)
+            _genai().configure(api_key=key)
             
             # Use retry logic for THIS key
             # We wrap the call in a lambda so call_with_retry can execute it
@@ -174,11 +168,7 @@ def call_with_rotation(func_to_call, *args, **kwargs):
             
         except Exception as e:
             # Check if we should rotate
-            is_quota_error = False
-            if isinstance(e, google.api_core.exceptions.ResourceExhausted):
-                is_quota_error = True
-            elif "quota" in str(e).lower() or "429" in str(e).lower():
-                is_quota_error = True
+            is_quota_error = _is_quota_error(e)
 
             if is_quota_error:
                 print(f"Key {i} exhausted after retries. Rotating...")
@@ -196,6 +186,9 @@ def get_available_models():
     List available models that support generation.
     """
     try:
+        genai = _genai()
+        if _GEMINI_KEYS:
+            genai.configure(api_key=_GEMINI_KEYS[0])
         models = []
         for m in genai.list_models():
             if 'generateContent' in m.supported_generation_methods:
@@ -204,12 +197,32 @@ def get_available_models():
     except Exception as e:
         return [f"Error listing models: {str(e)}"]
 
-def analyze_location(address, poi_data, census_data, model_name=None, weights=None, user_prefs=None, rent_data=None):
+def _strip_cache_meta(rent_data):
+    """
+    RentCast results carry _cache_meta (timestamp/stale flag); it must not leak
+    into the analysis cache key or the prompt.
+    """
+    if isinstance(rent_data, dict) and '_cache_meta' in rent_data:
+        return {k: v for k, v in rent_data.items() if k != '_cache_meta'}
+    return rent_data
+
+def _analysis_flight_key(address, poi_data, census_data, model_name=None, weights=None, user_prefs=None, rent_data=None, force_refresh=False, amenity=None):
+    from poi_collection import POICollection  # numpy: not imported with llm
+    poi_key = poi_data.fingerprint() if isinstance(poi_data, POICollection) else poi_data
+    return (singleflight.normalize_address(address), poi_key, census_data, model_name, weights, user_prefs, _strip_cache_meta(rent_data), force_refresh)
+
+# Concurrent identical analyses share one Gemini call (across processes too, via the result cache)
+@singleflight.singleflight("analysis", key_fn=_analysis_flight_key, cross_process=True)
+def analyze_location(address, poi_data, census_data, model_name=None, weights=None, user_prefs=None, rent_data=None, force_refresh=False, amenity=None):
     """
     Analyze the location using Gemini.
     Merged functionality: Estimates Census data if missing, and provides Investment Analysis.
-    Now includes Result Caching (240 Hours).
+    Now includes Result Caching (cache_ttl_hours, stale-while-revalidate up to cache_hard_expiry_hours).
+    force_refresh skips the cache lookup (used by the background refresh).
+    amenity: amenity_score.score() result, passed to the prompt as numeric features.
     """
+    rent_data = _strip_cache_meta(rent_data)
+
     # 1. Check Cache (Include user_prefs in cache key if significant, but for simplicity, we might just re-run or rely on weights)
     # Actually, if preferences change, we SHOULD re-run analysis. 
     # Let's include user_prefs in the cache key/hash logic implicitly or explicitly?
@@ -218,7 +231,7 @@ def analyze_location(address, poi_data, census_data, model_name=None, weights=No
     # but the cache function signature needs update.
     # Alternative: Disable cache if user_prefs are provided? Or just risk it?
     # Let's bypass cache if user_prefs is present to ensure fresh "Warning" generation.
-    if not user_prefs:
+    if not user_prefs and not force_refresh:
         # Include rent_data presence in cache key logic implicitly or we should add it
         # Ideally, differing rent data should yield different analysis.
         # But if rent data is None in cache, and now we have it, we should re-run?
@@ -235,6 +248,14 @@ def analyze_location(address, poi_data, census_data, model_name=None, weights=No
         cached_result = get_cached_analysis(address, weights=weights, rent_data=rent_data)
         if cached_result:
             print("Using cached analysis.")
+            if cached_result['_cache_meta'].get('stale'):
+                # Serve stale now, refresh in the background
+                revalidate.schedule(
+                    singleflight.make_key("analysis", address, weights, rent_data),
+                    analyze_location, address, poi_data, census_data,
+                    model_name=model_name, weights=weights, user_prefs=user_prefs, rent_data=rent_data, force_refresh=True,
+                    amenity=amenity
+                )
             return cached_result
 
     # 1.5 Get Config
@@ -308,7 +329,7 @@ def analyze_location(address, poi_data, census_data, model_name=None, weights=No
             "response_schema": analysis_schema
         }
         
-        model = genai.GenerativeModel(
+        model = _genai().GenerativeModel(
             model_name=current_model_name,
             generation_config=generation_config
         )
@@ -324,7 +345,10 @@ def analyze_location(address, poi_data, census_data, model_name=None, weights=No
                 break
         benchmarks = state_data.get_state_benchmarks(detected_state)
         
-        # Construct prompt
+        # Construct prompt (these modules pull in numpy, so they load on first analysis)
+        import amenity_score
+        import census_trends
+        from poi_collection import POICollection
         if weights:
             weight_str = json.dumps(weights, indent=2)
 
@@ -370,14 +394,17 @@ def analyze_location(address, poi_data, census_data, model_name=None, weights=No
         {prefs_section}
         
         INPUT DATA:
-        - POI Data (Sample): {str(poi_data)[:1500]}...
+        - POIs within 1 km (count, nearest): {POICollection.coerce(poi_data).prompt_text()}
+        - Amenity Access Scores (0-100, distance-weighted): {amenity_score.prompt_text(amenity)}
         - Census Data (Provided): {census_data}
+        - Census Trends (older vs latest ACS vintage): {census_trends.prompt_text((census_data or {}).get('trends'))}
         - State Benchmarks: {benchmarks['state_name']} Income ${benchmarks['state_income']:,}
         - National Income: ${benchmarks['us_income']:,}
         - Rental Data (RentCast): {rent_data if rent_data else "Not Available"}
         
         INSTRUCTIONS:
         1. PREFERENCE CHECK: If 'USER PREFERENCES CONTEXT' is provided, cross-reference it with the INPUT DATA. If a conflict is found, include a specific warning in 'risks'.
+        1b. TRENDS CHECK: If 'Census Trends' lists RED FLAGS (population / real income decline, rising vacancy or unemployment), include each in 'risks'.
         2. FILL JSON FIELDS:
            - 'location_tier': Class rating.
            - 'tenant_profile': Description of likely tenants.
@@ -416,7 +443,7 @@ def refine_preferences(current_summary, new_feedback, model_name='models/gemini-
     Refine the user's preference summary based on new feedback.
     """
     try:
-        model = genai.GenerativeModel(model_name)
+        model = _genai().GenerativeModel(model_name)
         
         prompt = f"""
         You are a Personal Real Estate Preference Assistant.
@@ -0,0 +1,71 @@
+import os
+import time
+import hashlib
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, in-process locks still apply
+    fcntl = None
+
+# Cross-process lock table: one lock file per key under LOCK_DIR.
+# flock() locks are released by the OS if the holder dies, so a crashed worker
+# can't leave a key locked forever.
+# cache_admin removes idle lock files. A waiter that opened the file before it
+# was unlinked would lock an orphaned inode while a newcomer locks the new
+# file, so after acquiring we check the path still names our file and retry
+# if not. The lock file's mtime is touched on every acquire (last use).
+
+LOCK_DIR = os.path.join("analysis_cache", "locks")
+
+
+def lock_path(name, lock_dir=LOCK_DIR):
+    safe = hashlib.md5(name.encode("utf-8")).hexdigest()
+    return os.path.join(lock_dir, f"{safe}.lock")
+
+
+def _same_file(f, path):
+    try:
+        return os.fstat(f.fileno()).st_ino == os.stat(path).st_ino
+    except FileNotFoundError:
+        return False
+
+
+@contextmanager
+def file_lock(name, timeout=60, poll=0.05, lock_dir=LOCK_DIR):
+    """
+    Exclusive lock on `name` shared by all processes using the same lock_dir.
+    Yields True if the lock was acquired, False if it timed out (or locking is
+    unavailable) - callers should then just proceed unlocked.
+    """
+    if fcntl is None:
+        yield False
+        return
+
+    os.makedirs(lock_dir, exist_ok=True)
+    path = lock_path(name, lock_dir)
+    f = open(path, "a+")
+    acquired = False
+    try:
+        deadline = time.time() + timeout
+        while True:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                if _same_file(f, path):
+                    os.utime(path)
+                    acquired = True
+                    break
+                # Lock file was removed while we waited: lock the current one
+                f.close()
+                f = open(path, "a+")
+                continue
+            except BlockingIOError:
+                if time.time() >= deadline:
+                    print(f"[locks] Timed out waiting for lock '{name}', proceeding without it")
+                    break
+                time.sleep(poll)
+        yield acquired
+    finally:
+        if acquired:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        f.close()
@@ -1,5 +1,9 @@
-import folium
-from folium.features import DivIcon
+import html
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 
 # CSS for the pulsing effect and markers
 MAP_CSS = """
@@ -33,44 +37,193 @@ MAP_CSS = """
 </style>
 """
 
+# Built maps, keyed by map_cache_key. Reruns (rating/feedback widgets etc.) get
+# the same Map object back, so it isn't rebuilt and its element ids stay stable,
+# which keeps st_folium from reloading the iframe.
+_MAP_CACHE = OrderedDict()
+_MAP_CACHE_MAX = 32
+_MAP_CACHE_LOCK = threading.Lock()
+
+# Geoapify category keyword -> (Emoji, HexColor, Label); first match wins.
+# The labels are also poi_collection's category codes, in this order.
+CATEGORY_STYLES = [
+    ("catering", "🍔", "#FF9800", "Food/Drink"),
+    ("education", "🎓", "#1A73E8", "Education"),
+    ("leisure", "🌳", "#4CAF50", "Park/Leisure"),
+    ("healthcare", "🏥", "#F44336", "Health"),
+    ("commercial.supermarket", "🛒", "#9C27B0", "Grocery"),
+    ("shopping", "🛍️", "#9C27B0", "Shopping"),
+    ("commercial", "🏢", "#607D8B", "Commercial"),
+    ("worship", "⛪", "#795548", "Worship"),
+    ("financial", "🏦", "#3F51B5", "Bank"),
+    ("fuel", "⛽", "#212121", "Gas Station"),
+    ("public_transport", "🚆", "#009688", "Transit"),
+]
+OTHER_STYLE = ("📍", "#999999", "Other")
+
 def get_category_style(category_list):
     """
     Map Geoapify categories to (Emoji, BorderColor, Label).
     """
-    # Default
-    emoji = "📍"
-    color = "#999999"
-    label = "Other"
+    return _style_for_categories(",".join(category_list).lower())
 
-    cat_str = ",".join(category_list).lower()
-    
-    # Mapping: (Keyword, Emoji, HexColor, Label)
-    mapping = [
-        ("catering", "🍔", "#FF9800", "Food/Drink"), 
-        ("education", "🎓", "#1A73E8", "Education"), 
-        ("leisure", "🌳", "#4CAF50", "Park/Leisure"), 
-        ("healthcare", "🏥", "#F44336", "Health"), 
-        ("commercial.supermarket", "🛒", "#9C27B0", "Grocery"), 
-        ("shopping", "🛍️", "#9C27B0", "Shopping"),
-        ("commercial", "🏢", "#607D8B", "Commercial"), 
-        ("worship", "⛪", "#795548", "Worship"), 
-        ("financial", "🏦", "#3F51B5", "Bank"), 
-        ("fuel", "⛽", "#212121", "Gas Station"),
-        ("public_transport", "🚆", "#009688", "Transit"),
-    ]
-
-    for key, emo, col, lbl in mapping:
+@lru_cache(maxsize=1024)
+def _style_for_categories(cat_str):
+    """
+    Keyword lookup for a normalized category string (resolved once per distinct string).
+    """
+    for key, emo, col, lbl in CATEGORY_STYLES:
         if key in cat_str:
             return emo, col, lbl
-            
-    return emoji, color, label
+    return OTHER_STYLE
 
-def generate_map(lat, lon, pois):
+def style_for_code(code):
+    """
+    (Emoji, BorderColor, Label) for a poi_collection category code.
+    """
+    if code < len(CATEGORY_STYLES):
+        return CATEGORY_STYLES[code][1:]
+    return OTHER_STYLE
+
+# Clustered mode: one FastMarkerCluster layer. Points are serialized as compact
+# [lat, lon, style_index, name] rows and drawn as canvas circle markers by a JS
+# callback, instead of one DivIcon marker (+ HTML string) per POI.
+CLUSTER_CALLBACK = """
+(function () {
+    var styles = %s;
+    return function (row) {
+        var s = styles[row[2]];
+        var marker = L.circleMarker(new L.LatLng(row[0], row[1]), {
+            radius: 7, color: '#FFFFFF', weight: 2, fillColor: s[1], fillOpacity: 0.9
+        });
+        // POI names come from Geoapify: set as text, never parsed as HTML
+        var tip = document.createElement('span');
+        tip.textContent = row[3] + ' (' + s[2] + ')';
+        marker.bindTooltip(tip);
+        return marker;
+    };
+})()
+"""
+
+def resolve_render_mode(poi_count, render_mode=None):
+    """
+    'markers' (one styled DivIcon per POI) or 'cluster' (single clustered canvas layer).
+    'auto' switches to cluster above map_cluster_threshold POIs.
+    """
+    from config_manager import config_manager
+    config = config_manager.get_config()
+    if render_mode is None:
+        render_mode = config.get("map_render_mode", "auto")
+    if render_mode == "auto":
+        return "cluster" if poi_count > config.get("map_cluster_threshold", 150) else "markers"
+    return render_mode
+
+# Neighborhood hex overlay (hex_grid store): 5 quantile classes of the visible hexes
+HEX_RAMP = ["#EDF8FB", "#B2E2E2", "#66C2A4", "#2CA25F", "#006D2C"]
+HEX_NO_DATA = "#CCCCCC"
+
+def resolve_hex_overlay():
+    """
+    [metric, radius_m, max_cells, store version] for the hex overlay (everything
+    that changes what it draws), or None if it's off or no hex store is built.
+    """
+    from config_manager import config_manager
+    import hex_grid
+    config = config_manager.get_config()
+    metric = config.get("hex_overlay_metric", "median_income")
+    if metric not in hex_grid.METRICS:
+        return None
+    version = hex_grid.store_version()
+    if not version:
+        return None
+    return [metric, config.get("hex_overlay_radius_m", 3000), config.get("hex_max_cells", 1500), version]
+
+def map_cache_key(lat, lon, pois, mode, overlay=None):
+    """
+    Hash of the map center, resolved render mode, the POI set (a POICollection)
+    and the hex overlay (resolve_hex_overlay).
+    """
+    raw = json.dumps([round(float(lat), 6), round(float(lon), 6), mode, pois.fingerprint(), overlay])
+    return hashlib.md5(raw.encode("utf-8")).hexdigest()
+
+def generate_map(lat, lon, pois, render_mode=None):
     """
     Generate a Folium map with Custom Styled Markers.
+    render_mode: 'markers', 'cluster' or 'auto' (default: map_render_mode from config).
+    Returns (map, legend_items) where legend_items = { label: (emoji, color) }.
+    Memoized by map_cache_key: the same inputs return the same Map object.
+    pois: POICollection (raw Geoapify features are normalized first).
+    """
+    from poi_collection import POICollection
+    pois = POICollection.coerce(pois, lat, lon)
+    mode = resolve_render_mode(len(pois), render_mode)
+    overlay = resolve_hex_overlay()
+    key = map_cache_key(lat, lon, pois, mode, overlay)
+
+    with _MAP_CACHE_LOCK:
+        cached = _MAP_CACHE.get(key)
+        if cached is not None:
+            _MAP_CACHE.move_to_end(key)
+
+    if cached is None:
+        cached = _build_map(lat, lon, pois, mode, overlay)
+        with _MAP_CACHE_LOCK:
+            _MAP_CACHE[key] = cached
+            while len(_MAP_CACHE) > _MAP_CACHE_MAX:
+                _MAP_CACHE.popitem(last=False)
+
+    m, legend_items = cached
+    return m, dict(legend_items)
+
+def _add_hex_overlay(m, lat, lon, metric, radius_m, max_cells):
+    """
+    Neighborhood hexes around the property, colored by quantile of `metric`
+    (precomputed store, no Census calls). Returns the legend entry or None.
+    """
+    import folium
+    import numpy as np
+    import hex_grid
+
+    result = hex_grid.query_around(lat, lon, radius_m, max_cells=max_cells)
+    cells = result["cells"]
+    if not cells:
+        return None
+
+    values = np.array([c[metric] if c[metric] is not None else np.nan for c in cells], dtype=np.float64)
+    known = values[np.isfinite(values)]
+    edges = np.quantile(known, [0.2, 0.4, 0.6, 0.8]) if len(known) else np.array([])
+    label = hex_grid.METRIC_LABELS[metric]
+    features = []
+    for c, v in zip(cells, values):
+        color = HEX_RAMP[int(np.searchsorted(edges, v, side="right"))] if np.isfinite(v) else HEX_NO_DATA
+        text = "No data" if not np.isfinite(v) else (f"{v:.0f}" if metric == "score" else f"${v:,.0f}")
+        features.append({
+            "type": "Feature",
+            "geometry": {"type": "Polygon", "coordinates": [[[p[1], p[0]] for p in c["boundary"]]]},
+            "properties": {"color": color, "value": text, "block_groups": c["block_groups"]},
+        })
+
+    layer = folium.FeatureGroup(name=f"Neighborhood: {label}", show=True)
+    folium.GeoJson(
+        {"type": "FeatureCollection", "features": features},
+        style_function=lambda f: {"fillColor": f["properties"]["color"], "color": "#FFFFFF",
+                                  "weight": 1, "fillOpacity": 0.45},
+        tooltip=folium.GeoJsonTooltip(fields=["value", "block_groups"], aliases=[label, "Block groups"]),
+    ).add_to(layer)
+    layer.add_to(m)
+    folium.LayerControl(collapsed=True).add_to(m)
+    return f"{label} (hex)", ("⬢", HEX_RAMP[3])
+
+def _build_map(lat, lon, pois, mode, overlay=None):
+    """
+    Build the Folium map for a resolved render mode ('markers' or 'cluster'),
+    with the neighborhood hex overlay if set (resolve_hex_overlay).
     """
-    # 1. Base Map
-    m = folium.Map(location=[lat, lon], zoom_start=15, tiles="cartodbpositron")
+    import folium
+    from folium.features import DivIcon
+
+    # 1. Base Map (canvas renderer for vector layers like circle markers)
+    m = folium.Map(location=[lat, lon], zoom_start=15, tiles="cartodbpositron", prefer_canvas=(mode == "cluster"))
     
     # Inject CSS into the map
     m.get_root().html.add_child(folium.Element(MAP_CSS))
@@ -90,42 +243,52 @@ def generate_map(lat, lon, pois):
     
     legend_items["Target Property"] = ("🏠", "#1A73E8")
 
+    # 2b. Neighborhood Hex Overlay (below the markers)
+    if overlay:
+        try:
+            entry = _add_hex_overlay(m, lat, lon, *overlay[:3])
+            if entry:
+                legend_items[entry[0]] = entry[1]
+        except Exception as e:
+            print(f"Hex Overlay Error: {e}")
+
     # 3. POI Markers
-    for p in pois:
-        props = p.get('properties', {})
-        # Robust category extraction
-        cat_raw = props.get('categories', [])
-        if not cat_raw:
-             # Try singular 'category' or 'datasource.raw.amenity' if needed
-             single = props.get('category')
-             if single: cat_raw = [single]
-        
-        # Ensure it's a list
-        if isinstance(cat_raw, str):
-            cat_raw = cat_raw.split(',')
-            
-        emoji, color, label = get_category_style(cat_raw)
-        
+    if mode == "cluster":
+        from folium.plugins import FastMarkerCluster
+
+        styles = []  # [emoji, color, label], index referenced by each row
+        style_index = {}
+        rows = []
+        for p_lat, p_lon, name, code in pois.points():
+            emoji, color, label = style_for_code(code)
+            if label not in legend_items:
+                legend_items[label] = (emoji, color)
+            if label not in style_index:
+                style_index[label] = len(styles)
+                styles.append([emoji, color, label])
+            rows.append([round(p_lat, 6), round(p_lon, 6), style_index[label], name])
+
+        if rows:
+            FastMarkerCluster(
+                rows,
+                callback=CLUSTER_CALLBACK % json.dumps(styles),
+                name="POIs",
+                disableClusteringAtZoom=17,
+                chunkedLoading=True,
+            ).add_to(m)
+        return m, legend_items
+
+    for p_lat, p_lon, name, code in pois.points():
+        emoji, color, label = style_for_code(code)
+
         # Add to Legend (unique)
         if label not in legend_items:
             legend_items[label] = (emoji, color)
-        
-        # Extract Lat/Lon (Support both Mock properties and Real GeoJSON geometry)
-        lat = props.get('lat')
-        lon = props.get('lon')
-        
-        if (lat is None or lon is None) and "geometry" in p:
-            coords = p["geometry"].get("coordinates")
-            if coords and len(coords) >= 2:
-                lon, lat = coords[0], coords[1] # GeoJSON is [Lon, Lat]
-                
-        if lat is None or lon is None:
-            continue
 
         # Plot
         folium.Marker(
-            location=[lat, lon],
-            tooltip=f"{props.get('name', 'Unknown')} ({label})",
+            location=[p_lat, p_lon],
+            tooltip=html.escape(f"{name} ({label})"),  # Tooltip content is HTML
             icon=DivIcon(
                 icon_size=(24,24),
                 icon_anchor=(12,12),
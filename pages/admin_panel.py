@@ -117,6 +117,39 @@ with st.form("settings_form"):
         help="Screen: Show results immediately. Email: Send result via email only."
     )
     
+    email_chart_renderer = st.selectbox(
+        "Email Chart Renderer",
+        options=["kaleido", "svg"],
+        index=1 if config.get("email_chart_renderer", "kaleido") == "svg" else 0,
+        help="kaleido: PNG via headless browser. svg: lightweight built-in renderer (no browser process); converted to PNG for email with cairosvg; falls back to kaleido if cairosvg (or the cairo library) is missing."
+    )
+
+    col_m1, col_m2 = st.columns([2, 1])
+    with col_m1:
+        map_modes = ["auto", "markers", "cluster"]
+        map_render_mode = st.selectbox(
+            "Map POI Rendering",
+            options=map_modes,
+            index=map_modes.index(config.get("map_render_mode", "auto")) if config.get("map_render_mode", "auto") in map_modes else 0,
+            help="markers: styled emoji pins. cluster: single clustered canvas layer (fast for large maps). auto: cluster above the threshold."
+        )
+    with col_m2:
+        map_cluster_threshold = st.number_input(
+            "Cluster Above (POIs)",
+            min_value=1,
+            max_value=100000,
+            value=int(config.get("map_cluster_threshold", 150)),
+            disabled=map_render_mode != "auto"
+        )
+
+    hex_metrics = ["off", "median_income", "median_rent", "median_home_value", "score"]
+    hex_overlay_metric = st.selectbox(
+        "Neighborhood Hex Overlay",
+        options=hex_metrics,
+        index=hex_metrics.index(config.get("hex_overlay_metric", "median_income")) if config.get("hex_overlay_metric", "median_income") in hex_metrics else 0,
+        help="Colors the map with block group metrics aggregated into hexagons. Requires the hex store (python hex_grid.py --states ...)."
+    )
+
     customized_scoring_method = st.toggle(
         "Enable Customized Scoring Method",
         value=config.get("customized_scoring_method", False),
@@ -151,6 +184,37 @@ with st.form("settings_form"):
         help="Enter emails separated by commmas or newlines. These users will bypass the daily limit."
     )
 
+    st.subheader("📊 Benchmark Scopes")
+
+    benchmark_scopes = st.multiselect(
+        "Extra Comparison Scopes",
+        options=["tract", "county", "metro"],
+        default=[x for x in config.get("benchmark_scopes", []) if x in ("tract", "county", "metro")],
+        help="Shown next to State/National in charts. Requires the local ACS store (python benchmark_engine.py --states ...)."
+    )
+
+    acs_scopes = ["tract", "county", "block_group"]
+    acs_prefetch_scope = st.selectbox(
+        "ACS Prefetch Scope",
+        options=acs_scopes,
+        index=acs_scopes.index(config.get("acs_prefetch_scope", "tract")) if config.get("acs_prefetch_scope", "tract") in acs_scopes else 0,
+        help="On a census cache miss, fetch every block group of the tract / county in one query and cache them all, so nearby addresses need no ACS calls. block_group = only the requested one."
+    )
+
+    enable_census_trends = st.toggle(
+        "Enable ACS Trends",
+        value=config.get("enable_census_trends", True),
+        help="Compares several ACS 5-year vintages of the same area (population, income, rent, vacancy) and flags downturns in the AI analysis."
+    )
+
+    vintage_options = list(range(2012, 2023 + 1))
+    trend_vintages = st.multiselect(
+        "ACS Trend Vintages",
+        options=vintage_options,
+        default=[v for v in config.get("trend_vintages", [2013, 2017, 2022]) if v in vintage_options],
+        help="At least two. Non-overlapping 5-year periods (e.g. 2013, 2017, 2022) give the cleanest trend. Vintages on both sides of the 2020 boundary redraw are compared at county level. Each vintage is cached permanently."
+    )
+
     st.subheader("💾 Cache Settings")
     
     cache_ttl = st.number_input(
@@ -162,6 +226,15 @@ with st.form("settings_form"):
         help="How long to keep analysis results in cache."
     )
 
+    cache_hard_expiry = st.number_input(
+        "Cache Hard Expiry (Hours)",
+        min_value=1,
+        max_value=10000,
+        value=int(config.get("cache_hard_expiry_hours", 720)),
+        step=1,
+        help="Entries older than the TTL but younger than this are served immediately (marked stale) and refreshed in the background."
+    )
+
     submitted = st.form_submit_button("Save Changes", type="primary")
 
     if submitted:
@@ -170,12 +243,19 @@ with st.form("settings_form"):
         raw_list = whitelist_input.replace(",", "\n").split("\n")
         final_whitelist = [x.strip().lower() for x in raw_list if x.strip()]
         
-        new_config = {
+        # Start from the current config so keys not exposed in this form are kept
+        new_config = dict(config)
+        new_config.update({
             "model_name": selected_model,
             "temperature": temperature,
             "delivery_method": delivery_method,
+            "email_chart_renderer": email_chart_renderer,
+            "map_render_mode": map_render_mode,
+            "map_cluster_threshold": map_cluster_threshold,
+            "hex_overlay_metric": hex_overlay_metric,
             "customized_scoring_method": customized_scoring_method,
             "cache_ttl_hours": cache_ttl,
+            "cache_hard_expiry_hours": cache_hard_expiry,
             "enable_daily_limit": enable_daily_limit,
             "daily_limit_count": daily_limit_count,
             "whitelist_emails": final_whitelist,
@@ -184,8 +264,12 @@ with st.form("settings_form"):
             "enable_census": enable_census,
             "enable_llm": enable_llm,
             "strategy_word_limit": strategy_limit,
-            "bullet_word_limit": bullet_limit
-        }
+            "bullet_word_limit": bullet_limit,
+            "benchmark_scopes": benchmark_scopes,
+            "acs_prefetch_scope": acs_prefetch_scope,
+            "enable_census_trends": enable_census_trends,
+            "trend_vintages": sorted(trend_vintages)
+        })
         
         if config_manager.save_config(new_config):
             st.success("Configuration saved successfully!")
@@ -199,5 +283,66 @@ with st.form("settings_form"):
         else:
             st.error("Failed to save configuration.")
 
+with st.expander("🚦 Provider Circuit Breakers"):
+    import circuit_breaker
+    st.caption("Rolling 2-minute window per provider. Open breakers fail fast to fallbacks (default coordinates, mock POIs, benchmark-only census, cached rent).")
+    states = circuit_breaker.all_states()
+    icons = {circuit_breaker.CLOSED: "🟢", circuit_breaker.HALF_OPEN: "🟠", circuit_breaker.OPEN: "🔴"}
+    st.table([{**s, "state": f"{icons[s['state']]} {s['state']}"} for s in states])
+    if st.button("Reset All Breakers"):
+        circuit_breaker.reset_all()
+        st.rerun()
+
+with st.expander("🔥 Cache Warmer (last run)"):
+    import cache_warmer
+    report = cache_warmer.last_report()
+    if not report:
+        st.info("No warm run yet. Schedule `python cache_warmer.py` (e.g. hourly cron; it only works during off-peak hours).")
+    else:
+        n = max(1, report["candidates"])
+        st.caption(f"Run at {report['run_at']} · {report['candidates']} addresses")
+        st.table({
+            step: {
+                "before": f"{report['coverage_before'][step] * 100 // n}%",
+                "after": f"{report['coverage_after'][step] * 100 // n}%",
+            }
+            for step in cache_warmer.STEPS
+        })
+        st.markdown("**API spend / budget:** " + ", ".join(
+            f"{api} {report['spend'].get(api, 0)}/{limit}" for api, limit in report["budget"].items()))
+
+with st.expander("🗄️ Cache"):
+    import cache_admin
+    cache_stats = cache_admin.stats()
+    st.table([
+        {
+            "namespace": ns,
+            "entries": row["entries"],
+            "size": cache_admin.fmt_bytes(row["bytes"]),
+            "hit rate": f"{row['hit_rate']:.0%}" if row["hit_rate"] is not None else "-",
+            "lookups": row["hits"] + row["misses"],
+        }
+        for ns, row in cache_stats.items()
+    ])
+    cfg = config_manager.get_config()
+    st.caption(f"Budget: {cfg.get('cache_max_mb', 512)} MB / {cfg.get('cache_max_entries', 50000)} entries. "
+               "Schedule `python cache_admin.py gc` (e.g. daily cron) to enforce it.")
+    if st.button("Run GC now"):
+        summary = cache_admin.gc()
+        st.success(f"Freed {cache_admin.fmt_bytes(summary['freed_bytes'])}: {summary['expired']} expired, "
+                   f"{summary['evicted']} evicted, {summary['housekeeping']} temp/quarantine/lock files.")
+
+    st.markdown("**Invalidate**")
+    inv_cols = st.columns(3)
+    inv_ns = inv_cols[0].selectbox("Namespace", [""] + [ns for ns, row in cache_stats.items() if ns != "total" and row["entries"]])
+    inv_address = inv_cols[1].text_input("Address")
+    inv_prefix = inv_cols[2].text_input("File prefix")
+    if st.button("Invalidate"):
+        if not (inv_ns or inv_address or inv_prefix):
+            st.warning("Pick a namespace, address or prefix.")
+        else:
+            n = cache_admin.invalidate(inv_ns or None, inv_address or None, inv_prefix or None)
+            st.success(f"Removed {n} entries.")
+
 st.markdown("---")
 st.caption("Changes take effect immediately in the main application.")
@@ -0,0 +1,191 @@
+import os
+import csv
+import asyncio
+from datetime import datetime, timedelta
+
+import aio
+import data
+import llm
+import secrets_utils
+
+# Analysis pipeline shared by the Streamlit app (app.py) and the HTTP API
+# (api_service.py): geocode -> POIs -> census -> RentCast -> schools -> Gemini.
+# Everything here is plain data in / plain data out, no session state, so the
+# same results (and the same caches) back both front ends.
+
+DEFAULT_ADDRESS = "123 Market St, San Francisco, CA"
+DEFAULT_SPECS = {"bedrooms": 2, "bathrooms": 2, "sqft": 1200, "property_type": "Single Family"}
+SCHOOL_RADIUS_MILES = 3.0
+USAGE_LOG = os.path.join("logs", "usage_logs.csv")
+
+
+def get_keys():
+    """
+    API keys from the environment or Streamlit secrets (see secrets_utils).
+    """
+    get = secrets_utils.get_secret
+    keys = {
+        "geoapify": get("GEOAPIFY_API_KEY"),
+        "rentcast": get("RENTCAST_API_KEY"),
+        "supabase_url": get("SUPABASE_URL"),
+        "supabase_key": get("SUPABASE_KEY"),
+    }
+    gemini_key = get("GEMINI_API_KEY")
+    keys["gemini"] = bool(gemini_key) and llm.configure_genai(gemini_key)
+    return keys
+
+
+async def geocode_async(address, keys):
+    return await data.get_coordinates_async(address, keys.get("geoapify"))
+
+
+async def pois_async(address, keys, lat=None, lon=None, radius_m=data.POI_RADIUS_M, categories=None, limit=None, api_calls=None):
+    return await data.get_poi_async(address, keys.get("geoapify"), lat=lat, lon=lon,
+                                    radius_m=radius_m, categories=categories, limit=limit, api_calls=api_calls)
+
+
+async def census_async(address, keys, lat=None, lon=None):
+    # With lat/lon the block group can be resolved offline (geoid_resolver)
+    return await data.get_census_data_async(address, geo_key=keys.get("geoapify"), lat=lat, lon=lon)
+
+
+async def rent_async(address, keys, bedrooms, bathrooms, sqft, property_type):
+    # Through the sync wrapper on a worker thread: it keeps RentCast's
+    # cross-process single-flight lock (paid API, see data.get_rentcast_data)
+    return await asyncio.to_thread(
+        data.get_rentcast_data, address, bedrooms, bathrooms, sqft, property_type, keys.get("rentcast")
+    )
+
+
+async def schools_async(lat, lon, keys, miles=SCHOOL_RADIUS_MILES):
+    # supabase-py is blocking
+    return await asyncio.to_thread(
+        data.get_nearby_schools_data, lat, lon, keys.get("supabase_url"), keys.get("supabase_key"), miles=miles
+    )
+
+
+async def amenity_async(address, keys, lat=None, lon=None):
+    """
+    Amenity access scores on their own (POIs + schools, no LLM).
+    """
+    import amenity_score  # numpy: loaded on first use, not with app.py
+    if lat is None or lon is None:
+        lat, lon = await geocode_async(address, keys)
+    # The whole wide fetch: amenity_score decays distances itself
+    (poi_data, _, _), schools_data = await asyncio.gather(
+        pois_async(address, keys, lat=lat, lon=lon, radius_m=None), schools_async(lat, lon, keys)
+    )
+    # Off the loop: score() reads / writes the cache
+    return await asyncio.to_thread(amenity_score.score, lat, lon, poi_data, schools_data)
+
+
+async def run_analysis_async(address, keys, bedrooms=2, bathrooms=2, sqft=1200, property_type="Single Family",
+                             user_prefs=None, weights=None):
+    """
+    Full analysis for one address. Returns a dict with every step's result and
+    `api_calls` (per-API call counts, same accounting as the usage logs;
+    geoapify = the geocode + the Places requests actually sent, 0 when cached).
+    POIs, census, RentCast and schools only need the geocode, so they run
+    concurrently.
+    """
+    import amenity_score
+    api_calls = {"geoapify": 0, "rentcast": 0, "census": 0, "gemini": 0}
+
+    # 1. Geocode
+    lat, lon = await geocode_async(address, keys)
+    api_calls["geoapify"] += 1
+
+    # 2.-5. POIs (lat/lon passed so get_poi doesn't geocode again), Census, RentCast, Schools
+    (all_pois, _, _), census_data, rent_data, schools_data = await asyncio.gather(
+        pois_async(address, keys, lat=lat, lon=lon, radius_m=None, api_calls=api_calls),
+        census_async(address, keys, lat=lat, lon=lon),
+        rent_async(address, keys, bedrooms, bathrooms, sqft, property_type),
+        schools_async(lat, lon, keys),
+    )
+    poi_data = all_pois.within(data.POI_RADIUS_M)  # What the map and the prompt show
+    if census_data:  # If None, call failed or disabled
+        api_calls["census"] += 2  # 1 Geocode + 1 Data
+    if rent_data:
+        api_calls["rentcast"] += 1
+
+    # 6. Amenity access scores (local, cached per location)
+    amenity = await asyncio.to_thread(amenity_score.score, lat, lon, all_pois, schools_data)
+
+    # 7. LLM Analysis (blocking SDK + rate limiting, on a worker thread)
+    llm_result = await asyncio.to_thread(
+        llm.analyze_location,
+        address,
+        poi_data,
+        census_data,
+        weights=dict(weights or llm.DEFAULT_WEIGHTS),
+        user_prefs=user_prefs,
+        rent_data=rent_data,
+        amenity=amenity,
+    )
+    # Check if actually called (not disabled message)
+    if "AI Analysis is currently disabled" not in str(llm_result.get("highlights", [])):
+        api_calls["gemini"] += 1
+
+    return {
+        "address": address,
+        "lat": lat,
+        "lon": lon,
+        "pois": poi_data,
+        "census_data": census_data,
+        "rent_data": rent_data,
+        "schools": schools_data,
+        "amenity": amenity,
+        "llm_result": llm_result,
+        "api_calls": api_calls,
+    }
+
+
+def run_analysis(address, keys, **kwargs):
+    """
+    Sync wrapper of run_analysis_async (Streamlit, scripts).
+    """
+    return aio.run(run_analysis_async(address, keys, **kwargs))
+
+
+def get_daily_usage(email, log_file=USAGE_LOG):
+    """
+    Analyses run by this email in the past 24h (for the daily limit).
+    """
+    if not email: return 0
+    count = 0
+    now = datetime.now()
+    cutoff = now - timedelta(hours=24)
+    email_clean = email.strip().lower()
+    
+    if not os.path.exists(log_file): return 0
+    
+    try:
+        with open(log_file, mode='r', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            # Skip header if exists, but we can just parse lines carefully
+            # Schema usually: Timestamp, Email, ...
+            for row in reader:
+                if len(row) < 2: continue
+                ts_str, row_email = row[0], row[1]
+                # Check if this row matches user email
+                if row_email.strip().lower() == email_clean:
+                    try:
+                        # Try parsing timestamp
+                        ts = datetime.strptime(ts_str, "%Y-%m-%d %H:%M:%S")
+                        if ts > cutoff: count += 1
+                    except: pass
+    except Exception as e:
+        print(f"Error reading logs: {e}")
+        
+    return count
+
+
+def log_usage(ts, email, address, bedrooms, bathrooms, sqft, property_type, log_file=USAGE_LOG):
+    """
+    Append one analysis to the local usage log.
+    Timestamp and email come first (get_daily_usage); property specs follow so
+    cache_warmer can replay the same RentCast/LLM keys.
+    """
+    os.makedirs(os.path.dirname(log_file), exist_ok=True)
+    with open(log_file, "a", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerow([ts, email, address, bedrooms, bathrooms, sqft, property_type])
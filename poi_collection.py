@@ -0,0 +1,221 @@
+import sys
+import hashlib
+
+import numpy as np
+
+import map_service
+
+# Compact POI set (struct of arrays) used by every POI consumer: the pipeline /
+# session state, the LLM prompt, the map and the API.
+# Geoapify features are normalized once (POICollection.from_features):
+#   lat, lon  float64 arrays
+#   cat       uint8 codes into CATEGORIES (the map legend labels)
+#   dist      float32 meters from the center (Geoapify's value, else haversine)
+#   name      int32 index into names (interned, deduplicated)
+# to_dict() / from_dict() is the JSON form stored in the poi cache.
+# within(radius_m, categories, limit) derives subsets locally, so one wide
+# fetch (data.get_poi_wide_async) serves every radius / category consumer.
+
+CATEGORIES = [label for _, _, _, label in map_service.CATEGORY_STYLES] + ["Other"]
+OTHER = len(CATEGORIES) - 1
+_CODE_BY_LABEL = {label: i for i, label in enumerate(CATEGORIES)}
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def haversine_m(lat, lon, lats, lons):
+    """
+    Great-circle distance in meters from (lat, lon) to each of lats/lons.
+    """
+    lat1, lon1 = np.radians(lat), np.radians(lon)
+    lat2, lon2 = np.radians(np.asarray(lats, dtype=np.float64)), np.radians(np.asarray(lons, dtype=np.float64))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def category_codes(labels):
+    """
+    Codes for category labels ("Transit", "grocery", ...), case-insensitive.
+    """
+    lookup = {label.lower(): i for i, label in enumerate(CATEGORIES)}
+    try:
+        return [lookup[str(label).lower()] for label in labels]
+    except KeyError as e:
+        raise ValueError(f"Unknown POI category {e.args[0]!r}, expected one of {CATEGORIES}")
+
+
+def category_code(categories):
+    """
+    Category code for a Geoapify category list (or comma string), same rules as the map legend.
+    """
+    if isinstance(categories, str):
+        categories = categories.split(",")
+    return _CODE_BY_LABEL[map_service.get_category_style(categories)[2]]
+
+
+class POICollection:
+    __slots__ = ("center", "lat", "lon", "cat", "dist", "name", "names", "_fingerprint")
+
+    def __init__(self, center, lat, lon, cat, dist, name, names):
+        self.center = center  # (lat, lon) or None
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.cat = np.asarray(cat, dtype=np.uint8)
+        self.dist = np.asarray(dist, dtype=np.float32)
+        self.name = np.asarray(name, dtype=np.int32)
+        self.names = tuple(names)
+        self._fingerprint = None
+
+    @classmethod
+    def empty(cls, center=None):
+        return cls(center, [], [], [], [], [], [])
+
+    @classmethod
+    def from_features(cls, features, center_lat=None, center_lon=None):
+        """
+        Normalize Geoapify GeoJSON features (or the mock {"properties": ...} dicts).
+        Features without a usable location are dropped.
+        """
+        center = (float(center_lat), float(center_lon)) if center_lat is not None and center_lon is not None else None
+        lats, lons, cats, dists, name_idx = [], [], [], [], []
+        names = {}
+        for f in features or []:
+            props = f.get("properties", {})
+            lat, lon = props.get("lat"), props.get("lon")
+            if (lat is None or lon is None) and "geometry" in f:
+                coords = (f["geometry"] or {}).get("coordinates")
+                if coords and len(coords) >= 2:
+                    lon, lat = coords[0], coords[1]  # GeoJSON is [Lon, Lat]
+            if lat is None or lon is None:
+                continue
+            cat_raw = props.get("categories") or ([props["category"]] if props.get("category") else [])
+            name = sys.intern(str(props.get("name") or "Unknown"))
+            lats.append(float(lat))
+            lons.append(float(lon))
+            cats.append(category_code(cat_raw))
+            dists.append(props.get("distance", np.nan))
+            name_idx.append(names.setdefault(name, len(names)))
+
+        dist = np.array(dists, dtype=np.float64)
+        missing = np.isnan(dist)
+        if center and missing.any():
+            dist[missing] = haversine_m(center[0], center[1], np.array(lats)[missing], np.array(lons)[missing])
+        return cls(center, lats, lons, cats, dist, name_idx, names)
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(tuple(d["center"]) if d.get("center") else None,
+                   d["lat"], d["lon"], d["cat"], d["dist"], d["name"], d["names"])
+
+    @classmethod
+    def coerce(cls, pois, center_lat=None, center_lon=None):
+        """
+        POICollection from whatever a caller holds: a collection, its dict
+        form, a feature list or None.
+        """
+        if isinstance(pois, cls):
+            return pois
+        if isinstance(pois, dict) and "names" in pois:
+            return cls.from_dict(pois)
+        return cls.from_features(pois or [], center_lat, center_lon)
+
+    def to_dict(self):
+        return {
+            "center": list(self.center) if self.center else None,
+            "lat": np.round(self.lat, 6).tolist(),
+            "lon": np.round(self.lon, 6).tolist(),
+            "cat": self.cat.tolist(),
+            "dist": np.round(self.dist, 1).tolist(),
+            "name": self.name.tolist(),
+            "names": list(self.names),
+        }
+
+    def to_features(self):
+        """
+        Minimal GeoJSON features (API responses).
+        """
+        return [
+            {
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [lon, lat]},
+                "properties": {"name": self.names[n], "category": CATEGORIES[c], "distance": round(d, 1),
+                               "lat": lat, "lon": lon},
+            }
+            for lat, lon, c, d, n in zip(self.lat.tolist(), self.lon.tolist(), self.cat.tolist(),
+                                         self.dist.tolist(), self.name.tolist())
+        ]
+
+    def __len__(self):
+        return len(self.lat)
+
+    def take(self, idx):
+        """
+        Subset by index array / mask (shares the name table).
+        """
+        return POICollection(self.center, self.lat[idx], self.lon[idx], self.cat[idx], self.dist[idx],
+                             self.name[idx], self.names)
+
+    def within(self, radius_m=None, categories=None, limit=None):
+        """
+        POIs within radius_m of the center and of the given category labels,
+        nearest first, at most `limit`.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if radius_m is not None:
+            mask &= self.dist <= radius_m
+        if categories:
+            mask &= np.isin(self.cat, category_codes(categories))
+        idx = np.flatnonzero(mask)
+        idx = idx[np.argsort(self.dist[idx], kind="stable")]
+        return self.take(idx[:limit] if limit is not None else idx)
+
+    def points(self):
+        """
+        (lat, lon, name, category_code) per POI.
+        """
+        for lat, lon, n, c in zip(self.lat.tolist(), self.lon.tolist(), self.name.tolist(), self.cat.tolist()):
+            yield lat, lon, self.names[n], c
+
+    def fingerprint(self):
+        """
+        Content hash (cache / single-flight keys).
+        """
+        if self._fingerprint is None:
+            h = hashlib.md5()
+            for arr in (self.lat, self.lon, self.cat, self.dist, self.name):
+                h.update(arr.tobytes())
+            h.update("\x1f".join(self.names).encode("utf-8"))
+            self._fingerprint = h.hexdigest()
+        return self._fingerprint
+
+    def distances_from(self, lat, lon):
+        return haversine_m(lat, lon, self.lat, self.lon)
+
+    def summary(self, radius_m=None):
+        """
+        {label: {"count": n, "nearest_m": d}} for categories present within
+        radius_m (all POIs if None), in one pass over the arrays.
+        """
+        mask = self.dist <= radius_m if radius_m is not None else slice(None)
+        cat, dist = self.cat[mask], self.dist[mask]
+        counts = np.bincount(cat, minlength=len(CATEGORIES))
+        nearest = np.full(len(CATEGORIES), np.inf, dtype=np.float32)
+        np.minimum.at(nearest, cat, dist)
+        return {
+            CATEGORIES[i]: {"count": int(counts[i]), "nearest_m": round(float(nearest[i]), 1)}
+            for i in np.flatnonzero(counts)
+        }
+
+    def prompt_text(self, max_names=3):
+        """
+        Compact per-category text for the LLM prompt.
+        """
+        if not len(self):
+            return "No POIs found"
+        order = np.argsort(self.dist, kind="stable")
+        lines = []
+        for label, row in sorted(self.summary().items(), key=lambda kv: -kv[1]["count"]):
+            code = _CODE_BY_LABEL[label]
+            closest = [self.names[self.name[i]] for i in order[self.cat[order] == code][:max_names]]
+            lines.append(f"{label}: {row['count']} (nearest {row['nearest_m']:.0f} m; e.g. {', '.join(closest)})")
+        return "; ".join(lines)
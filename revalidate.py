@@ -0,0 +1,81 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config_manager import config_manager
+
+# Background refreshes for stale-while-revalidate caches.
+# A stale hit is returned to the user right away and the refresh is queued
+# here: at most cache_revalidate_workers run at once, each key is queued once,
+# and beyond MAX_PENDING refreshes are dropped (the next stale hit retries).
+
+MAX_PENDING = 32
+
+_executor = None
+_pending = set()
+_lock = threading.Lock()
+
+
+def _ttls():
+    config = config_manager.get_config()
+    ttl_hours = config.get("cache_ttl_hours", 240)
+    return ttl_hours, max(ttl_hours, config.get("cache_hard_expiry_hours", 720))
+
+
+def max_age():
+    """
+    Seconds after which an entry is expired (cache_hard_expiry_hours).
+    """
+    return _ttls()[1] * 3600
+
+
+def cache_state(mtime):
+    """
+    'fresh' (younger than cache_ttl_hours), 'stale' (younger than
+    cache_hard_expiry_hours) or None (expired, treat as absent).
+    """
+    ttl_hours, hard_hours = _ttls()
+    age = time.time() - mtime
+    if age < ttl_hours * 3600:
+        return "fresh"
+    if age < hard_hours * 3600:
+        return "stale"
+    return None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        workers = int(config_manager.get_config().get("cache_revalidate_workers", 2))
+        _executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="revalidate")
+    return _executor
+
+
+def _run(key, fn, args, kwargs):
+    try:
+        fn(*args, **kwargs)
+        print(f"[revalidate] Refreshed {key}")
+    except Exception as e:
+        print(f"[revalidate] Refresh failed for {key}: {e}")
+    finally:
+        with _lock:
+            _pending.discard(key)
+
+
+def schedule(key, fn, *args, **kwargs):
+    """
+    Queue fn(*args, **kwargs) to refresh `key` in the background.
+    Returns False if that key is already queued or the queue is full.
+    """
+    with _lock:
+        if key in _pending or len(_pending) >= MAX_PENDING:
+            return False
+        _pending.add(key)
+        executor = _get_executor()
+    executor.submit(_run, key, fn, args, kwargs)
+    return True
+
+
+def pending_count():
+    with _lock:
+        return len(_pending)
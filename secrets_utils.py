@@ -0,0 +1,31 @@
+import os
+
+# Secrets for code that also runs outside Streamlit (api_service, pipeline).
+# Environment variables win; .streamlit/secrets.toml (st.secrets) is only read
+# when streamlit is installed and the file exists, so the headless API runs
+# with neither.
+
+_MISSING = object()
+_st_secrets = _MISSING
+
+
+def _streamlit_secrets():
+    """
+    st.secrets as a plain dict, or {} without streamlit / secrets.toml.
+    Loaded once per process.
+    """
+    global _st_secrets
+    if _st_secrets is _MISSING:
+        try:
+            import streamlit as st
+            _st_secrets = dict(st.secrets)
+        except Exception:  # ImportError, or no secrets.toml
+            _st_secrets = {}
+    return _st_secrets
+
+
+def get_secret(name, default=None):
+    value = os.environ.get(name)
+    if value:
+        return value
+    return _streamlit_secrets().get(name, default)
@@ -0,0 +1,159 @@
+import copy
+import json
+import asyncio
+import hashlib
+import threading
+import functools
+
+import locks
+
+# Single-flight: concurrent calls with the same key share one computation.
+# The first caller (leader) runs the function; callers arriving while it is in
+# flight wait and get a copy of its result (or its exception). The leader keeps
+# the original; followers copy from a snapshot taken before they are woken, so
+# a leader mutating its result can't tear a follower's copy.
+#
+# cross_process=True additionally serializes the leaders of different
+# processes through a file lock (see locks.py). Only useful for functions that
+# check a disk cache first: the second process gets the lock after the first
+# one has written the cache, and hits it instead of calling the API again.
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+_inflight_async = {}  # (loop, key) -> [Future, followers]; only touched from that loop
+_stats = {"leader": 0, "shared": 0}
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None  # Followers' snapshot
+        self.error = None
+        self.waiters = 0
+
+
+def normalize_address(address):
+    """
+    Case/whitespace-insensitive form of an address for use in keys.
+    """
+    return " ".join(str(address or "").lower().replace(",", " , ").split())
+
+
+def make_key(namespace, *parts):
+    raw = json.dumps(parts, sort_keys=True, default=str).encode("utf-8")
+    return f"{namespace}:{hashlib.md5(raw).hexdigest()}"
+
+
+def do(key, fn, *args, cross_process=False, lock_timeout=120, **kwargs):
+    """
+    Run fn(*args, **kwargs) at most once at a time per key.
+    """
+    with _inflight_lock:
+        call = _inflight.get(key)
+        leader = call is None
+        if leader:
+            call = _Call()
+            _inflight[key] = call
+            _stats["leader"] += 1
+        else:
+            call.waiters += 1
+            _stats["shared"] += 1
+
+    if not leader:
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        # Callers are free to mutate what they get back
+        return copy.deepcopy(call.result)
+
+    result = None
+    try:
+        if cross_process:
+            with locks.file_lock(key, timeout=lock_timeout):
+                result = fn(*args, **kwargs)
+        else:
+            result = fn(*args, **kwargs)
+        return result
+    except BaseException as e:
+        call.error = e
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)  # No new followers after this
+            waiters = call.waiters
+        try:
+            if waiters and call.error is None:
+                call.result = copy.deepcopy(result)
+        except BaseException as e:
+            call.error = e
+        finally:
+            call.done.set()
+
+
+def singleflight(namespace, key_fn=None, cross_process=False):
+    """
+    Decorator form of do(). key_fn(*args, **kwargs) returns the parts that
+    identify a request (default: all arguments).
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            parts = key_fn(*args, **kwargs) if key_fn else (args, kwargs)
+            return do(make_key(namespace, parts), fn, *args, cross_process=cross_process, **kwargs)
+        return wrapper
+    return decorator
+
+
+async def do_async(key, fn, *args, **kwargs):
+    """
+    Async do(): await fn(*args, **kwargs) at most once at a time per key
+    (per event loop).
+    """
+    flight = (asyncio.get_running_loop(), key)
+    entry = _inflight_async.get(flight)
+    if entry is not None:
+        entry[1] += 1
+        with _inflight_lock:
+            _stats["shared"] += 1
+        # shield: a cancelled follower mustn't cancel the leader's call
+        return copy.deepcopy(await asyncio.shield(entry[0]))
+
+    with _inflight_lock:
+        _stats["leader"] += 1
+    fut = asyncio.get_running_loop().create_future()
+    entry = _inflight_async[flight] = [fut, 0]  # [future, followers]
+    try:
+        result = await fn(*args, **kwargs)
+        # Followers resume after the leader has returned; give them a snapshot
+        fut.set_result(copy.deepcopy(result) if entry[1] else result)
+        return result
+    except asyncio.CancelledError:
+        fut.cancel()
+        raise
+    except BaseException as e:
+        fut.set_exception(e)
+        fut.exception()  # Mark retrieved when nobody was waiting
+        raise
+    finally:
+        _inflight_async.pop(flight, None)
+
+
+def singleflight_async(namespace, key_fn=None):
+    """
+    Decorator form of do_async(), for coroutine functions.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            parts = key_fn(*args, **kwargs) if key_fn else (args, kwargs)
+            return await do_async(make_key(namespace, parts), fn, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def stats():
+    """
+    {'leader': calls that ran, 'shared': calls that reused an in-flight result}
+    """
+    with _inflight_lock:
+        return dict(_stats)
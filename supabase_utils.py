@@ -1,11 +1,11 @@
 import os
 import datetime
-from supabase import create_client, Client
 import streamlit as st
 
 # Helper to get client
 def get_supabase_client():
     try:
+        from supabase import create_client
         # Try loading from Streamlit secrets (Top-level or Nested)
         url = st.secrets.get("SUPABASE_URL")
         key = st.secrets.get("SUPABASE_KEY")
@@ -71,6 +71,28 @@ def get_valid_cache(address, hours_valid=240):
         print(f"Supabase Read Error: {e}")
         return None
 
+def get_recent_addresses(days=14, limit=2000):
+    """
+    (address, created_at) of analyses logged in the last `days` days, newest first.
+    Used by cache_warmer to find popular addresses.
+    """
+    supabase = get_supabase_client()
+    if not supabase:
+        return []
+
+    try:
+        cutoff = (datetime.datetime.utcnow() - datetime.timedelta(days=days)).isoformat()
+        data = supabase.table("property_logs")\
+            .select("address, created_at")\
+            .gte("created_at", cutoff)\
+            .order("created_at", desc=True)\
+            .limit(limit)\
+            .execute()
+        return [(r.get("address"), r.get("created_at")) for r in (data.data or []) if r.get("address")]
+    except Exception as e:
+        print(f"Supabase Read Error: {e}")
+        return []
+
 def save_analysis(user_email, address, result_json):
     """
     Save a new analysis to Supabase.
@@ -0,0 +1,121 @@
+import math
+from xml.sax.saxutils import escape
+
+import viz_utils
+
+# Minimal SVG bar charts for email reports.
+# Same data, colors and category order as the Plotly charts in viz_utils
+# (via viz_utils.build_chart_series), but rendered as plain strings:
+# no kaleido, no headless browser, a few milliseconds per report.
+
+FONT = "Inter, Roboto, Arial, sans-serif"
+TEXT_COLOR = "#202124"
+MUTED_COLOR = "#5F6368"
+GRID_COLOR = "#EBF0F8"
+STATE_FALLBACK = viz_utils.STATE_COLOR
+
+MARGIN_LEFT = 48
+MARGIN_RIGHT = 10
+MARGIN_TOP = 56  # Title + legend row
+MARGIN_BOTTOM = 28
+
+
+def _nice_step(max_value, ticks=4):
+    """
+    Round the axis step to 1/2/5 x 10^n so gridlines land on readable numbers.
+    """
+    if max_value <= 0:
+        return 1
+    raw = max_value / ticks
+    magnitude = 10 ** math.floor(math.log10(raw))
+    for m in (1, 2, 5, 10):
+        if raw <= m * magnitude:
+            return m * magnitude
+    return 10 * magnitude
+
+
+def _fmt(value, text_format):
+    return format(value, text_format)
+
+
+def _text(x, y, s, size=11, color=TEXT_COLOR, anchor="start", weight="normal"):
+    return (f'<text x="{x:.1f}" y="{y:.1f}" font-family="{FONT}" font-size="{size}" fill="{color}" '
+            f'text-anchor="{anchor}" font-weight="{weight}">{escape(str(s))}</text>')
+
+
+def render_chart_svg(chart, scopes, colors, width=600, height=300, show_legend=True):
+    """
+    Render one chart spec from viz_utils.build_chart_series to an SVG string.
+    """
+    values = chart["values"]
+    grouped = chart["categories"] is not None
+    # Income is one bar per scope; the others are grouped bars per category
+    groups = chart["categories"] if grouped else scopes
+
+    plot_w = width - MARGIN_LEFT - MARGIN_RIGHT
+    plot_h = height - MARGIN_TOP - MARGIN_BOTTOM
+    max_value = max([v for sc in scopes for v in values[sc]] + [0])
+    step = _nice_step(max_value)
+    axis_max = step * max(1, math.ceil(max_value * 1.08 / step))  # headroom for bar labels
+
+    def y_of(v):
+        return MARGIN_TOP + plot_h - (v / axis_max) * plot_h
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}">',
+        f'<rect width="{width}" height="{height}" fill="#FFFFFF"/>',
+        _text(MARGIN_LEFT, 18, chart["title"], size=13, weight="bold"),
+    ]
+
+    # Gridlines + Y ticks
+    tick = 0
+    while tick <= axis_max + 1e-9:
+        y = y_of(tick)
+        parts.append(f'<line x1="{MARGIN_LEFT}" y1="{y:.1f}" x2="{width - MARGIN_RIGHT}" y2="{y:.1f}" stroke="{GRID_COLOR}"/>')
+        parts.append(_text(MARGIN_LEFT - 6, y + 4, _fmt(tick, ",.0f"), size=10, color=MUTED_COLOR, anchor="end"))
+        tick += step
+    parts.append(_text(12, MARGIN_TOP - 8, chart["y_label"], size=10, color=MUTED_COLOR))
+
+    # Bars
+    group_w = plot_w / len(groups)
+    bars_per_group = len(scopes) if grouped else 1
+    bar_w = group_w * 0.8 / bars_per_group
+    label_size = 9 if bars_per_group > 3 else 10
+
+    for gi, group in enumerate(groups):
+        gx = MARGIN_LEFT + gi * group_w + group_w * 0.1
+        series = [(sc, values[sc][gi]) for sc in scopes] if grouped else [(group, values[group][0])]
+        for bi, (sc, v) in enumerate(series):
+            x = gx + bi * bar_w
+            y = y_of(v)
+            parts.append(f'<rect x="{x:.1f}" y="{y:.1f}" width="{bar_w - 1:.1f}" height="{MARGIN_TOP + plot_h - y:.1f}" fill="{colors.get(sc, STATE_FALLBACK)}"/>')
+            parts.append(_text(x + bar_w / 2, y - 3, _fmt(v, chart["text_format"]), size=label_size, anchor="middle"))
+        parts.append(_text(MARGIN_LEFT + gi * group_w + group_w / 2, height - 10, group, size=11, color=MUTED_COLOR, anchor="middle"))
+
+    # Legend (right aligned, like the Plotly layout)
+    if show_legend and grouped:
+        x = width - MARGIN_RIGHT
+        for sc in reversed(scopes):
+            label_w = 6.5 * len(sc)
+            x -= label_w
+            parts.append(_text(x, 38, sc, size=10, color=MUTED_COLOR))
+            x -= 14
+            parts.append(f'<rect x="{x:.1f}" y="29" width="10" height="10" fill="{colors.get(sc, STATE_FALLBACK)}"/>')
+            x -= 10
+
+    parts.append("</svg>")
+    return "".join(parts)
+
+
+def render_census_svgs(census_data, address_input="", width=600, height=300):
+    """
+    SVG bytes for the four census charts, keyed like viz_utils.get_chart_images.
+    """
+    if not census_data or "metrics" not in census_data:
+        return {}
+
+    series = viz_utils.build_chart_series(census_data, address_input)
+    return {
+        name: render_chart_svg(chart, series["scopes"], series["colors"][name], width, height).encode("utf-8")
+        for name, chart in series["charts"].items()
+    }
@@ -0,0 +1,92 @@
+import struct
+import datetime
+import zlib
+
+import pytest
+
+import cache_codec
+from cache_codec import CacheCorruptError, CacheFormatError
+
+
+@pytest.mark.parametrize("value", [
+    None,
+    0,
+    -1.5,
+    "plain text",
+    "unicode: café ünïcødé 🏠",
+    [],
+    {},
+    {"nested": {"list": [1, 2.5, None, True, "x"], "empty": {}}},
+    [{"a": 1}, {"b": [2, 3]}],
+])
+def test_round_trip(value):
+    assert cache_codec.loads(cache_codec.dumps(value)) == value
+
+
+def test_round_trip_bytes():
+    png = b"\x89PNG\r\n\x1a\n" + bytes(range(256))
+    value = {"images": {"income": png, "age": b""}, "meta": {"count": 2}}
+    blob = cache_codec.dumps(value)
+    assert cache_codec.loads(blob) == value
+    assert blob[7] & cache_codec.FLAG_BYTES
+
+
+def test_tuples_come_back_as_lists():
+    assert cache_codec.loads(cache_codec.dumps({"point": (1.5, 2.5)})) == {"point": [1.5, 2.5]}
+
+
+@pytest.mark.parametrize("value", [object(), datetime.date(2024, 1, 1), {"when": datetime.datetime(2024, 1, 1)}])
+def test_unknown_types_are_rejected(value):
+    with pytest.raises(TypeError):
+        cache_codec.dumps(value)
+
+
+def test_large_payload_is_compressed():
+    value = {"rows": [{"name": f"Place {i}", "distance": i} for i in range(500)]}
+    blob = cache_codec.dumps(value)
+    compression = blob[6]
+    assert compression in (cache_codec.COMPRESSION_ZLIB, cache_codec.COMPRESSION_ZSTD)
+    assert cache_codec.loads(blob) == value
+
+
+def test_small_payload_is_stored_plain():
+    assert cache_codec.dumps({"a": 1})[6] == cache_codec.COMPRESSION_NONE
+
+
+@pytest.mark.parametrize("value", [{"a": 1}, {"rows": list(range(1000))}])
+def test_truncated_entry_is_corrupt(value):
+    blob = cache_codec.dumps(value)
+    with pytest.raises(CacheCorruptError):
+        cache_codec.loads(blob[:-3])
+    with pytest.raises(CacheCorruptError):
+        cache_codec.loads(blob[:5])  # Shorter than the header
+
+
+@pytest.mark.parametrize("value", [{"a": 1}, {"rows": list(range(1000))}])
+def test_bit_flip_is_corrupt(value):
+    blob = bytearray(cache_codec.dumps(value))
+    blob[-1] ^= 0x01
+    with pytest.raises(CacheCorruptError):
+        cache_codec.loads(bytes(blob))
+
+
+def test_bad_body_with_valid_checksum_is_corrupt():
+    body = b"{not json"
+    header = struct.pack(">4sHBBI", cache_codec.MAGIC, cache_codec.SCHEMA_VERSION,
+                         cache_codec.COMPRESSION_NONE, 0, zlib.crc32(body))
+    with pytest.raises(CacheCorruptError):
+        cache_codec.loads(header + body)
+
+
+def test_foreign_data_is_a_clean_miss():
+    with pytest.raises(CacheFormatError) as exc:
+        cache_codec.loads(b"\x80\x04\x95" + b"\x00" * 20)  # A pickle
+    assert not isinstance(exc.value, CacheCorruptError)
+
+
+def test_other_schema_is_a_clean_miss(monkeypatch):
+    blob = cache_codec.dumps({"a": 1})
+    monkeypatch.setattr(cache_codec, "SCHEMA_VERSION", cache_codec.SCHEMA_VERSION + 1)
+    with pytest.raises(CacheFormatError) as exc:
+        cache_codec.loads(blob)
+    assert not isinstance(exc.value, CacheCorruptError)
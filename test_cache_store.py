@@ -0,0 +1,118 @@
+import os
+import threading
+
+import pytest
+
+import cache_codec
+import cache_store
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # Lock files (locks.LOCK_DIR is relative) stay in the temp dir
+    yield str(tmp_path / "analysis_cache")
+    cache_store.flush_stats()  # Now, not at exit from another working directory
+
+
+def _entry(cache_dir, stem="poi_test"):
+    return cache_codec.cache_file(cache_dir, stem)
+
+
+def test_write_then_read(cache_dir):
+    path = _entry(cache_dir)
+    cache_store.write(path, {"pois": [1, 2, 3]})
+    value, mtime = cache_store.read_entry(path)
+    assert value == {"pois": [1, 2, 3]}
+    assert mtime == os.path.getmtime(path)
+    assert not [f for f in os.listdir(cache_dir) if f.endswith(".tmp")]
+
+
+def test_expired_and_missing_are_misses(cache_dir):
+    path = _entry(cache_dir)
+    assert cache_store.read(path) is None
+    cache_store.write(path, {"a": 1})
+    assert cache_store.read(path, max_age=0) is None
+    assert cache_store.read(path, max_age=60) == {"a": 1}
+
+
+def test_corrupt_entry_is_quarantined(cache_dir):
+    path = _entry(cache_dir)
+    cache_store.write(path, {"rows": list(range(1000))})
+    with open(path, "r+b") as f:
+        f.seek(-1, os.SEEK_END)
+        last = f.read(1)
+        f.seek(-1, os.SEEK_END)
+        f.write(bytes([last[0] ^ 0xFF]))
+
+    before = cache_store.stats()["quarantined"]
+    assert cache_store.read(path) is None
+    assert not os.path.exists(path)
+    quarantined = os.listdir(os.path.join(cache_dir, cache_store.QUARANTINE_DIR))
+    assert len(quarantined) == 1 and quarantined[0].startswith(os.path.basename(path))
+    assert cache_store.stats()["quarantined"] == before + 1
+
+    # Next read is a plain miss, and the next write replaces the entry
+    assert cache_store.read(path) is None
+    cache_store.write(path, {"a": 1})
+    assert cache_store.read(path) == {"a": 1}
+
+
+def test_other_schema_is_left_in_place(cache_dir, monkeypatch):
+    path = _entry(cache_dir)
+    cache_store.write(path, {"a": 1})
+    monkeypatch.setattr(cache_codec, "SCHEMA_VERSION", cache_codec.SCHEMA_VERSION + 1)
+    assert cache_store.read(path) is None
+    assert os.path.exists(path)
+    assert not os.path.exists(os.path.join(cache_dir, cache_store.QUARANTINE_DIR))
+
+
+def test_failed_write_keeps_old_entry(cache_dir, monkeypatch):
+    path = _entry(cache_dir)
+    cache_store.write(path, {"version": 1})
+
+    def fail(fd):
+        raise OSError("disk full")
+    before = cache_store.stats()["write_errors"]
+    with monkeypatch.context() as m:
+        m.setattr(os, "fsync", fail)
+        with pytest.raises(OSError):
+            cache_store.write(path, {"version": 2})
+
+    assert cache_store.read(path) == {"version": 1}
+    assert cache_store.stats()["write_errors"] == before + 1
+    assert not [f for f in os.listdir(cache_dir) if f.endswith(".tmp")]
+
+
+def test_concurrent_reader_never_sees_a_partial_write(cache_dir):
+    path = _entry(cache_dir)
+    # Large, poorly compressible values so a write spans many syscalls
+    values = [{"version": v, "rows": [f"{v}-{i}-{i * 7919 % 10007}" for i in range(20000)]} for v in range(2)]
+    cache_store.write(path, values[0])
+
+    stop = threading.Event()
+    seen, errors = [], []
+
+    def reader():
+        while not stop.is_set():
+            try:
+                value = cache_store.read(path)
+            except Exception as e:  # pragma: no cover - a failure is what we're looking for
+                errors.append(e)
+                return
+            seen.append(value["version"] if value is not None else None)
+
+    quarantined = cache_store.stats()["quarantined"]
+    threads = [threading.Thread(target=reader) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for i in range(30):
+        cache_store.write(path, values[i % 2])
+    stop.set()
+    for t in threads:
+        t.join()
+
+    assert not errors
+    assert seen and set(seen) <= {0, 1}  # Never a miss or a damaged entry
+    assert cache_store.stats()["quarantined"] == quarantined
+    assert not os.path.exists(os.path.join(cache_dir, cache_store.QUARANTINE_DIR))
+    assert not [f for f in os.listdir(cache_dir) if f.endswith(".tmp")]
@@ -0,0 +1,51 @@
+import asyncio
+
+import census_trends
+
+GEOID = {"state": "48", "county": "453", "tract": "001100", "block_group": "2"}
+
+# Block group 2 was redrawn in 2020: the 2022 code is a much smaller area
+ROWS = {
+    "block group": {2013: {"population": 2400, "median_income": 60000},
+                    2017: {"population": 2450, "median_income": 62000},
+                    2019: {"population": 2500, "median_income": 64000},
+                    2022: {"population": 900, "median_income": 61000}},
+    "tract": {2013: {"population": 6000, "median_income": 58000},
+              2017: {"population": 6100, "median_income": 60000},
+              2019: {"population": 6200, "median_income": 62000},
+              2022: {"population": 4100, "median_income": 60000}},
+    "county": {2013: {"population": 1100000, "median_income": 55000},
+               2017: {"population": 1200000, "median_income": 61000},
+               2019: {"population": 1250000, "median_income": 67000},
+               2022: {"population": 1300000, "median_income": 80000}},
+}
+
+
+def _trends(monkeypatch, vintages):
+    requested = []
+
+    async def fetch(vintage, level, geoid_data):
+        requested.append((vintage, level))
+        return dict(ROWS[level][vintage])
+
+    monkeypatch.setattr(census_trends, "fetch_vintage_async", fetch)
+    return asyncio.run(census_trends.get_trends_async(GEOID, vintages)), requested
+
+
+def test_reused_geoid_across_the_redraw_is_not_compared(monkeypatch):
+    trends, requested = _trends(monkeypatch, [2013, 2017, 2022])
+    assert trends["level"] == "county"
+    assert {level for _, level in requested} == {"county"}
+    assert not any("Population down" in f for f in trends["red_flags"])
+
+
+def test_same_boundaries_compare_block_groups(monkeypatch):
+    trends, _ = _trends(monkeypatch, [2013, 2019])
+    assert trends["level"] == "block group"
+    assert trends["trends"]["population"]["change_pct"] == 4.2
+
+
+def test_comparable_levels():
+    assert census_trends.comparable_levels([2013, 2017]) == census_trends.LEVELS
+    assert census_trends.comparable_levels([2020, 2023]) == census_trends.LEVELS
+    assert census_trends.comparable_levels([2019, 2020]) == ["county"]
@@ -0,0 +1,147 @@
+import asyncio
+import itertools
+import types
+
+import pytest
+
+import aio
+import circuit_breaker
+from circuit_breaker import CLOSED, OPEN, HALF_OPEN, CircuitOpenError
+
+_names = itertools.count()
+
+
+class _FakeClient:
+    """
+    Stand-in for aio.get_client(): replies with `status`, or hangs until cancelled if hang=True.
+    """
+    def __init__(self, status=200, hang=False):
+        self.status = status
+        self.hang = hang
+        self.calls = 0
+
+    async def get(self, url, **kwargs):
+        self.calls += 1
+        if self.hang:
+            await asyncio.Event().wait()
+        return types.SimpleNamespace(status_code=self.status)
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    # Fresh provider per test; 50% failure rate, 4 s slow calls, 0.05 s open
+    b = circuit_breaker.get_breaker(f"test_provider_{next(_names)}")
+    monkeypatch.setattr(b, "_settings", lambda: (0.5, 4.0, 0.05))
+    return b
+
+
+@pytest.fixture
+def client(monkeypatch):
+    fake = _FakeClient()
+    monkeypatch.setattr(aio, "get_client", lambda: fake)
+    return fake
+
+
+def _trip(b):
+    for _ in range(circuit_breaker.MIN_CALLS):
+        b.record(False, 0.01, error="HTTP 503")
+    assert b.state == OPEN
+
+
+def test_opens_on_failure_rate(breaker):
+    breaker.record(True, 0.01)
+    breaker.record(False, 0.01)
+    breaker.record(True, 0.01)
+    assert breaker.state == CLOSED  # Below MIN_CALLS
+    breaker.record(False, 0.01)
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.short_circuited == 1
+
+
+def test_slow_calls_count_as_failures(breaker):
+    for _ in range(circuit_breaker.MIN_CALLS):
+        breaker.record(True, 5.0)
+    assert breaker.state == OPEN
+    assert "slow call" in breaker.last_error
+
+
+def test_bulk_calls_are_exempt_from_the_slow_count(breaker):
+    for _ in range(circuit_breaker.MIN_CALLS * 2):
+        breaker.record(True, 8.0, count_slow=False)  # e.g. a county-wide ACS prefetch
+    assert breaker.state == CLOSED
+    for _ in range(circuit_breaker.MIN_CALLS * 2):
+        breaker.record(False, 8.0, error="HTTP 503", count_slow=False)
+    assert breaker.state == OPEN  # Errors still count
+
+
+def test_half_open_probe_success_closes(breaker):
+    _trip(breaker)
+    asyncio.run(asyncio.sleep(0.06))
+    assert breaker.allow()  # The probe
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()  # Only one probe at a time
+    breaker.record(True, 0.01)
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_half_open_probe_failure_reopens(breaker):
+    _trip(breaker)
+    asyncio.run(asyncio.sleep(0.06))
+    assert breaker.allow()
+    breaker.record(False, 0.01, error="HTTP 500")
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+
+def test_async_open_breaker_skips_request(breaker, client):
+    _trip(breaker)
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(circuit_breaker.http_get_async(breaker.name, "http://example.invalid"))
+    assert client.calls == 0
+
+
+def test_async_5xx_counts_as_failure(breaker, client):
+    client.status = 503
+    for _ in range(circuit_breaker.MIN_CALLS):
+        resp = asyncio.run(circuit_breaker.http_get_async(breaker.name, "http://example.invalid"))
+        assert resp.status_code == 503  # Still returned to the caller
+    assert breaker.state == OPEN
+
+
+def test_cancelled_probe_frees_the_slot(breaker, client):
+    _trip(breaker)
+    asyncio.run(asyncio.sleep(0.06))
+    client.hang = True
+
+    async def cancel_probe():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(circuit_breaker.http_get_async(breaker.name, "http://example.invalid"), 0.05)
+
+    asyncio.run(cancel_probe())
+    assert client.calls == 1
+    assert breaker.state == HALF_OPEN
+    assert not breaker.probe_in_flight
+
+    # The next call probes again and closes the breaker
+    client.hang = False
+    resp = asyncio.run(circuit_breaker.http_get_async(breaker.name, "http://example.invalid"))
+    assert resp.status_code == 200
+    assert breaker.state == CLOSED
+
+
+def test_cancelled_call_while_closed_is_not_a_failure(breaker, client):
+    client.hang = True
+
+    async def cancel_calls():
+        tasks = [asyncio.ensure_future(circuit_breaker.http_get_async(breaker.name, "http://example.invalid"))
+                 for _ in range(circuit_breaker.MIN_CALLS)]
+        await asyncio.sleep(0.01)
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    asyncio.run(cancel_calls())
+    assert breaker.state == CLOSED
+    assert not breaker.calls
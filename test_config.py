@@ -1,7 +1,7 @@
 import time
 import os
 import json
-from config_manager import config_manager, CONFIG_FILE
+from config_manager import config_manager, CONFIG_FILE, CONFIG_POLL_SECONDS, _thaw
 
 def test_config_reload():
     print("Testing Config Manager Reload...")
@@ -11,7 +11,7 @@ def test_config_reload():
     print(f"Initial Config Model: {start_config.get('model_name')}")
     
     # Modify config file directly
-    new_config = start_config.copy()
+    new_config = _thaw(start_config)  # Nested values are frozen too
     new_config['model_name'] = "test-model-reload"
     
     # Wait a bit to ensure mtime changes
@@ -20,8 +20,12 @@ def test_config_reload():
     with open(CONFIG_FILE, 'w') as f:
         json.dump(new_config, f)
     
-    # Check if ConfigManager picks it up
+    # Check if ConfigManager picks it up (the watcher polls every CONFIG_POLL_SECONDS)
+    deadline = time.time() + CONFIG_POLL_SECONDS * 3
     updated_config = config_manager.get_config()
+    while updated_config.get('model_name') != "test-model-reload" and time.time() < deadline:
+        time.sleep(0.1)
+        updated_config = config_manager.get_config()
     print(f"Updated Config Model: {updated_config.get('model_name')}")
     
     if updated_config.get('model_name') == "test-model-reload":
@@ -30,7 +34,7 @@ def test_config_reload():
         print("FAILURE: Config reload NOT detected.")
 
     # Clean up (restore default/original)
-    original_config = start_config
+    original_config = _thaw(start_config)  # Nested values are frozen too
     if original_config.get('model_name') == "test-model-reload":
         original_config['model_name'] = "gemini-2.5-flash"
         
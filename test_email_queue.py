@@ -0,0 +1,231 @@
+import json
+import os
+import socketserver
+import threading
+import time
+from email.mime.text import MIMEText
+
+import pytest
+
+import email_queue
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """
+    Minimal SMTP dialogue (no STARTTLS / AUTH advertised).
+    """
+    def _reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        srv = self.server
+        self._reply("220 localhost test smtp")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            cmd = line.decode().strip()
+            verb = cmd.split(" ", 1)[0].upper()
+            if verb == "EHLO":
+                self._reply("250-localhost")
+                self._reply("250 SIZE 1000000")
+            elif verb == "HELO":
+                self._reply("250 localhost")
+            elif verb == "MAIL":
+                if srv.fail_mail > 0:
+                    srv.fail_mail -= 1
+                    self._reply("451 Try again later")
+                else:
+                    self._reply("250 OK")
+            elif verb == "RCPT":
+                self._reply("550 No such user" if srv.refuse_rcpt else "250 OK")
+            elif verb == "DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                body = []
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data in (b".\r\n", b".\n"):
+                        break
+                    body.append(data)
+                srv.messages.append(b"".join(body).decode())
+                self._reply("250 Queued")
+            elif verb in ("NOOP", "RSET"):
+                self._reply("250 OK")
+            elif verb == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Command not implemented")
+
+
+class _SMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _SMTPHandler)
+        self.messages = []
+        self.fail_mail = 0  # Reply 451 to the next N MAIL commands
+        self.refuse_rcpt = False
+
+
+@pytest.fixture
+def smtp_server():
+    server = _SMTPServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def make_worker(smtp_server, tmp_path):
+    workers = []
+
+    def make():
+        w = email_queue.EmailDeliveryWorker(None, None, host="127.0.0.1", port=smtp_server.server_address[1],
+                                            queue_dir=str(tmp_path))
+        workers.append(w)
+        return w
+
+    yield make
+    for w in workers:
+        w._close()
+
+
+def _enqueue(queue_dir, to="buyer@example.com"):
+    msg = MIMEText("Your analysis is ready.")
+    msg["Subject"] = "Analysis"
+    return email_queue.enqueue(msg, "reports@example.com", to, queue_dir=queue_dir)
+
+
+def _entry(queue_dir, state, entry_id):
+    with open(os.path.join(queue_dir, state, f"{entry_id}.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_delivers_and_removes_entry(smtp_server, make_worker, tmp_path):
+    _enqueue(str(tmp_path))
+    worker = make_worker()
+    assert worker.run_once() == 1
+    assert len(smtp_server.messages) == 1
+    assert "Your analysis is ready." in smtp_server.messages[0]
+    assert email_queue.queue_stats(str(tmp_path)) == {"pending": 0, "processing": 0, "failed": 0}
+
+
+def test_transient_failure_retries_with_backoff(smtp_server, make_worker, tmp_path):
+    queue_dir = str(tmp_path)
+    entry_id = _enqueue(queue_dir)
+    worker = make_worker()
+    smtp_server.fail_mail = 2
+
+    start = time.time()
+    assert worker.run_once() == 0
+    entry = _entry(queue_dir, "pending", entry_id)
+    assert entry["attempts"] == 1
+    assert "451" in entry["last_error"]
+    first_delay = entry["next_attempt"] - start
+    assert email_queue.BACKOFF_BASE_SECONDS <= first_delay <= email_queue.BACKOFF_BASE_SECONDS + 1.5
+
+    assert worker.run_once() == 0  # Not due yet
+    assert _entry(queue_dir, "pending", entry_id)["attempts"] == 1
+
+    # Make it due: the second failure doubles the delay
+    entry["next_attempt"] = 0
+    email_queue._write_json_atomic(os.path.join(queue_dir, "pending", f"{entry_id}.json"), entry)
+    start = time.time()
+    assert worker.run_once() == 0
+    entry = _entry(queue_dir, "pending", entry_id)
+    assert entry["attempts"] == 2
+    second_delay = entry["next_attempt"] - start
+    assert 2 * email_queue.BACKOFF_BASE_SECONDS <= second_delay <= 2 * email_queue.BACKOFF_BASE_SECONDS + 1.5
+
+    entry["next_attempt"] = 0
+    email_queue._write_json_atomic(os.path.join(queue_dir, "pending", f"{entry_id}.json"), entry)
+    assert worker.run_once() == 1
+    assert len(smtp_server.messages) == 1
+    assert email_queue.queue_stats(queue_dir) == {"pending": 0, "processing": 0, "failed": 0}
+
+
+def test_moves_to_failed_after_max_attempts(smtp_server, make_worker, tmp_path, monkeypatch):
+    monkeypatch.setattr(email_queue, "MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(email_queue, "BACKOFF_BASE_SECONDS", 0)
+    monkeypatch.setattr(email_queue.random, "uniform", lambda a, b: 0)
+    queue_dir = str(tmp_path)
+    entry_id = _enqueue(queue_dir)
+    worker = make_worker()
+    smtp_server.fail_mail = 10
+
+    assert worker.run_once() == 0
+    assert email_queue.queue_stats(queue_dir)["pending"] == 1
+    assert worker.run_once() == 0
+    assert email_queue.queue_stats(queue_dir) == {"pending": 0, "processing": 0, "failed": 1}
+    assert _entry(queue_dir, "failed", entry_id)["attempts"] == 2
+    assert not smtp_server.messages
+
+
+def test_refused_recipient_fails_immediately(smtp_server, make_worker, tmp_path):
+    queue_dir = str(tmp_path)
+    entry_id = _enqueue(queue_dir, to="nobody@example.com")
+    smtp_server.refuse_rcpt = True
+
+    assert make_worker().run_once() == 0
+    assert email_queue.queue_stats(queue_dir) == {"pending": 0, "processing": 0, "failed": 1}
+    assert _entry(queue_dir, "failed", entry_id)["attempts"] == 1
+
+
+def test_two_workers_send_once(smtp_server, make_worker, tmp_path):
+    _enqueue(str(tmp_path))
+    a, b = make_worker(), make_worker()
+
+    # Both processes see the entry as due before either sends it
+    due_a, due_b = a._due_entries(), b._due_entries()
+    assert len(due_a) == len(due_b) == 1
+    sent = 0
+    for worker, due in ((a, due_a), (b, due_b)):
+        for path, _ in due:
+            claim = worker._claim(path)
+            if claim and worker._deliver(*claim):
+                sent += 1
+    assert sent == 1
+    assert len(smtp_server.messages) == 1
+
+
+def test_requeued_entry_is_not_resent_from_a_stale_listing(smtp_server, make_worker, tmp_path):
+    queue_dir = str(tmp_path)
+    entry_id = _enqueue(queue_dir)
+    a, b = make_worker(), make_worker()
+    smtp_server.fail_mail = 1
+
+    # Both list the entry as due; a tries first, fails and puts it back
+    due_a, due_b = a._due_entries(), b._due_entries()
+    (path, _), = due_a
+    assert not a._deliver(*a._claim(path))
+    requeued = _entry(queue_dir, "pending", entry_id)
+    assert requeued["attempts"] == 1 and requeued["next_attempt"] > time.time()
+
+    # b's listing is stale: its claim sees the backoff and gives the entry back
+    (path, stale), = due_b
+    assert stale["attempts"] == 0
+    assert b._claim(path) is None
+    assert _entry(queue_dir, "pending", entry_id) == requeued
+    assert email_queue.queue_stats(queue_dir) == {"pending": 1, "processing": 0, "failed": 0}
+    assert not smtp_server.messages
+
+
+def test_stale_claim_is_requeued(smtp_server, make_worker, tmp_path):
+    queue_dir = str(tmp_path)
+    _enqueue(queue_dir)
+    worker = make_worker()
+    path, _ = worker._due_entries()[0]
+    claimed, _ = worker._claim(path)  # Worker "dies" here
+
+    assert worker.run_once() == 0  # Fresh claim: left alone
+    assert email_queue.queue_stats(queue_dir)["processing"] == 1
+
+    old = time.time() - email_queue.CLAIM_TIMEOUT_SECONDS - 1
+    os.utime(claimed, (old, old))
+    assert worker.run_once() == 1
+    assert len(smtp_server.messages) == 1
+    assert email_queue.queue_stats(queue_dir) == {"pending": 0, "processing": 0, "failed": 0}
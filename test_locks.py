@@ -0,0 +1,53 @@
+import os
+
+import locks
+
+
+def _held_by_someone(path):
+    with open(path, "a+") as f:
+        try:
+            locks.fcntl.flock(f.fileno(), locks.fcntl.LOCK_EX | locks.fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        locks.fcntl.flock(f.fileno(), locks.fcntl.LOCK_UN)
+        return False
+
+
+def test_lock_is_exclusive(tmp_path):
+    with locks.file_lock("k", lock_dir=str(tmp_path)) as acquired:
+        assert acquired
+        assert _held_by_someone(locks.lock_path("k", str(tmp_path)))
+        with locks.file_lock("k", timeout=0.1, lock_dir=str(tmp_path)) as again:
+            assert not again
+
+
+def test_lock_file_removed_while_waiting_is_reopened(tmp_path, monkeypatch):
+    lock_dir = str(tmp_path)
+    path = locks.lock_path("k", lock_dir)
+    real_flock = locks.fcntl.flock
+    removed = []
+
+    def flock(fd, op):
+        # The cleaner unlinks the file after we opened it, before we lock it
+        if op & locks.fcntl.LOCK_EX and not removed:
+            os.remove(path)
+            removed.append(path)
+        return real_flock(fd, op)
+
+    monkeypatch.setattr(locks.fcntl, "flock", flock)
+    with locks.file_lock("k", lock_dir=lock_dir) as acquired:
+        assert acquired and removed
+        # We hold the file now at the path, not the orphaned one, so a
+        # newcomer opening the path is locked out
+        monkeypatch.setattr(locks.fcntl, "flock", real_flock)
+        assert _held_by_someone(path)
+
+
+def test_acquire_marks_the_lock_file_used(tmp_path):
+    path = locks.lock_path("k", str(tmp_path))
+    with locks.file_lock("k", lock_dir=str(tmp_path)):
+        pass
+    os.utime(path, (0, 0))
+    with locks.file_lock("k", lock_dir=str(tmp_path)):
+        pass
+    assert os.path.getmtime(path) > 0
@@ -0,0 +1,215 @@
+import time
+import asyncio
+import threading
+
+import pytest
+
+import singleflight
+
+
+def _wait_for_followers(before, n, timeout=5):
+    deadline = time.time() + timeout
+    while singleflight.stats()["shared"] - before < n:
+        assert time.time() < deadline, "followers never joined the flight"
+        time.sleep(0.005)
+
+
+def _run_threads(target, n):
+    results, errors = [None] * n, [None] * n
+
+    def run(i):
+        try:
+            results[i] = target(i)
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    return threads, results, errors
+
+
+def test_concurrent_calls_share_one_execution():
+    calls = []
+    release = threading.Event()
+
+    @singleflight.singleflight("test_share", key_fn=lambda address: singleflight.normalize_address(address))
+    def fetch(address):
+        calls.append(address)
+        release.wait(5)
+        return {"address": address, "pois": [1, 2, 3]}
+
+    before = singleflight.stats()["shared"]
+    addresses = ["123 Main St, Austin", "123  main st ,austin"] * 4
+    threads, results, errors = _run_threads(lambda i: fetch(addresses[i]), len(addresses))
+    _wait_for_followers(before, len(addresses) - 1)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert errors == [None] * len(addresses)
+    assert all(r == results[0] for r in results)
+
+    # Followers get copies: mutating one result doesn't leak into another
+    results[1]["pois"].append(4)
+    assert results[2]["pois"] == [1, 2, 3]
+
+
+def test_leader_mutating_its_result_does_not_reach_followers():
+    release = threading.Event()
+    leader_thread = []
+
+    @singleflight.singleflight("test_leader_mutates")
+    def fetch(key):
+        leader_thread.append(threading.current_thread())
+        release.wait(5)
+        return {"rows": list(range(1000))}
+
+    def call(i):
+        result = fetch("k")
+        if threading.current_thread() in leader_thread:
+            result["rows"].clear()  # Leader keeps working on its result
+            result["mutated"] = True
+        return result
+
+    before = singleflight.stats()["shared"]
+    threads, results, errors = _run_threads(call, 6)
+    _wait_for_followers(before, 5)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert errors == [None] * 6
+    followers = [r for r in results if "mutated" not in r]
+    assert len(followers) == 5
+    assert all(r == {"rows": list(range(1000))} for r in followers)
+
+
+def test_async_leader_mutating_its_result_does_not_reach_followers():
+    @singleflight.singleflight_async("test_async_leader_mutates")
+    async def fetch(key):
+        await asyncio.sleep(0.05)
+        return {"rows": [1, 2, 3]}
+
+    async def leader():
+        result = await fetch("k")
+        result["rows"].clear()  # Before the followers have resumed
+        return result
+
+    async def main():
+        first = asyncio.ensure_future(leader())
+        await asyncio.sleep(0)
+        return await asyncio.gather(first, *(fetch("k") for _ in range(3)))
+
+    results = asyncio.run(main())
+    assert results[0] == {"rows": []}
+    assert all(r == {"rows": [1, 2, 3]} for r in results[1:])
+
+
+def test_exception_reaches_every_caller_and_releases_the_key():
+    calls = []
+    release = threading.Event()
+
+    @singleflight.singleflight("test_error")
+    def fetch(key):
+        calls.append(key)
+        release.wait(5)
+        if len(calls) == 1:
+            raise ValueError("provider down")
+        return "ok"
+
+    before = singleflight.stats()["shared"]
+    threads, results, errors = _run_threads(lambda i: fetch("k"), 5)
+    _wait_for_followers(before, 4)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert all(isinstance(e, ValueError) and str(e) == "provider down" for e in errors)
+
+    # The failed flight is gone: the next call runs again
+    assert fetch("k") == "ok"
+    assert len(calls) == 2
+
+
+def test_different_keys_run_independently():
+    calls = []
+
+    @singleflight.singleflight("test_keys")
+    def fetch(key):
+        calls.append(key)
+        return key
+
+    assert [fetch("a"), fetch("b"), fetch("a")] == ["a", "b", "a"]
+    assert calls == ["a", "b", "a"]  # No caching once a flight has landed
+
+
+def test_cross_process_flight_runs_under_the_file_lock(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # locks.LOCK_DIR is relative
+
+    @singleflight.singleflight("test_cross", cross_process=True)
+    def fetch(key):
+        return key.upper()
+
+    assert fetch("x") == "X"
+
+
+def test_async_calls_share_one_execution():
+    calls = []
+
+    @singleflight.singleflight_async("test_async_share")
+    async def fetch(key):
+        calls.append(key)
+        await asyncio.sleep(0.05)
+        return {"key": key, "values": [1]}
+
+    async def main():
+        return await asyncio.gather(*(fetch("k") for _ in range(10)), fetch("other"))
+
+    results = asyncio.run(main())
+    assert sorted(calls) == ["k", "other"]
+    assert all(r == {"key": "k", "values": [1]} for r in results[:10])
+    results[1]["values"].append(2)
+    assert results[2]["values"] == [1]
+
+
+def test_async_exception_reaches_every_caller():
+    calls = []
+
+    @singleflight.singleflight_async("test_async_error")
+    async def fetch(key):
+        calls.append(key)
+        await asyncio.sleep(0.05)
+        raise RuntimeError("ACS batch failed")
+
+    async def main():
+        return await asyncio.gather(*(fetch("k") for _ in range(5)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert all(isinstance(r, RuntimeError) and str(r) == "ACS batch failed" for r in results)
+
+
+def test_async_cancelled_follower_does_not_cancel_the_leader():
+    calls = []
+
+    @singleflight.singleflight_async("test_async_cancel")
+    async def fetch(key):
+        calls.append(key)
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def main():
+        leader = asyncio.ensure_future(fetch("k"))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(fetch("k"))
+        await asyncio.sleep(0.01)
+        follower.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await follower
+        return await leader
+
+    assert asyncio.run(main()) == "done"
+    assert len(calls) == 1
@@ -1,6 +1,22 @@
 
-import plotly.express as px
-import pandas as pd
+import re
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+import cache_codec
+import cache_store
+
+CACHE_DIR = "analysis_cache"
+
+# In-process chart cache (Streamlit reruns + email path share it).
+# key -> {"figures": {name: fig_json}, "images": {(w, h): {name: png_bytes}}}
+_CHART_CACHE = OrderedDict()
+_CHART_CACHE_MAX = 64
+_CHART_CACHE_LOCK = threading.Lock()
 
 def generate_rent_table(rent_data):
     """
@@ -79,14 +95,163 @@ def generate_rent_table(rent_data):
     """
     return full_table
 
+# Bar colors for the extra benchmark scopes (darker = closer to the property)
+SCOPE_COLORS = {"tract": "#5F6368", "county": "#80868B", "metro": "#BDC1C6"}
+
+def short_scope_label(name):
+    """
+    Shorten Census NAME strings for chart legends.
+    e.g. 'Census Tract 176.01; San Francisco County; California' -> 'Census Tract 176.01'
+    """
+    return re.split(r"[;,]", str(name))[0].strip()
+
+def chart_cache_key(census_data, address_input=""):
+    """
+    Hash of everything that affects the charts: census metrics + benchmarks.
+    The address only matters when there is no state_name to label the State bar.
+    """
+    bench = census_data.get("benchmarks", {}) or {}
+    payload = {
+        "metrics": census_data.get("metrics", {}),
+        "benchmarks": bench,
+        "address": "" if bench.get("state_name") else address_input,
+    }
+    raw = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.md5(raw).hexdigest()
+
+def _cache_entry(key):
+    """
+    Get (or create) the LRU entry for a key. Caller must hold _CHART_CACHE_LOCK.
+    """
+    entry = _CHART_CACHE.get(key)
+    if entry is None:
+        entry = {"figures": None, "images": {}}
+        _CHART_CACHE[key] = entry
+        while len(_CHART_CACHE) > _CHART_CACHE_MAX:
+            _CHART_CACHE.popitem(last=False)
+    else:
+        _CHART_CACHE.move_to_end(key)
+    return entry
+
 def generate_census_charts(census_data, address_input=""):
     """
     Generates Plotly figures for Income, Age, Race, and Education.
     Returns a dictionary of figures.
+    Figures are memoized as JSON by chart_cache_key, so reruns for the same
+    data skip the DataFrame/px.bar work and just rehydrate the figures.
     """
     if not census_data or "metrics" not in census_data:
         return {}
 
+    import plotly.io as pio
+
+    key = chart_cache_key(census_data, address_input)
+    with _CHART_CACHE_LOCK:
+        cached = _cache_entry(key)["figures"]
+
+    if cached is None:
+        figs = _build_census_charts(census_data, address_input)
+        cached = {name: fig.to_json() for name, fig in figs.items()}
+        with _CHART_CACHE_LOCK:
+            _cache_entry(key)["figures"] = cached
+        return figs
+
+    # Fresh objects every time so callers can't mutate the cached copy
+    return {name: pio.from_json(fig_json) for name, fig_json in cached.items()}
+
+def _export_pngs(figs, width, height):
+    """
+    Render figures to PNG bytes in one batch.
+    plotly>=6.1 (kaleido v1) exposes write_images, which renders the whole list in a
+    single browser session. Older kaleido keeps one persistent process, so the
+    fallback loop is still single-process.
+    """
+    import plotly.io as pio
+
+    names = list(figs.keys())
+    if hasattr(pio, "write_images"):
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = [os.path.join(tmp, f"{name}.png") for name in names]
+            pio.write_images([figs[n] for n in names], paths, format="png", width=width, height=height)
+            result = {}
+            for name, path in zip(names, paths):
+                with open(path, "rb") as f:
+                    result[name] = f.read()
+            return result
+
+    return {name: figs[name].to_image(format="png", width=width, height=height) for name in names}
+
+def _image_cache_file(key, width, height):
+    return cache_codec.cache_file(CACHE_DIR, f"chart_{key}_{width}x{height}")
+
+def get_chart_images(census_data, address_input="", width=600, height=300, renderer="kaleido"):
+    """
+    Image bytes for the four census charts (for email).
+    renderer="kaleido": PNG via Plotly. Checked in order: in-process cache -> disk
+                        cache -> batched kaleido export. Falls back to SVG if
+                        plotly or kaleido is missing or the export fails
+                        (email_utils rasterizes SVG for mail clients).
+    renderer="svg":     SVG via svg_charts (no browser process). Mail clients
+                        need PNG, so without cairosvg this uses the kaleido
+                        path instead.
+    Returns {} if there is nothing to render.
+    """
+    if not census_data or "metrics" not in census_data:
+        return {}
+
+    key = chart_cache_key(census_data, address_input)
+
+    if renderer == "svg":
+        if svg_rasterizer_available():
+            return _get_svg_images(key, census_data, address_input, width, height)
+        print("SVG charts need cairosvg for email, using the kaleido renderer")
+
+    with _CHART_CACHE_LOCK:
+        images = _cache_entry(key)["images"].get((width, height))
+    if images:
+        return images
+
+    filename = _image_cache_file(key, width, height)
+    images = cache_store.read(filename)
+
+    if not images:
+        try:
+            figs = generate_census_charts(census_data, address_input=address_input)
+            if not figs:
+                return {}
+            images = _export_pngs(figs, width, height)
+        except Exception as e:  # plotly / pandas / kaleido missing, or the browser didn't start
+            print(f"Chart PNG Export Failed, using SVG renderer: {e}")
+            return _get_svg_images(key, census_data, address_input, width, height)
+        try:
+            cache_store.write(filename, images)
+        except Exception as e:
+            print(f"Chart Image Cache Save Error: {e}")
+
+    with _CHART_CACHE_LOCK:
+        _cache_entry(key)["images"][(width, height)] = images
+    return images
+
+# Chart styling shared by the Plotly charts and svg_charts (email renderer)
+LOCAL_COLORS = {"income": "#1A73E8", "age": "#34A853", "race": "#FBBC04", "education": "#EA4335"}
+STATE_COLOR = "#9AA0A6"
+NATIONAL_COLOR = "#DADCE0"
+
+# Explicit Category Orders to prevent alphabetical sorting (income is one bar per scope)
+CATEGORY_ORDERS = {
+    "age": ["<18", "18-24", "25-44", "45-64", "65+"],
+    "race": ["White", "Hispanic", "Black", "Asian", "Other"],
+    "education": ["HighSchool", "Bachelor", "Adv-Degree"],
+}
+CATEGORY_AXIS = {"income": "Scope", "age": "Range", "race": "Group", "education": "Level"}
+
+def build_chart_series(census_data, address_input=""):
+    """
+    Plain-Python chart data (no pandas/plotly) shared by every renderer.
+    Returns {"scopes": [...], "colors": {chart: {scope: hex}}, "charts": {chart: spec}}
+    where spec has title, categories (None for income), values {scope: [..]},
+    y_label and text_format.
+    """
     c_data = census_data["metrics"]
     bench = census_data.get("benchmarks", {})
     
@@ -101,107 +266,125 @@ def generate_census_charts(census_data, address_input=""):
             except: return 0.0
         return 0.0
 
-    # INCOME - Median Comparison
-    # Local
-    med_inc_local = safe_parse(c_data.get("median_income", 0))
-    # Benchmarks (State/National Median)
-    med_inc_state = float(bench.get("state_income", 0) or 0)
-    med_inc_national = float(bench.get("us_income", 0) or 0)
+    def pad(vals, n):
+        vals = list(vals or [])
+        return [float(x or 0) for x in (vals + [0] * n)[:n]]
 
-    inc_title = "Household Income"
-    
     # State Label Logic
     state_label = "State"
     if bench and "state_name" in bench:
          state_label = bench["state_name"]
     else:
-        import re
         match = re.search(r'\b([A-Z]{2})\b\s+\d{5}', address_input)
         if match:
              state_label = f"{match.group(1)} State"
 
-    df_income = pd.DataFrame({
-        "Scope": ["Local", state_label, "National"],
-        "Value": [med_inc_local, med_inc_state, med_inc_national]
-    })
+    # Extra comparison scopes (Tract / County / Metro) from benchmark_engine
+    # (skip a scope whose label collides with another bar, e.g. DC county == DC state)
+    extra_scopes, extra_labels = [], []
+    for sc in bench.get("extra_scopes", []):
+        label = short_scope_label(bench.get(f"{sc}_name", ""))
+        if label and label not in extra_labels + ["Local", state_label, "National"]:
+            extra_scopes.append(sc)
+            extra_labels.append(label)
+    scope_labels = ["Local"] + extra_labels + [state_label, "National"]
 
-    # AGE
-    # Local
-    vp_u18 = safe_parse(c_data.get("age_under_18", 0))
-    vp_18_24 = safe_parse(c_data.get("age_18_24", 0))
-    vp_25_44 = safe_parse(c_data.get("age_25_44", 0))
-    vp_45_64 = safe_parse(c_data.get("age_45_64", 0))
-    vp_65_plus = safe_parse(c_data.get("age_65_plus", 0))
-    # Bench
-    s_age = bench.get("state_age_dist", [0,0,0,0,0])
-    u_age = bench.get("us_age_dist", [0,0,0,0,0])
+    def scope_values(local_vals, dist_key, state_vals, us_vals):
+        n = len(local_vals)
+        values = {"Local": [float(v) for v in local_vals]}
+        for sc, label in zip(extra_scopes, extra_labels):
+            values[label] = pad(bench.get(f"{sc}_{dist_key}"), n)
+        values[state_label] = pad(state_vals, n)
+        values["National"] = pad(us_vals, n)
+        return values
 
+    # INCOME - Median Comparison (Local / extra scopes / State / National)
+    income_values = {"Local": [safe_parse(c_data.get("median_income", 0))]}
+    for sc, label in zip(extra_scopes, extra_labels):
+        income_values[label] = [float(bench.get(f"{sc}_income") or 0)]
+    income_values[state_label] = [float(bench.get("state_income", 0) or 0)]
+    income_values["National"] = [float(bench.get("us_income", 0) or 0)]
+
+    # AGE
     # Fix: Extract value from dict for title using safe_parse
     med_age_val = safe_parse(c_data.get('median_age', 0))
-    age_title = f"Age (Median: {med_age_val})"
-
-    df_age = pd.DataFrame({
-        "Range": ["<18", "<18", "<18", "18-24", "18-24", "18-24", "25-44", "25-44", "25-44", 
-                  "45-64", "45-64", "45-64", "65+", "65+", "65+"],
-        "Scope": ["Local", state_label, "National"] * 5,
-        "Value": [
-            vp_u18, s_age[0], u_age[0],
-            vp_18_24, s_age[1], u_age[1],
-            vp_25_44, s_age[2], u_age[2],
-            vp_45_64, s_age[3], u_age[3],
-            vp_65_plus, s_age[4], u_age[4]
-        ]
-    })
+    age_values = scope_values(
+        [safe_parse(c_data.get(k, 0)) for k in ("age_under_18", "age_18_24", "age_25_44", "age_45_64", "age_65_plus")],
+        "age_dist", bench.get("state_age_dist", [0,0,0,0,0]), bench.get("us_age_dist", [0,0,0,0,0])
+    )
 
     # RACE
-    # Local
-    vp_white = safe_parse(c_data.get("race_white", 0))
-    vp_black = safe_parse(c_data.get("race_black", 0))
-    vp_asian = safe_parse(c_data.get("race_asian", 0))
-    vp_hisp = safe_parse(c_data.get("race_hispanic", 0))
-    vp_oth = safe_parse(c_data.get("race_other", 0))
-    # Bench
-    s_race = bench.get("state_race_dist", [0,0,0,0,0])
-    u_race = bench.get("us_race_dist", [0,0,0,0,0])
-
-    df_race = pd.DataFrame({
-        "Group": ["White", "White", "White", "Hispanic", "Hispanic", "Hispanic", "Black", "Black", "Black", "Asian", "Asian", "Asian", "Other", "Other", "Other"],
-        "Scope": ["Local", state_label, "National"] * 5,
-        "Value": [
-            vp_white, s_race[0], u_race[0],
-            vp_hisp, s_race[1], u_race[1],
-            vp_black, s_race[2], u_race[2],
-            vp_asian, s_race[3], u_race[3],
-            vp_oth, s_race[4], u_race[4]
-        ]
-    })
+    race_values = scope_values(
+        [safe_parse(c_data.get(k, 0)) for k in ("race_white", "race_hispanic", "race_black", "race_asian", "race_other")],
+        "race_dist", bench.get("state_race_dist", [0,0,0,0,0]), bench.get("us_race_dist", [0,0,0,0,0])
+    )
 
     # EDUCATION
-    # Local
-    vp_hs = safe_parse(c_data.get("edu_high_school", 0))
-    vp_bach = safe_parse(c_data.get("edu_bachelor", 0))
-    vp_grad = safe_parse(c_data.get("edu_graduate", 0))
-    # Bench
-    s_hs = bench.get("state_edu_dist", [0.0, 0.0])[0] if len(bench.get("state_edu_dist", [])) > 0 else 0
-    s_bach = 0 # Not strictly mapped in original app, simplifying
-    s_adv = 0 
-    # Actually original app had hardcoded or partial mapping. Let's try to do best effort matching
-    # Original: s_hs, s_bach, s_adv = bench.get("state_edu_dist", [0,0,0]) ... wait the original code used s_hs, s_bach, s_adv from `s_edu`
-    s_edu = bench.get("state_edu_dist", [0,0,0])
-    u_edu = bench.get("us_edu_dist", [0,0,0])
-    
-    s_hs, s_bach, s_adv = (s_edu + [0]*(3-len(s_edu)))[:3]
-    u_hs, u_bach, u_adv = (u_edu + [0]*(3-len(u_edu)))[:3]
-
-    df_edu = pd.DataFrame({
-        "Level": ["HighSchool", "HighSchool", "HighSchool", "Bachelor", "Bachelor", "Bachelor", "Adv-Degree", "Adv-Degree", "Adv-Degree"],
-        "Scope": ["Local", state_label, "National"] * 3,
-        "Value": [
-            vp_hs, s_hs, u_hs, 
-            vp_bach, s_bach, u_bach, 
-            vp_grad, s_adv, u_adv
-        ]
-    })
+    edu_values = scope_values(
+        [safe_parse(c_data.get(k, 0)) for k in ("edu_high_school", "edu_bachelor", "edu_graduate")],
+        "edu_dist", bench.get("state_edu_dist", [0,0,0]), bench.get("us_edu_dist", [0,0,0])
+    )
+
+    # Colors
+    bench_colors = {state_label: STATE_COLOR, "National": NATIONAL_COLOR}
+    for sc, label in zip(extra_scopes, extra_labels):
+        bench_colors[label] = SCOPE_COLORS.get(sc, "#BDC1C6")
+
+    charts = {
+        "income": {"title": "Household Income", "categories": None, "values": income_values,
+                   "y_label": "USD ($)", "text_format": ",.0f"},
+        "age": {"title": f"Age (Median: {med_age_val})", "categories": CATEGORY_ORDERS["age"], "values": age_values,
+                "y_label": "%", "text_format": ".1f"},
+        "race": {"title": "Race", "categories": CATEGORY_ORDERS["race"], "values": race_values,
+                 "y_label": "%", "text_format": ".1f"},
+        "education": {"title": "Education", "categories": CATEGORY_ORDERS["education"], "values": edu_values,
+                      "y_label": "%", "text_format": ".1f"},
+    }
+
+    return {
+        "scopes": scope_labels,
+        "colors": {name: {"Local": LOCAL_COLORS[name], **bench_colors} for name in charts},
+        "charts": charts,
+    }
+
+_SVG_RASTERIZER = None
+
+def svg_rasterizer_available():
+    """
+    True if cairosvg (and the cairo library under it) loads, i.e. email_utils
+    can turn svg_charts output into PNG.
+    """
+    global _SVG_RASTERIZER
+    if _SVG_RASTERIZER is None:
+        try:
+            import cairosvg
+            _SVG_RASTERIZER = True
+        except (ImportError, OSError):  # OSError: libcairo missing
+            _SVG_RASTERIZER = False
+    return _SVG_RASTERIZER
+
+def _get_svg_images(key, census_data, address_input, width, height):
+    import svg_charts
+
+    with _CHART_CACHE_LOCK:
+        images = _cache_entry(key)["images"].get((width, height, "svg"))
+    if not images:
+        images = svg_charts.render_census_svgs(census_data, address_input, width, height)
+        with _CHART_CACHE_LOCK:
+            _cache_entry(key)["images"][(width, height, "svg")] = images
+    return images
+
+def _build_census_charts(census_data, address_input=""):
+    """
+    Builds the four Plotly figures (uncached). Use generate_census_charts.
+    """
+
+    # Lazy: pandas/plotly are only needed once there is something to draw
+    import plotly.express as px
+    import pandas as pd
+
+    series = build_chart_series(census_data, address_input)
+    scopes = series["scopes"]
 
     # Layout Helper
     def update_chart_layout(fig):
@@ -214,55 +397,35 @@ def generate_census_charts(census_data, address_input=""):
         )
         return fig
 
-    # Colors
-    color_map = {"Local": "#1A73E8", state_label: "#9AA0A6", "National": "#DADCE0"}
-    color_map_age = {"Local": "#34A853", state_label: "#9AA0A6", "National": "#DADCE0"}
-    color_map_race = {"Local": "#FBBC04", state_label: "#9AA0A6", "National": "#DADCE0"}
-    color_map_edu = {"Local": "#EA4335", state_label: "#9AA0A6", "National": "#DADCE0"}
-
-    # Generate Figures
-    # Explicit Category Orders to prevent alphabetical sorting
-    # order_inc not needed for plain bar
-    order_age = ["<18", "18-24", "25-44", "45-64", "65+"]
-    order_race = ["White", "Hispanic", "Black", "Asian", "Other"]
-    order_edu = ["HighSchool", "Bachelor", "Adv-Degree"]
-
-    fig_inc = px.bar(
-        df_income, x="Scope", y="Value", color="Scope", 
-        title=inc_title, height=250, text_auto=',.0f', # Full number format
-        color_discrete_map=color_map, labels={"Value": "USD ($)"}
-    )
-    # Hide legend for simple bar if redundancy
-    fig_inc.update_layout(showlegend=False)
-    update_chart_layout(fig_inc)
-
-    fig_age = px.bar(
-        df_age, x="Range", y="Value", color="Scope", barmode="group", 
-        title=age_title, height=250, text_auto='.1f',
-        color_discrete_map=color_map_age, labels={"Value": "%"},
-        category_orders={"Range": order_age}
-    )
-    update_chart_layout(fig_age)
+    figs = {}
+    for name, chart in series["charts"].items():
+        values = chart["values"]
+        cats = chart["categories"]
 
-    fig_race = px.bar(
-        df_race, x="Group", y="Value", color="Scope", barmode="group", 
-        title="Race", height=250, text_auto='.1f',
-        color_discrete_map=color_map_race, labels={"Value": "%"},
-        category_orders={"Group": order_race}
-    )
-    update_chart_layout(fig_race)
+        if cats is None:
+            df = pd.DataFrame({"Scope": scopes, "Value": [values[sc][0] for sc in scopes]})
+            fig = px.bar(
+                df, x="Scope", y="Value", color="Scope",
+                title=chart["title"], height=250, text_auto=chart["text_format"], # Full number format
+                color_discrete_map=series["colors"][name], labels={"Value": chart["y_label"]}
+            )
+            # Hide legend for simple bar if redundancy
+            fig.update_layout(showlegend=False)
+        else:
+            cat_col = CATEGORY_AXIS[name]
+            df = pd.DataFrame({
+                cat_col: [c for c in cats for _ in scopes],
+                "Scope": scopes * len(cats),
+                "Value": [values[sc][i] for i in range(len(cats)) for sc in scopes]
+            })
+            fig = px.bar(
+                df, x=cat_col, y="Value", color="Scope", barmode="group",
+                title=chart["title"], height=250, text_auto=chart["text_format"],
+                color_discrete_map=series["colors"][name], labels={"Value": chart["y_label"]},
+                category_orders={cat_col: cats}
+            )
 
-    fig_edu = px.bar(
-        df_edu, x="Level", y="Value", color="Scope", barmode="group", 
-        title="Education", height=250, text_auto='.1f',
-        color_discrete_map=color_map_edu, labels={"Value": "%"},
-        category_orders={"Level": order_edu}
-    )
-    update_chart_layout(fig_edu)
+        update_chart_layout(fig)
+        figs[name] = fig
 
-    return {
-        "income": fig_inc,
-        "age": fig_age,
-        "race": fig_race,
-        "education": fig_edu
-    }
+    return figs